@@ -1,6 +1,8 @@
 from aws_cdk import (
     aws_s3 as s3,
+    aws_s3_notifications as s3n,
     aws_lambda as lambda_,
+    aws_lambda_event_sources as lambda_event_sources,
     aws_apigateway as apigw,
     aws_dynamodb as dynamodb,
     aws_sns as sns,
@@ -11,6 +13,7 @@ from aws_cdk import (
     aws_events as events,
     aws_events_targets as targets,
     Stack,
+    BundlingOptions,
     RemovalPolicy,
     CfnOutput,
     Duration
@@ -113,7 +116,34 @@ class ModerationSystemStack(Stack):
         uploads_bucket.add_cors_rule(
             allowed_methods=[s3.HttpMethods.PUT, s3.HttpMethods.POST],
             allowed_origins=["*"],
-            allowed_headers=["*"]
+            allowed_headers=["*"],
+            exposed_headers=["ETag"]  # Multipart parts are completed with their ETags
+        )
+
+        # Multipart uploads the browser never completed
+        uploads_bucket.add_lifecycle_rule(
+            abort_incomplete_multipart_upload_after=Duration.days(1)
+        )
+
+        # Review thumbnails outlive no review item (review TTL is 30 days)
+        uploads_bucket.add_lifecycle_rule(
+            prefix="thumbs/",
+            expiration=Duration.days(30)
+        )
+
+        # Analytics checkpoints (traffic sketches)
+        analytics_bucket = s3.Bucket(
+            self, "AnalyticsBucket",
+            bucket_name=f"amit-moderation-analytics",
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            encryption=s3.BucketEncryption.S3_MANAGED,
+            removal_policy=RemovalPolicy.RETAIN
+        )
+
+        # Near-duplicate batches and hourly segments; text_moderator reads the last 24 hours
+        analytics_bucket.add_lifecycle_rule(
+            prefix="near_dup/",
+            expiration=Duration.days(2)
         )
 
         # ============================================================================
@@ -162,6 +192,71 @@ class ModerationSystemStack(Stack):
             time_to_live_attribute='ttl'
         )
 
+        # Shared token buckets for Comprehend/Rekognition call rates,
+        # and per-client submission windows
+        rate_limit_table = dynamodb.Table(
+            self, "RateLimitTable",
+            table_name="amit-moderation-rate-limits",
+            partition_key=dynamodb.Attribute(
+                name="limiter_id",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute='ttl'  # Per-client sliding window items
+        )
+
+        # Shared circuit breaker state for the moderation services
+        circuit_breaker_table = dynamodb.Table(
+            self, "CircuitBreakerTable",
+            table_name="amit-moderation-circuit-breakers",
+            partition_key=dynamodb.Attribute(
+                name="breaker_id",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        # Small counters (review queue version, ...)
+        counters_table = dynamodb.Table(
+            self, "CountersTable",
+            table_name="amit-moderation-counters",
+            partition_key=dynamodb.Attribute(
+                name="counter_id",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.RETAIN,
+            time_to_live_attribute='ttl'
+        )
+
+        # Moderation statistics, maintained from the three tables' streams
+        stats_table = dynamodb.Table(
+            self, "StatsTable",
+            table_name="amit-moderation-stats",
+            partition_key=dynamodb.Attribute(
+                name="stat_id",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.RETAIN,
+            time_to_live_attribute='ttl'
+        )
+
+        # Recent submissions by content hash, for dedupe at submit time
+        dedupe_table = dynamodb.Table(
+            self, "DedupeTable",
+            table_name="amit-moderation-dedupe",
+            partition_key=dynamodb.Attribute(
+                name="content_hash",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,
+            time_to_live_attribute='ttl'
+        )
+
         # GSI for listing pending reviews by status
         review_table.add_global_secondary_index(
             index_name="status-index",
@@ -209,11 +304,17 @@ class ModerationSystemStack(Stack):
         uploads_bucket.grant_read_write(lambda_role)
         frontend_bucket.grant_read(lambda_role)
         admin_bucket.grant_read(lambda_role)
+        analytics_bucket.grant_read_write(lambda_role)
 
         # DynamoDB permissions
         approved_table.grant_read_write_data(lambda_role)
         review_table.grant_read_write_data(lambda_role)
         rejected_table.grant_read_write_data(lambda_role)
+        rate_limit_table.grant_read_write_data(lambda_role)
+        circuit_breaker_table.grant_read_write_data(lambda_role)
+        counters_table.grant_read_write_data(lambda_role)
+        stats_table.grant_read_write_data(lambda_role)
+        dedupe_table.grant_read_write_data(lambda_role)
 
         # SNS permissions
         admin_notification_topic.grant_publish(lambda_role)
@@ -245,18 +346,47 @@ class ModerationSystemStack(Stack):
         # PART 5: LAMBDA FUNCTIONS
         # ============================================================================
         
-        # Text Moderator
+        # How long a claimed review item stays with its reviewer
+        review_lease_seconds = "600"
+
+        # Shared modules (instrumentation etc.) importable from every handler
+        common_layer = lambda_.LayerVersion(
+            self, "CommonLayer",
+            layer_version_name="amit-moderation-common",
+            code=lambda_.Code.from_asset("../lambda/common"),
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_11]
+        )
+
+        # Functions with third-party packages get their requirements.txt installed into the asset
+        requirements_bundling = BundlingOptions(
+            image=lambda_.Runtime.PYTHON_3_11.bundling_image,
+            command=[
+                "bash", "-c",
+                "pip install -r requirements.txt -t /asset-output && cp -au . /asset-output"
+            ]
+        )
+
+        # Text Moderator (NumPy for the local fallback scorer)
         text_moderator = lambda_.Function(
             self, "TextModerator",
             function_name="amit-moderation-text-moderator",
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="index.lambda_handler",
-            code=lambda_.Code.from_asset("../lambda/text_moderator"),
+            code=lambda_.Code.from_asset("../lambda/text_moderator", bundling=requirements_bundling),
             timeout=Duration.seconds(30),
-            role=lambda_role
+            memory_size=512,  # numpy and up to 24 x 100k near-duplicate signatures
+            environment={
+                "RATE_LIMIT_TABLE": rate_limit_table.table_name,
+                "CIRCUIT_BREAKER_TABLE": circuit_breaker_table.table_name,
+                "LOCAL_PREFILTER": "false",
+                "ANALYTICS_BUCKET": analytics_bucket.bucket_name,
+                "NEAR_DUP_MODE": "reuse"
+            },
+            role=lambda_role,
+            layers=[common_layer]
         )
 
-        # Image Moderator
+        # Image Moderator (known-bad list: built by tools/build_known_bad.py into the analytics bucket)
         image_moderator = lambda_.Function(
             self, "ImageModerator",
             function_name="amit-moderation-image-moderator",
@@ -265,9 +395,13 @@ class ModerationSystemStack(Stack):
             code=lambda_.Code.from_asset("../lambda/image_moderator"),
             timeout=Duration.seconds(30),
             environment={
-                "UPLOADS_BUCKET": uploads_bucket.bucket_name
+                "UPLOADS_BUCKET": uploads_bucket.bucket_name,
+                "RATE_LIMIT_TABLE": rate_limit_table.table_name,
+                "CIRCUIT_BREAKER_TABLE": circuit_breaker_table.table_name,
+                "KNOWN_BAD_BUCKET": analytics_bucket.bucket_name
             },
-            role=lambda_role
+            role=lambda_role,
+            layers=[common_layer]
         )
 
         # Decision Handler
@@ -282,9 +416,12 @@ class ModerationSystemStack(Stack):
                 "APPROVED_TABLE": approved_table.table_name,
                 "REVIEW_TABLE": review_table.table_name,
                 "REJECTED_TABLE": rejected_table.table_name,
-                "ADMIN_NOTIFICATION_TOPIC": admin_notification_topic.topic_arn
+                "COUNTERS_TABLE": counters_table.table_name,
+                "DEDUPE_TABLE": dedupe_table.table_name,
+                "NOTIFICATION_MODE": "digest"  # review_digest emails a summary instead
             },
-            role=lambda_role
+            role=lambda_role,
+            layers=[common_layer]
         )
 
         # Submit Handler
@@ -297,9 +434,36 @@ class ModerationSystemStack(Stack):
             timeout=Duration.seconds(30),
             environment={
                 "STATE_MACHINE_ARN": "WILL_BE_SET_AFTER",  # Set after state machine creation
-                "UPLOADS_BUCKET": uploads_bucket.bucket_name
+                "UPLOADS_BUCKET": uploads_bucket.bucket_name,
+                "RATE_LIMIT_TABLE": rate_limit_table.table_name,
+                "DEDUPE_TABLE": dedupe_table.table_name,
+                "DEDUPE_WINDOW_SECONDS": "86400"
+            },
+            role=lambda_role,
+            layers=[common_layer]
+        )
+
+        # Upload Trigger (starts moderation for presigned POST uploads)
+        upload_trigger = lambda_.Function(
+            self, "UploadTrigger",
+            function_name="amit-moderation-upload-trigger",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.lambda_handler",
+            code=lambda_.Code.from_asset("../lambda/upload_trigger"),
+            timeout=Duration.seconds(30),
+            environment={
+                "STATE_MACHINE_ARN": "WILL_BE_SET_AFTER",  # Set after state machine creation
+                "DEDUPE_TABLE": dedupe_table.table_name,
+                "DEDUPE_WINDOW_SECONDS": "86400"
             },
-            role=lambda_role
+            role=lambda_role,
+            layers=[common_layer]
+        )
+
+        uploads_bucket.add_event_notification(
+            s3.EventType.OBJECT_CREATED,
+            s3n.LambdaDestination(upload_trigger),
+            s3.NotificationKeyFilter(prefix="uploads/")
         )
 
         # Get Status Handler
@@ -313,9 +477,11 @@ class ModerationSystemStack(Stack):
             environment={
                 "APPROVED_TABLE": approved_table.table_name,
                 "REJECTED_TABLE": rejected_table.table_name,
-                "REVIEW_TABLE": review_table.table_name
+                "REVIEW_TABLE": review_table.table_name,
+                "DEDUPE_TABLE": dedupe_table.table_name
             },
-            role=lambda_role
+            role=lambda_role,
+            layers=[common_layer]
         )
 
         # Admin List Handler
@@ -328,9 +494,12 @@ class ModerationSystemStack(Stack):
             timeout=Duration.seconds(10),
             environment={
                 "REVIEW_TABLE": review_table.table_name,
-                "UPLOADS_BUCKET": uploads_bucket.bucket_name
+                "COUNTERS_TABLE": counters_table.table_name,
+                "UPLOADS_BUCKET": uploads_bucket.bucket_name,
+                "REVIEW_LEASE_SECONDS": review_lease_seconds
             },
-            role=lambda_role
+            role=lambda_role,
+            layers=[common_layer]
         )
 
         # Admin Decision Handler
@@ -344,9 +513,30 @@ class ModerationSystemStack(Stack):
             environment={
                 "REVIEW_TABLE": review_table.table_name,
                 "REJECTED_TABLE": rejected_table.table_name,
-                "APPROVED_TABLE": approved_table.table_name
+                "APPROVED_TABLE": approved_table.table_name,
+                "COUNTERS_TABLE": counters_table.table_name,
+                "DEDUPE_TABLE": dedupe_table.table_name,
+                "REVIEW_LEASE_SECONDS": review_lease_seconds
+            },
+            role=lambda_role,
+            layers=[common_layer]
+        )
+
+        # Admin Claim Handler (leases review items to one reviewer)
+        admin_claim_handler = lambda_.Function(
+            self, "AdminClaimHandler",
+            function_name="amit-moderation-adminClaim-handler",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.lambda_handler",
+            code=lambda_.Code.from_asset("../lambda/admin_claim"),
+            timeout=Duration.seconds(10),
+            environment={
+                "REVIEW_TABLE": review_table.table_name,
+                "COUNTERS_TABLE": counters_table.table_name,
+                "REVIEW_LEASE_SECONDS": review_lease_seconds
             },
-            role=lambda_role
+            role=lambda_role,
+            layers=[common_layer]
         )
 
         # Incident handler lamba
@@ -356,9 +546,144 @@ class ModerationSystemStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="index.lambda_handler",
             code=lambda_.Code.from_asset("../lambda/incident_handler"),
-            role=lambda_role
+            role=lambda_role,
+            layers=[common_layer]
+        )
+
+        # Stats Aggregator (stream consumer)
+        stats_aggregator = lambda_.Function(
+            self, "StatsAggregator",
+            function_name="amit-moderation-stats-aggregator",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.lambda_handler",
+            code=lambda_.Code.from_asset("../lambda/stats_aggregator"),
+            timeout=Duration.seconds(60),
+            environment={
+                "APPROVED_TABLE": approved_table.table_name,
+                "REVIEW_TABLE": review_table.table_name,
+                "REJECTED_TABLE": rejected_table.table_name,
+                "STATS_TABLE": stats_table.table_name,
+                "ANALYTICS_BUCKET": analytics_bucket.bucket_name
+            },
+            role=lambda_role,
+            layers=[common_layer]
+        )
+
+        for table in (approved_table, review_table, rejected_table):
+            stats_aggregator.add_event_source(lambda_event_sources.DynamoEventSource(
+                table,
+                starting_position=lambda_.StartingPosition.TRIM_HORIZON,
+                batch_size=50,
+                max_batching_window=Duration.seconds(5),
+                bisect_batch_on_error=True,
+                retry_attempts=10
+            ))
+
+        # Admin Stats Handler
+        admin_stats_handler = lambda_.Function(
+            self, "AdminStatsHandler",
+            function_name="amit-moderation-adminStats-handler",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.lambda_handler",
+            code=lambda_.Code.from_asset("../lambda/admin_stats"),
+            timeout=Duration.seconds(10),
+            environment={
+                "REVIEW_TABLE": review_table.table_name,
+                "STATS_TABLE": stats_table.table_name,
+                "ANALYTICS_BUCKET": analytics_bucket.bucket_name
+            },
+            role=lambda_role,
+            layers=[common_layer]
+        )
+
+        # Review Digest (one admin email per window, scheduled below)
+        review_digest = lambda_.Function(
+            self, "ReviewDigest",
+            function_name="amit-moderation-review-digest",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.lambda_handler",
+            code=lambda_.Code.from_asset("../lambda/review_digest"),
+            timeout=Duration.seconds(60),
+            environment={
+                "REVIEW_TABLE": review_table.table_name,
+                "COUNTERS_TABLE": counters_table.table_name,
+                "ADMIN_NOTIFICATION_TOPIC": admin_notification_topic.topic_arn,
+                "DIGEST_WINDOW_MINUTES": "15"
+            },
+            role=lambda_role,
+            layers=[common_layer]
+        )
+
+        # Upload Reaper (deletes orphaned and rejected images, scheduled below)
+        upload_reaper = lambda_.Function(
+            self, "UploadReaper",
+            function_name="amit-moderation-upload-reaper",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.lambda_handler",
+            code=lambda_.Code.from_asset("../lambda/upload_reaper"),
+            timeout=Duration.minutes(15),
+            memory_size=512,
+            environment={
+                "UPLOADS_BUCKET": uploads_bucket.bucket_name,
+                "APPROVED_TABLE": approved_table.table_name,
+                "REVIEW_TABLE": review_table.table_name,
+                "REJECTED_TABLE": rejected_table.table_name,
+                "REAP_AFTER_SECONDS": str(24 * 3600)
+            },
+            role=lambda_role,
+            layers=[common_layer]
+        )
+
+        # Thumbnailer (review thumbnails, needs Pillow bundled)
+        thumbnailer = lambda_.Function(
+            self, "Thumbnailer",
+            function_name="amit-moderation-thumbnailer",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.lambda_handler",
+            code=lambda_.Code.from_asset("../lambda/thumbnailer", bundling=requirements_bundling),
+            timeout=Duration.seconds(30),
+            memory_size=1024,
+            environment={
+                "UPLOADS_BUCKET": uploads_bucket.bucket_name,
+                "REVIEW_TABLE": review_table.table_name,
+                "COUNTERS_TABLE": counters_table.table_name
+            },
+            role=lambda_role,
+            layers=[common_layer]
         )
 
+        # Outbox Worker (performs decision side effects from the table streams)
+        outbox_worker = lambda_.Function(
+            self, "OutboxWorker",
+            function_name="amit-moderation-outbox-worker",
+            runtime=lambda_.Runtime.PYTHON_3_11,
+            handler="index.lambda_handler",
+            code=lambda_.Code.from_asset("../lambda/outbox_worker"),
+            timeout=Duration.seconds(60),
+            environment={
+                "ADMIN_NOTIFICATION_TOPIC": admin_notification_topic.topic_arn,
+                "DEDUPE_TABLE": dedupe_table.table_name,
+                "COUNTERS_TABLE": counters_table.table_name,
+                "THUMBNAILER_FUNCTION": thumbnailer.function_name,
+                "ANALYTICS_BUCKET": analytics_bucket.bucket_name
+            },
+            role=lambda_role,
+            layers=[common_layer]
+        )
+        thumbnailer.grant_invoke(outbox_worker)
+
+        # Second (and last allowed) reader of each stream, after the stats aggregator
+        for table in (approved_table, review_table, rejected_table):
+            outbox_worker.add_event_source(lambda_event_sources.DynamoEventSource(
+                table,
+                starting_position=lambda_.StartingPosition.TRIM_HORIZON,
+                batch_size=100,
+                max_batching_window=Duration.seconds(1),
+                bisect_batch_on_error=True,
+                retry_attempts=10,
+                report_batch_item_failures=True
+            ))
+
         # ============================================================================
         # PART 6: STEP FUNCTIONS STATE MACHINE
         # ============================================================================
@@ -392,7 +717,8 @@ class ModerationSystemStack(Stack):
                 "moderation_results.$": "$.moderation_results",
                 "submission_id.$": "$.submission_id",
                 "text.$": "$.text",
-                "image_key.$": "$.image_key"
+                "image_key.$": "$.image_key",
+                "content_hash.$": "$.content_hash"
             }),
             output_path="$.Payload"
         )
@@ -409,6 +735,7 @@ class ModerationSystemStack(Stack):
 
         # Update submit handler with state machine ARN
         submit_handler.add_environment("STATE_MACHINE_ARN", state_machine.state_machine_arn)
+        upload_trigger.add_environment("STATE_MACHINE_ARN", state_machine.state_machine_arn)
 
         # ============================================================================
         # PART 7: API GATEWAY
@@ -420,7 +747,7 @@ class ModerationSystemStack(Stack):
             default_cors_preflight_options=apigw.CorsOptions(
                 allow_origins=apigw.Cors.ALL_ORIGINS,
                 allow_methods=apigw.Cors.ALL_METHODS,
-                allow_headers=["Content-Type"]
+                allow_headers=["Content-Type", "If-None-Match", "X-Reviewer"]
             )
         )
 
@@ -451,6 +778,13 @@ class ModerationSystemStack(Stack):
             apigw.LambdaIntegration(submit_handler)
         )
 
+        # POST /submit/complete (multipart uploads)
+        submit_complete_resource = submit_resource.add_resource("complete")
+        submit_complete_resource.add_method(
+            "POST",
+            apigw.LambdaIntegration(submit_handler)
+        )
+
         # GET /status/{submissionId}
         status_resource = api.root.add_resource("status")
         status_id_resource = status_resource.add_resource("{submissionId}")
@@ -459,6 +793,13 @@ class ModerationSystemStack(Stack):
             apigw.LambdaIntegration(get_status_handler)
         )
 
+        # POST /status/batch
+        status_batch_resource = status_resource.add_resource("batch")
+        status_batch_resource.add_method(
+            "POST",
+            apigw.LambdaIntegration(get_status_handler)
+        )
+
         # GET /admin/pending
         admin_resource = api.root.add_resource("admin")
         admin_pending_resource = admin_resource.add_resource("pending")
@@ -474,6 +815,20 @@ class ModerationSystemStack(Stack):
             apigw.LambdaIntegration(admin_decision_handler)
         )
 
+        # POST /admin/claim?n=K
+        admin_claim_resource = admin_resource.add_resource("claim")
+        admin_claim_resource.add_method(
+            "POST",
+            apigw.LambdaIntegration(admin_claim_handler)
+        )
+
+        # GET /admin/stats
+        admin_stats_resource = admin_resource.add_resource("stats")
+        admin_stats_resource.add_method(
+            "GET",
+            apigw.LambdaIntegration(admin_stats_handler)
+        )
+
         # ============================================================================
         # PART 9: EVENTBRIDGE
         # ============================================================================
@@ -492,6 +847,22 @@ class ModerationSystemStack(Stack):
 
         incident_rule.add_target(targets.LambdaFunction(incident_handler_lambda))
 
+        # EventBridge rule: Review queue digest
+        digest_rule = events.Rule(
+            self, "ReviewDigestSchedule",
+            schedule=events.Schedule.rate(Duration.minutes(15))
+        )
+
+        digest_rule.add_target(targets.LambdaFunction(review_digest))
+
+        # EventBridge rule: Reap orphaned and rejected uploads
+        reaper_rule = events.Rule(
+            self, "UploadReaperSchedule",
+            schedule=events.Schedule.rate(Duration.hours(6))
+        )
+
+        reaper_rule.add_target(targets.LambdaFunction(upload_reaper))
+
         # ============================================================================
         # PART 9: OUTPUTS
         # ============================================================================
@@ -0,0 +1,70 @@
+import json
+import os
+from instrumentation import Metrics
+from deadline import Deadline, is_timeout, resource
+import queue_version
+import review_leases
+
+metrics = Metrics('admin_claim')
+
+DEFAULT_CLAIM = 5
+
+def response(status_code, body, headers=None):
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': '*',
+            'Access-Control-Allow-Headers': '*',
+            **(headers or {})
+        },
+        'body': json.dumps(body)
+    }
+
+@metrics.handler
+def lambda_handler(event, context):
+    """
+    POST /admin/claim?n=K
+    Leases up to K pending items (default 5, at most 25) to the calling
+    reviewer for REVIEW_LEASE_SECONDS, oldest first. Items the reviewer
+    already holds are renewed and count towards K. A lease ends when the
+    item is decided or when it expires; GET /admin/pending?mine=true
+    lists the caller's items.
+    """
+    try:
+        reviewer = review_leases.reviewer_id(event)
+        if not reviewer:
+            return response(400, {'error': f"Missing {review_leases.REVIEWER_HEADER} header"})
+        try:
+            n = int((event.get('queryStringParameters') or {}).get('n', DEFAULT_CLAIM))
+        except ValueError:
+            return response(400, {'error': 'n must be a number'})
+        n = max(1, min(n, review_leases.MAX_CLAIM))
+
+        dynamodb = resource('dynamodb', Deadline(context))
+        review_table = dynamodb.Table(os.getenv('REVIEW_TABLE'))
+
+        with metrics.stage('claim'):
+            claimed, expires, conflicts = review_leases.claim(review_table, reviewer, n)
+        metrics.count('claim.claimed', len(claimed))
+        metrics.count('claim.conflicts', conflicts)
+
+        # Other reviewers' lists change: their cached ETags must not match
+        if claimed:
+            queue_version.bump(dynamodb)
+
+        return response(200, {
+            'reviewer': reviewer,
+            'claimed': claimed,
+            'count': len(claimed),
+            'lease_expires': expires,
+            'lease_seconds': review_leases.LEASE_SECONDS
+        })
+
+    except Exception as e:
+        if is_timeout(e):
+            # Leasing is idempotent for the same reviewer, so a retry is safe
+            print(f"Admin claim timed out: {str(e)}")
+            return response(503, {'error': 'Review queue is slow right now, please retry'}, {'Retry-After': '2'})
+        print(f"Admin claim error: {str(e)}")
+        return response(500, {'error': 'Internal server error'})
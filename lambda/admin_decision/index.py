@@ -1,10 +1,18 @@
 import json
-import boto3
 import os
 from datetime import datetime
+from instrumentation import Metrics
+from deadline import Deadline, client, is_timeout, resource
+import queue_version
+import dedupe
+import review_leases
 
-dynamodb = boto3.resource('dynamodb')
+metrics = Metrics('admin_decision')
 
+# Time needed for the read and both writes; with less, ask the client to retry
+MIN_DECISION_MS = 1500
+
+@metrics.handler
 def lambda_handler(event, context):
     """
     POST /admin/decision
@@ -39,6 +47,20 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'Decision must be APPROVE or REJECT'})
             }
         
+        deadline = Deadline(context)
+        if deadline.expired(MIN_DECISION_MS):
+            return {
+                'statusCode': 503,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Allow-Methods': '*',
+                    'Access-Control-Allow-Headers': '*',
+                    'Retry-After': '2'
+                },
+                'body': json.dumps({'error': 'Not enough time to save the decision, please retry'})
+            }
+        
+        dynamodb = resource('dynamodb', deadline)
         review_table = dynamodb.Table(os.getenv('REVIEW_TABLE'))
         approved_table = dynamodb.Table(os.getenv('APPROVED_TABLE'))
         rejected_table = dynamodb.Table(os.getenv('REJECTED_TABLE'))
@@ -58,6 +80,7 @@ def lambda_handler(event, context):
             }
         
         item = response['Item']
+        reviewer = review_leases.reviewer_id(event)
         timestamp = datetime.now().isoformat()
 
         if decision == 'APPROVE':
@@ -65,6 +88,32 @@ def lambda_handler(event, context):
         else:  # REJECT
             status = 'REJECTED'
         
+        # Resolve the review item first, ending any lease: the condition is
+        # what stops two reviewers (or a reviewer and a claimant) from both
+        # deciding it, so nothing is copied to the approved or rejected table
+        # unless it holds
+        if not review_leases.resolve(review_table, submission_id, reviewer or 'admin', status, timestamp):
+            current = review_table.get_item(Key={'submission_id': submission_id}, ConsistentRead=True).get('Item', {})
+            if current.get('status') != review_leases.PENDING:
+                metrics.count('already_decided')
+                conflict = {'error': 'Submission has already been decided', 'status': current.get('status')}
+            else:
+                metrics.count('lease.conflicts')
+                conflict = {
+                    'error': 'Submission is claimed by another reviewer',
+                    'lease_owner': current.get('lease_owner'),
+                    'lease_expires': int(current.get('lease_expires', 0))
+                }
+            return {
+                'statusCode': 409,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Allow-Methods': '*',
+                    'Access-Control-Allow-Headers': '*'
+                },
+                'body': json.dumps(conflict)
+            }
+        
         if decision == 'APPROVE':
             # Move to approved table
             approved_table.put_item(
@@ -74,7 +123,7 @@ def lambda_handler(event, context):
                     'text': item.get('text', ''),
                     'image_key': item.get('image_key', ''),
                     'approved_at': timestamp,
-                    'approved_by': 'admin',
+                    'approved_by': reviewer or 'admin',
                     'initially_ambiguous': True,
                     'ttl': int(datetime.now().timestamp()) + (86400 * 30 * 12)
                 }
@@ -85,22 +134,16 @@ def lambda_handler(event, context):
                     'submission_id': submission_id,
                     'status': status,
                     'rejected_at': timestamp,
-                    'rejected_by': 'admin',
+                    'rejected_by': reviewer or 'admin',
                     'initially_ambiguous': True,
                     'ttl': int(datetime.now().timestamp()) + (86400 * 7)
                 }
             )
+        queue_version.bump(dynamodb)
         
-        # Update review table with final decision and resolution time
-        review_table.update_item(
-            Key={'submission_id': submission_id},
-            UpdateExpression='SET #status = :status, resolved_at = :resolved_at',
-            ExpressionAttributeNames={'#status': 'status'},
-            ExpressionAttributeValues={
-                ':status': status,
-                ':resolved_at': timestamp
-            }
-        )
+        # Resubmissions of the same content now get the admin's decision
+        if item.get('content_hash') and dedupe.enabled():
+            dedupe.record_decision(client('dynamodb', deadline), item['content_hash'], submission_id, status)
         
         return {
             'statusCode': 200,
@@ -117,6 +160,20 @@ def lambda_handler(event, context):
         }
     
     except Exception as e:
+        if is_timeout(e):
+            # The same reviewer may resolve an item again with the same decision
+            # and the table write is a put, so retrying the whole request is safe
+            print(f"Admin decision timed out: {str(e)}")
+            return {
+                'statusCode': 503,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Allow-Methods': '*',
+                    'Access-Control-Allow-Headers': '*',
+                    'Retry-After': '2'
+                },
+                'body': json.dumps({'error': 'Saving the decision timed out, please retry'})
+            }
         print(f"Admin decision error: {str(e)}")
         return {
             'statusCode': 500,
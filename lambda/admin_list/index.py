@@ -1,13 +1,42 @@
+import hashlib
 import json
 import boto3
 import os
+import time
 from decimal import Decimal
+from instrumentation import Metrics
+from deadline import Deadline, is_timeout, resource
+import queue_version
+import review_leases
+import upload_keys
 
-dynamodb = boto3.resource('dynamodb')
+metrics = Metrics('admin_list')
+
+# Presigning is local; this client only makes requests to resolve legacy
+# upload keys that may have been migrated (see upload_keys.resolve)
 s3 = boto3.client('s3')
 
 UPLOADS_BUCKET = os.getenv('UPLOADS_BUCKET')
 
+# Presigned URLs last an hour; rolling the ETag every 30 minutes means a
+# revalidated list never holds URLs that are about to expire
+ETAG_WINDOW_SECONDS = 1800
+
+def request_header(event, name):
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+def queue_etag(version, reviewer=None):
+    # Leases lapse without a write to the queue, so the ETag also rolls
+    # over at least once per lease
+    window = int(time.time() // min(ETAG_WINDOW_SECONDS, review_leases.LEASE_SECONDS))
+    if reviewer is None:
+        return f'"q{version}-{window}"'
+    scope = hashlib.sha1(reviewer.encode('utf-8')).hexdigest()[:8]
+    return f'"q{version}-{scope}-{window}"'
+
 def generate_presigned_url(image_key):
     """
     Generate a temporary pre-signed URL for the given S3 object
@@ -17,7 +46,7 @@ def generate_presigned_url(image_key):
     try:
         url = s3.generate_presigned_url(
             'get_object',
-            Params={'Bucket': UPLOADS_BUCKET, 'Key': image_key},
+            Params={'Bucket': UPLOADS_BUCKET, 'Key': upload_keys.resolve(s3, UPLOADS_BUCKET, image_key)},
             ExpiresIn=3600  # 1 hour expiry
         )
         return url
@@ -25,14 +54,50 @@ def generate_presigned_url(image_key):
         print(f"Error generating presigned URL for {image_key}: {str(e)}")
         return None
 
+@metrics.handler
 def lambda_handler(event, context):
     """
-    GET /admin/pending
-    Lists all content awaiting admin review, returning pre-signed image URLs
+    GET /admin/pending[?mine=true]
+    Lists all content awaiting admin review, returning pre-signed image URLs.
+    With mine=true, only the items leased to the calling reviewer
+    (POST /admin/claim); otherwise live leases are shown as lease_owner.
     """
     try:
+        mine = (event.get('queryStringParameters') or {}).get('mine') in ('true', '1')
+        reviewer = review_leases.reviewer_id(event)
+        if mine and not reviewer:
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Allow-Methods': '*',
+                    'Access-Control-Allow-Headers': '*'
+                },
+                'body': json.dumps({'error': f"Missing {review_leases.REVIEWER_HEADER} header"})
+            }
+        
+        dynamodb = resource('dynamodb', Deadline(context))
         review_table = dynamodb.Table(os.getenv('REVIEW_TABLE'))
         
+        # The queue version changes on every write to the queue, so a
+        # matching ETag means the list is unchanged: skip the query
+        version = queue_version.current(dynamodb)
+        etag = queue_etag(version, reviewer if mine else None) if version is not None else None
+        if etag and request_header(event, 'If-None-Match') == etag:
+            metrics.count('not_modified')
+            return {
+                'statusCode': 304,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Allow-Methods': '*',
+                    'Access-Control-Allow-Headers': '*',
+                    'Access-Control-Expose-Headers': 'ETag',
+                    'Cache-Control': 'no-cache',
+                    'ETag': etag
+                },
+                'body': ''
+            }
+        
         # Query using GSI for pending reviews
         response = review_table.query(
             IndexName='status-index',
@@ -43,6 +108,14 @@ def lambda_handler(event, context):
         )
         
         items = response.get('Items', [])
+        now = time.time()
+        if mine:
+            items = [item for item in items if review_leases.held_by(item, reviewer, now)]
+        for item in items:
+            item.pop('outbox', None)
+            if not review_leases.lease_live(item, now):
+                item.pop('lease_owner', None)
+                item.pop('lease_expires', None)
         
         # Convert Decimal to float for JSON serialization
         def convert_decimals(obj):
@@ -56,20 +129,28 @@ def lambda_handler(event, context):
         
         items = convert_decimals(items)
         
-        # Replace image_key with presigned URL
+        # Replace image_key with presigned URL; the page shows thumb_url and
+        # only fetches image_url when a reviewer opens the original
         for item in items:
             if 'image_key' in item and item['image_key']:
                 item['image_url'] = generate_presigned_url(item['image_key'])
             else:
                 item['image_url'] = None
+            item['thumb_url'] = generate_presigned_url(item.get('thumb_key'))
+
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': '*',
+            'Access-Control-Allow-Headers': '*',
+            'Access-Control-Expose-Headers': 'ETag',
+            'Cache-Control': 'no-cache'
+        }
+        if etag:
+            headers['ETag'] = etag
 
         return {
             'statusCode': 200,
-            'headers': {
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': '*',
-                'Access-Control-Allow-Headers': '*'
-            },
+            'headers': headers,
             'body': json.dumps({
                 'count': len(items),
                 'items': items
@@ -77,6 +158,18 @@ def lambda_handler(event, context):
         }
     
     except Exception as e:
+        if is_timeout(e):
+            print(f"Admin list timed out: {str(e)}")
+            return {
+                'statusCode': 503,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Allow-Methods': '*',
+                    'Access-Control-Allow-Headers': '*',
+                    'Retry-After': '5'
+                },
+                'body': json.dumps({'error': 'Review queue is slow right now, please retry'})
+            }
         print(f"Admin list error: {str(e)}")
         return {
             'statusCode': 500,
@@ -0,0 +1,130 @@
+import json
+import os
+from datetime import datetime, timezone
+from instrumentation import Metrics
+from deadline import Deadline, client, is_timeout, resource
+import stats_keys
+import traffic_sketches
+
+metrics = Metrics('admin_stats')
+
+def response(status_code, body, headers=None):
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': '*',
+            'Access-Control-Allow-Headers': '*',
+            **(headers or {})
+        },
+        'body': json.dumps(body)
+    }
+
+def summarize(item):
+    """Counters of one stats item, plus rates over the submissions it saw"""
+    counts = {name: int(item.get(name, 0)) for name in stats_keys.COUNTERS}
+    submissions = counts[stats_keys.APPROVED] + counts[stats_keys.REJECTED] + counts[stats_keys.REVIEW]
+    labels = {
+        name[len(stats_keys.LABEL_PREFIX):]: int(value)
+        for name, value in item.items()
+        if name.startswith(stats_keys.LABEL_PREFIX)
+    }
+    return {
+        'submissions': submissions,
+        'approved': counts[stats_keys.APPROVED],
+        'rejected': counts[stats_keys.REJECTED],
+        'review': counts[stats_keys.REVIEW],
+        'admin_approved': counts[stats_keys.ADMIN_APPROVED],
+        'admin_rejected': counts[stats_keys.ADMIN_REJECTED],
+        'approval_rate': round(counts[stats_keys.APPROVED] / submissions, 4) if submissions else None,
+        'rejection_rate': round(counts[stats_keys.REJECTED] / submissions, 4) if submissions else None,
+        'review_rate': round(counts[stats_keys.REVIEW] / submissions, 4) if submissions else None,
+        'labels': dict(sorted(labels.items(), key=lambda kv: -kv[1]))
+    }
+
+def read_items(dynamodb, keys):
+    """BatchGetItem of a fixed set of stats items; missing items come back empty"""
+    found = {}
+    request_items = {stats_keys.STATS_TABLE: {'Keys': [{'stat_id': key} for key in keys]}}
+    for _ in range(3):
+        result = dynamodb.batch_get_item(RequestItems=request_items)
+        for item in result.get('Responses', {}).get(stats_keys.STATS_TABLE, []):
+            found[item['stat_id']] = item
+        request_items = result.get('UnprocessedKeys') or {}
+        if not request_items:
+            break
+    return {key: found.get(key, {}) for key in keys}
+
+def oldest_pending(dynamodb, now):
+    review_table = dynamodb.Table(os.getenv('REVIEW_TABLE'))
+    result = review_table.query(
+        IndexName='status-index',
+        KeyConditionExpression='#status = :status',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={':status': 'PENDING_REVIEW'},
+        ProjectionExpression='submission_id, created_at',
+        ScanIndexForward=True,  # Oldest first
+        Limit=1
+    )
+    items = result.get('Items', [])
+    if not items:
+        return None
+    created_at = items[0].get('created_at')
+    try:
+        # created_at is written as naive local time by decision_handler, which is UTC in Lambda
+        age = (now - datetime.fromisoformat(created_at).replace(tzinfo=timezone.utc)).total_seconds()
+    except (TypeError, ValueError):
+        age = None
+    return {
+        'submission_id': items[0]['submission_id'],
+        'created_at': created_at,
+        'age_seconds': int(age) if age is not None else None
+    }
+
+def traffic_summary(deadline):
+    """Heavy hitters and distinct contents from the running sketch checkpoint"""
+    if not traffic_sketches.ANALYTICS_BUCKET:
+        return None
+    try:
+        sketches, _ = traffic_sketches.load(client('s3', deadline), traffic_sketches.TOTAL_CHECKPOINT)
+    except Exception as e:
+        # The counters are still worth serving without the analytics
+        print(f"Could not read traffic sketches: {str(e)}")
+        return None
+    return sketches.summary()
+
+@metrics.handler
+def lambda_handler(event, context):
+    """
+    GET /admin/stats
+    Counters kept by stats_aggregator: totals, the last 7 days and the
+    last 24 hours, plus the review queue depth and its oldest item, and
+    the top labels / sentiment mixes from the sketch checkpoint.
+    Reads a fixed number of items however much traffic there has been.
+    """
+    try:
+        now = datetime.now(timezone.utc)
+        deadline = Deadline(context)
+        dynamodb = resource('dynamodb', deadline)
+        day_keys, hour_keys = stats_keys.recent_keys(now)
+        items = read_items(dynamodb, [stats_keys.TOTALS] + day_keys + hour_keys)
+        totals = items[stats_keys.TOTALS]
+
+        return response(200, {
+            'generated_at': now.isoformat(),
+            'totals': summarize(totals),
+            'queue': {
+                'pending_review': max(0, int(totals.get(stats_keys.PENDING_REVIEW, 0))),
+                'oldest': oldest_pending(dynamodb, now)
+            },
+            'days': [{'day': key.split('#', 1)[1], **summarize(items[key])} for key in day_keys],
+            'hours': [{'hour': key.split('#', 1)[1], **summarize(items[key])} for key in hour_keys],
+            'traffic': traffic_summary(deadline)
+        }, {'Cache-Control': 'no-cache'})
+
+    except Exception as e:
+        if is_timeout(e):
+            print(f"Admin stats timed out: {str(e)}")
+            return response(503, {'error': 'Stats are slow right now, please retry'}, {'Retry-After': '5'})
+        print(f"Admin stats error: {str(e)}")
+        return response(500, {'error': 'Internal server error'})
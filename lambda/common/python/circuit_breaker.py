@@ -0,0 +1,275 @@
+import os
+import time
+
+import boto3
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+CIRCUIT_BREAKER_TABLE = os.getenv('CIRCUIT_BREAKER_TABLE')
+
+_dynamodb_client = None
+
+
+def dynamodb_client():
+    """Made on first use, so the handler's Metrics hooks are on the default session by then"""
+    global _dynamodb_client
+    if _dynamodb_client is None:
+        _dynamodb_client = boto3.client('dynamodb')
+    return _dynamodb_client
+
+
+CLOSED = 'CLOSED'
+OPEN = 'OPEN'
+HALF_OPEN = 'HALF_OPEN'
+
+
+class CircuitOpen(Exception):
+    """The protected service is considered down; don't call it"""
+
+
+def is_outage(error):
+    """
+    Connection failures, timeouts and 5xx responses count against the
+    circuit. Throttles and bad requests mean the service is up.
+    """
+    if isinstance(error, (ConnectionError, HTTPClientError)):
+        return True
+    if isinstance(error, ClientError):
+        return error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker whose state lives in one DynamoDB item, so every warm
+    container opens and closes together.
+
+    CLOSED: calls go through; outages inside failure_window are counted
+    and failure_threshold of them open the circuit.
+    OPEN: calls fail fast with CircuitOpen until opened_until.
+    HALF_OPEN: one container wins a conditional write and sends a single
+    probe call; success closes the circuit, failure reopens it with the
+    open period doubled (up to max_open_seconds). If the prober dies, its
+    lease expires after probe_timeout and another container may probe.
+
+    State is cached in-process for cache_seconds so a closed circuit
+    costs at most one read per second per container.
+    """
+
+    def __init__(self, breaker_id, failure_threshold=5, failure_window=30, open_seconds=15,
+                 max_open_seconds=300, probe_timeout=10, cache_seconds=1.0,
+                 table_name=CIRCUIT_BREAKER_TABLE, metrics=None):
+        self.breaker_id = breaker_id
+        self.failure_threshold = failure_threshold
+        self.failure_window = failure_window
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.probe_timeout = probe_timeout
+        self.cache_seconds = cache_seconds
+        self.table_name = table_name
+        self.metrics = metrics
+        self._state = None
+        self._loaded_at = 0.0
+        self._probing = False
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Only the service's own answers count: an outage is a failure, any
+        other response (even an error) a success. Anything else, such as
+        a RateLimitTimeout from a limiter wrapped in fn, says nothing
+        about the service and neither closes nor opens the circuit.
+        """
+        if not self.allow():
+            self._count('rejected')
+            raise CircuitOpen(f"{self.breaker_id} circuit is open")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            if is_outage(e):
+                self.record_failure()
+            elif isinstance(e, ClientError):
+                self.record_success()
+            else:
+                self.record_neutral()
+            raise
+        self.record_success()
+        return result
+
+    def allow(self):
+        if not self.table_name:
+            return True
+        try:
+            state = self._get()
+            now = time.time()
+            if state['state'] == CLOSED:
+                return True
+            if state['state'] == OPEN and now < state['opened_until']:
+                return False
+            if state['state'] == HALF_OPEN and now < state['probe_until']:
+                return False
+
+            # Open period (or a dead prober's lease) is over: try to be the prober
+            new_state = dict(state, state=HALF_OPEN, probe_until=now + self.probe_timeout)
+            if self._write(state, new_state):
+                self._probing = True
+                self._count('probe')
+                return True
+            return self._get(refresh=True)['state'] == CLOSED
+        except ClientError as e:
+            print(f"Circuit breaker {self.breaker_id} unavailable, allowing call: {str(e)}")
+            return True
+
+    def record_success(self):
+        if not self._probing:
+            return
+        self._probing = False
+        try:
+            state = self._get(refresh=True)
+            if self._write(state, self._closed_state(state['version'])):
+                print(f"Circuit breaker {self.breaker_id}: probe succeeded, circuit closed")
+        except ClientError as e:
+            print(f"Circuit breaker {self.breaker_id} unavailable on success: {str(e)}")
+
+    def record_neutral(self):
+        """A probe that never reached the service: let its lease lapse so another call probes"""
+        self._probing = False
+
+    def record_failure(self):
+        if not self.table_name:
+            return
+        self._count('failures')
+        try:
+            now = time.time()
+            if self._probing:
+                self._probing = False
+                state = self._get(refresh=True)
+                self._open(state, min(self.max_open_seconds, state['open_seconds'] * 2), now)
+                return
+
+            failures = self._add_failure(now)
+            state = self._state or self._get(refresh=True)
+            if state['state'] == CLOSED and failures >= self.failure_threshold:
+                self._open(state, self.open_seconds, now)
+        except ClientError as e:
+            print(f"Circuit breaker {self.breaker_id} unavailable on failure: {str(e)}")
+
+    def _open(self, state, open_seconds, now):
+        new_state = dict(
+            state,
+            state=OPEN,
+            opened_until=now + open_seconds,
+            open_seconds=open_seconds,
+            failures=0,
+            window_start=now
+        )
+        if self._write(state, new_state):
+            self._count('opened')
+            print(f"Circuit breaker {self.breaker_id}: opened for {open_seconds}s")
+
+    def _add_failure(self, now):
+        """
+        Count one failure in the current window, starting a new window if it
+        expired. The count bumps version like any other write, so a
+        conditional replace from a stale read can't drop it; the cached
+        state is kept current when it was the one the update applied to.
+        """
+        try:
+            response = dynamodb_client().update_item(
+                TableName=self.table_name,
+                Key={'breaker_id': {'S': self.breaker_id}},
+                UpdateExpression='ADD failures :one SET version = version + :one',
+                ConditionExpression='window_start > :cutoff',
+                ExpressionAttributeValues={
+                    ':one': {'N': '1'},
+                    ':cutoff': {'N': f"{now - self.failure_window:.3f}"}
+                },
+                ReturnValues='UPDATED_NEW'
+            )
+            failures = int(response['Attributes']['failures']['N'])
+            version = int(response['Attributes']['version']['N'])
+            if self._state is not None and self._state['version'] == version - 1:
+                self._state = dict(self._state, failures=failures, version=version)
+                self._loaded_at = time.monotonic()
+            else:
+                self._state = None
+            return failures
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+        # No item yet, or the window expired: start a new one
+        state = self._get(refresh=True)
+        new_state = dict(state, failures=1, window_start=now)
+        self._write(state, new_state)
+        return 1
+
+    def _closed_state(self, version):
+        return {
+            'version': version,
+            'state': CLOSED,
+            'failures': 0,
+            'window_start': time.time(),
+            'opened_until': 0.0,
+            'open_seconds': self.open_seconds,
+            'probe_until': 0.0
+        }
+
+    def _get(self, refresh=False):
+        if refresh or self._state is None or time.monotonic() - self._loaded_at > self.cache_seconds:
+            response = dynamodb_client().get_item(
+                TableName=self.table_name,
+                Key={'breaker_id': {'S': self.breaker_id}},
+                ConsistentRead=refresh
+            )
+            item = response.get('Item')
+            self._state = self._from_item(item) if item else self._closed_state(0)
+            self._loaded_at = time.monotonic()
+        return self._state
+
+    def _write(self, old, new):
+        """Conditional replace on version; returns True if this write won"""
+        new['version'] = old['version'] + 1
+        kwargs = {
+            'TableName': self.table_name,
+            'Item': self._to_item(new)
+        }
+        if old['version'] == 0:
+            kwargs['ConditionExpression'] = 'attribute_not_exists(breaker_id)'
+        else:
+            kwargs['ConditionExpression'] = 'version = :expected'
+            kwargs['ExpressionAttributeValues'] = {':expected': {'N': str(old['version'])}}
+        try:
+            dynamodb_client().put_item(**kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            self._state = None
+            return False
+        self._state = new
+        self._loaded_at = time.monotonic()
+        return True
+
+    def _to_item(self, state):
+        return {
+            'breaker_id': {'S': self.breaker_id},
+            'version': {'N': str(state['version'])},
+            'state': {'S': state['state']},
+            'failures': {'N': str(state['failures'])},
+            'window_start': {'N': f"{state['window_start']:.3f}"},
+            'opened_until': {'N': f"{state['opened_until']:.3f}"},
+            'open_seconds': {'N': str(state['open_seconds'])},
+            'probe_until': {'N': f"{state['probe_until']:.3f}"}
+        }
+
+    def _from_item(self, item):
+        return {
+            'version': int(item['version']['N']),
+            'state': item['state']['S'],
+            'failures': int(item['failures']['N']),
+            'window_start': float(item['window_start']['N']),
+            'opened_until': float(item['opened_until']['N']),
+            'open_seconds': float(item['open_seconds']['N']),
+            'probe_until': float(item['probe_until']['N'])
+        }
+
+    def _count(self, name):
+        if self.metrics:
+            self.metrics.count(f"circuit.{self.breaker_id}.{name}")
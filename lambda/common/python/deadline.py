@@ -0,0 +1,112 @@
+import time
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ConnectionError, HTTPClientError
+
+# Time kept back from every budget to build and return a response
+DEFAULT_RESERVE_MS = 500
+
+# Used when there is no Lambda context (local runs)
+DEFAULT_BUDGET_MS = 30000
+
+# (connect_timeout, read_timeout) per attempt in seconds, smallest first.
+# Clients are cached per tier so a warm container builds each at most once.
+TIMEOUT_TIERS = ((0.2, 0.5), (0.5, 1.0), (1.0, 2.0), (1.0, 4.0), (2.0, 8.0))
+
+# botocore's standard retry mode sleeps up to base ** (attempt - 1)
+# seconds, at most MAX_BACKOFF, before each retry
+BACKOFF_BASE = 2
+MAX_BACKOFF = 20
+
+_clients = {}
+_resources = {}
+
+
+def is_timeout(error):
+    """Connection failures and timeouts raised by botocore"""
+    return isinstance(error, (ConnectionError, HTTPClientError))
+
+
+class Deadline:
+    """
+    Time left in this invocation, from context.get_remaining_time_in_millis(),
+    minus a reserve for returning a response.
+    """
+
+    def __init__(self, context, reserve_ms=DEFAULT_RESERVE_MS):
+        self._context = context
+        self._reserve_ms = reserve_ms
+        self._started = time.monotonic()
+
+    def remaining_ms(self):
+        if self._context is not None and hasattr(self._context, 'get_remaining_time_in_millis'):
+            remaining = self._context.get_remaining_time_in_millis()
+        else:
+            remaining = DEFAULT_BUDGET_MS - (time.monotonic() - self._started) * 1000
+        return max(0, remaining - self._reserve_ms)
+
+    def expired(self, needed_ms=0):
+        """True if less than needed_ms (beyond the reserve) is left"""
+        return self.remaining_ms() <= needed_ms
+
+
+def max_backoff(attempts):
+    """Longest botocore can sleep between attempts, in seconds, over all of them"""
+    return sum(min(BACKOFF_BASE ** i, MAX_BACKOFF) for i in range(attempts - 1))
+
+
+def call_budget(remaining_ms, max_attempts=None, max_read_timeout=None):
+    """
+    Pick (connect_timeout, read_timeout, attempts) so every attempt and
+    the backoff sleeps between them together fit in remaining_ms. Prefers
+    three attempts of at least one second each, then fewer attempts with
+    longer timeouts; with almost no time left it falls back to a single
+    short attempt.
+    """
+    budget = remaining_ms / 1000
+    tiers = [t for t in TIMEOUT_TIERS if max_read_timeout is None or t[1] <= max_read_timeout]
+    tiers = tiers or [TIMEOUT_TIERS[0]]
+    attempt_options = (max_attempts,) if max_attempts else (3, 2, 1)
+    for attempts in attempt_options:
+        for connect, read in reversed(tiers):
+            if attempts * (connect + read) + max_backoff(attempts) <= budget and (attempts == 1 or read >= 1.0):
+                return connect, read, attempts
+    return tiers[0][0], tiers[0][1], 1
+
+
+def attempt_ms(client):
+    """Longest one attempt of a call on client can take: its connect plus read timeout"""
+    config = client.meta.config
+    return (config.connect_timeout + config.read_timeout) * 1000
+
+
+def _config(connect, read, attempts):
+    return Config(
+        connect_timeout=connect,
+        read_timeout=read,
+        retries={'mode': 'standard', 'max_attempts': attempts}
+    )
+
+
+def client_config(deadline, max_attempts=None, max_read_timeout=None):
+    """botocore Config for clients built outside the cached helpers below"""
+    return _config(*call_budget(deadline.remaining_ms(), max_attempts, max_read_timeout))
+
+
+def client(service, deadline, max_attempts=None, max_read_timeout=None):
+    """boto3 client whose timeouts and retries fit the time left"""
+    budget = call_budget(deadline.remaining_ms(), max_attempts, max_read_timeout)
+    key = (service,) + budget
+    if key not in _clients:
+        _clients[key] = boto3.client(service, config=_config(*budget))
+    return _clients[key]
+
+
+def resource(service, deadline, max_attempts=None, max_read_timeout=None):
+    """boto3 resource whose timeouts and retries fit the time left"""
+    budget = call_budget(deadline.remaining_ms(), max_attempts, max_read_timeout)
+    key = (service,) + budget
+    if key not in _resources:
+        _resources[key] = boto3.resource(service, config=_config(*budget))
+    return _resources[key]
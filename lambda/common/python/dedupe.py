@@ -0,0 +1,162 @@
+import hashlib
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+import text_normalizer
+
+DEDUPE_TABLE = os.getenv('DEDUPE_TABLE')
+
+# How long a decided submission is reused for identical content; 0 turns dedupe off
+DEDUPE_WINDOW_SECONDS = int(os.getenv('DEDUPE_WINDOW_SECONDS', '86400'))
+
+# A claim still without a decision after this belongs to a run that died
+# (the state machine times out after 5 minutes) and may be taken over
+CLAIM_TIMEOUT_SECONDS = 600
+
+# decision_handler / admin_decision outcome -> status reported to the submitter
+DECISION_STATUS = {
+    'APPROVE': 'approved',
+    'APPROVED': 'approved',
+    'REJECT': 'rejected',
+    'REJECTED': 'rejected',
+}
+
+
+def enabled():
+    return bool(DEDUPE_TABLE) and DEDUPE_WINDOW_SECONDS > 0
+
+
+def normalize_text(text):
+    """Case, whitespace and obfuscation differences don't make content new (see text_normalizer)"""
+    return text_normalizer.normalize(text)
+
+
+def content_hash(text, image_etag=None):
+    """sha256 over the normalized text and the uploaded image's ETag"""
+    etag = (image_etag or '').strip('"')
+    payload = f"{normalize_text(text)}\0{etag}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def claim(dynamodb, digest, submission_id):
+    """
+    Claim digest for submission_id. Returns None if the caller should run
+    moderation (new content, an expired or abandoned claim, or the same
+    submission retrying), else the earlier submission as
+    {'submission_id', 'decision'} with decision None while it's in flight.
+    dynamodb is a low-level client.
+    """
+    now = int(time.time())
+    try:
+        dynamodb.put_item(
+            TableName=DEDUPE_TABLE,
+            Item={
+                'content_hash': {'S': digest},
+                'submission_id': {'S': submission_id},
+                'claimed_at': {'N': str(now)},
+                'ttl': {'N': str(now + DEDUPE_WINDOW_SECONDS)}
+            },
+            ConditionExpression='attribute_not_exists(content_hash) OR #ttl < :now OR '
+                                '(attribute_not_exists(decision) AND claimed_at < :abandoned)',
+            ExpressionAttributeNames={'#ttl': 'ttl'},
+            ExpressionAttributeValues={
+                ':now': {'N': str(now)},
+                ':abandoned': {'N': str(now - CLAIM_TIMEOUT_SECONDS)}
+            },
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+        return None
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        item = e.response.get('Item') or {}
+    existing = item.get('submission_id', {}).get('S')
+    if not existing or existing == submission_id:
+        return None
+    return {'submission_id': existing, 'decision': item.get('decision', {}).get('S')}
+
+
+def record_decision(dynamodb, digest, submission_id, decision):
+    """Store the outcome on the claim, if submission_id still holds it"""
+    try:
+        dynamodb.update_item(
+            TableName=DEDUPE_TABLE,
+            Key={'content_hash': {'S': digest}},
+            UpdateExpression='SET decision = :decision, decided_at = :now',
+            ConditionExpression='submission_id = :sid',
+            ExpressionAttributeValues={
+                ':decision': {'S': decision},
+                ':now': {'N': str(int(time.time()))},
+                ':sid': {'S': submission_id}
+            }
+        )
+    except ClientError as e:
+        # Losing this only means the next identical submission is moderated again
+        print(f"Dedupe decision for {submission_id} not recorded: {str(e)}")
+
+
+def release(dynamodb, digest, submission_id):
+    """Drop an undecided claim whose run won't produce a decision"""
+    try:
+        dynamodb.delete_item(
+            TableName=DEDUPE_TABLE,
+            Key={'content_hash': {'S': digest}},
+            ConditionExpression='submission_id = :sid AND attribute_not_exists(decision)',
+            ExpressionAttributeValues={':sid': {'S': submission_id}}
+        )
+    except ClientError as e:
+        print(f"Dedupe claim for {submission_id} not released: {str(e)}")
+
+
+def link_alias(dynamodb, submission_id, original_id):
+    """
+    Point submission_id at original_id for GET /status. Used when a client
+    already holds its own submission_id (a direct upload) by the time the
+    duplicate is found.
+    """
+    now = int(time.time())
+    dynamodb.put_item(
+        TableName=DEDUPE_TABLE,
+        Item={
+            'content_hash': {'S': f"alias#{submission_id}"},
+            'submission_id': {'S': original_id},
+            'ttl': {'N': str(now + DEDUPE_WINDOW_SECONDS)}
+        }
+    )
+
+
+def resolve_alias(dynamodb, submission_id):
+    """The submission this one was deduplicated into, or None"""
+    response = dynamodb.get_item(
+        TableName=DEDUPE_TABLE,
+        Key={'content_hash': {'S': f"alias#{submission_id}"}}
+    )
+    return response.get('Item', {}).get('submission_id', {}).get('S')
+
+
+def resolve_aliases(dynamodb, submission_ids, max_attempts=3):
+    """
+    {submission_id: original_id} for those of submission_ids that are
+    aliases, in BatchGetItem requests of up to 100 keys. Raises
+    RuntimeError if keys are still unprocessed after max_attempts.
+    """
+    aliases = {}
+    for start in range(0, len(submission_ids), 100):
+        request_items = {DEDUPE_TABLE: {
+            'Keys': [{'content_hash': {'S': f"alias#{sid}"}} for sid in submission_ids[start:start + 100]],
+            'ProjectionExpression': 'content_hash, submission_id'
+        }}
+        for attempt in range(max_attempts):
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            for item in response.get('Responses', {}).get(DEDUPE_TABLE, []):
+                aliases[item['content_hash']['S'][len('alias#'):]] = item['submission_id']['S']
+            request_items = response.get('UnprocessedKeys') or {}
+            if not request_items:
+                break
+            time.sleep(0.05 * 2 ** attempt)
+        else:
+            raise RuntimeError(f"Aliases of {len(submission_ids)} submissions not read after {max_attempts} attempts")
+    return aliases
+
@@ -0,0 +1,163 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+import boto3
+
+NAMESPACE = os.getenv('METRICS_NAMESPACE', 'ContentModeration')
+
+# EMF allows at most 100 values per metric in a single log line
+MAX_VALUES_PER_METRIC = 100
+
+_CALL_KEY = '_metrics_call'
+
+
+class Metrics:
+    """
+    Per-invocation timings emitted as one CloudWatch Embedded Metric Format line.
+
+    Create it at module import, before any boto3 client: it hooks botocore's
+    before-call/after-call events on the default session so every client made
+    afterwards reports its own call latency as aws.<service>.<Operation>.
+    """
+
+    def __init__(self, function_name, namespace=NAMESPACE):
+        self.function_name = function_name
+        self.namespace = namespace
+        self._created_at = time.perf_counter()
+        self._cold_start = True
+        self._values = {}
+        self._units = {}
+        self._properties = {}
+
+        if boto3.DEFAULT_SESSION is None:
+            boto3.setup_default_session()
+        self.instrument(boto3.DEFAULT_SESSION)
+
+    def instrument(self, target):
+        """
+        Register the AWS call hooks on a boto3 session, client or resource.
+        Only needed for sessions other than the default one.
+        """
+        meta = getattr(target, 'meta', None)
+        if meta is not None and hasattr(meta, 'client'):
+            events = meta.client.meta.events
+        elif meta is not None:
+            events = meta.events
+        else:
+            events = target.events
+        events.register('before-call.*.*', self._before_call)
+        events.register('after-call.*.*', self._after_call)
+        events.register('after-call-error.*.*', self._after_call_error)
+        return target
+
+    def _before_call(self, model=None, context=None, **kwargs):
+        if context is not None:
+            name = f"aws.{model.service_model.service_name}.{model.name}"
+            context[_CALL_KEY] = (name, time.perf_counter())
+
+    def _after_call(self, http_response=None, context=None, **kwargs):
+        call = context.pop(_CALL_KEY, None) if context else None
+        if call is None:
+            return
+        name, started = call
+        self.put(name, (time.perf_counter() - started) * 1000)
+        if http_response is not None and http_response.status_code >= 300:
+            self.count(f"{name}.errors")
+
+    def _after_call_error(self, context=None, **kwargs):
+        # Connection errors and timeouts never reach after-call
+        call = context.pop(_CALL_KEY, None) if context else None
+        if call is None:
+            return
+        name, started = call
+        self.put(name, (time.perf_counter() - started) * 1000)
+        self.count(f"{name}.errors")
+
+    def put(self, name, value, unit='Milliseconds'):
+        values = self._values.setdefault(name, [])
+        if len(values) < MAX_VALUES_PER_METRIC:
+            values.append(round(value, 3))
+        self._units[name] = unit
+
+    def count(self, name, value=1):
+        self.put(name, value, unit='Count')
+
+    def set_property(self, key, value):
+        self._properties[key] = value
+
+    @contextmanager
+    def stage(self, name):
+        """Times the wrapped block as stage.<name> in milliseconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.put(f"stage.{name}", (time.perf_counter() - started) * 1000)
+
+    def handler(self, fn):
+        """
+        Decorator for lambda_handler: records cold start, init duration,
+        handler duration and request/response payload sizes, then flushes.
+        """
+        @wraps(fn)
+        def wrapper(event, context):
+            started = time.perf_counter()
+            if self._cold_start:
+                self.put('InitDuration', (started - self._created_at) * 1000)
+            self.count('ColdStart', 1 if self._cold_start else 0)
+            self._cold_start = False
+            self.put('RequestBytes', payload_size(event), unit='Bytes')
+            if context is not None:
+                self.set_property('RequestId', getattr(context, 'aws_request_id', None))
+
+            result = None
+            try:
+                result = fn(event, context)
+                return result
+            finally:
+                self.put('Duration', (time.perf_counter() - started) * 1000)
+                if result is not None:
+                    self.put('ResponseBytes', payload_size(result), unit='Bytes')
+                self.flush()
+        return wrapper
+
+    def flush(self):
+        if not self._values:
+            return
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [['Function']],
+                    'Metrics': [
+                        {'Name': name, 'Unit': self._units[name]}
+                        for name in self._values
+                    ]
+                }]
+            },
+            'Function': self.function_name
+        }
+        record.update(self._properties)
+        for name, values in self._values.items():
+            record[name] = values[0] if len(values) == 1 else values
+        print(json.dumps(record, separators=(',', ':'), default=str))
+        self._values = {}
+        self._units = {}
+        self._properties = {}
+
+
+def payload_size(obj):
+    """
+    Byte size of an event or response. API Gateway payloads are measured by
+    their body so the proxy envelope doesn't dominate the number.
+    """
+    if isinstance(obj, dict) and isinstance(obj.get('body'), str):
+        return len(obj['body'].encode('utf-8'))
+    try:
+        return len(json.dumps(obj, separators=(',', ':'), default=str).encode('utf-8'))
+    except (TypeError, ValueError):
+        return 0
@@ -0,0 +1,127 @@
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+ANALYTICS_BUCKET = os.getenv('ANALYTICS_BUCKET')
+
+# SimHash signatures of recently moderated texts in the analytics bucket,
+# by the UTC hour they were written in:
+#   near_dup/<hour>/<ms>-<sequence>.bin   one immutable object per outbox_worker batch
+#   near_dup/<hour>.bin                   all of a closed hour's batches in one segment
+# outbox_worker writes batches and compacts each hour once it is closed,
+# text_moderator loads the newest NEAR_DUP_GENERATIONS hours (see
+# text_moderator/near_dup_index.py) and the bucket's lifecycle rule
+# removes old ones.
+PREFIX = 'near_dup/'
+
+NEAR_DUP_GENERATIONS = int(os.getenv('NEAR_DUP_GENERATIONS', '24'))
+
+# Records past this in one hour are left out when it is loaded or
+# compacted, which bounds what every text_moderator container holds:
+# about 80 bytes per signature once indexed
+MAX_PER_GENERATION = int(os.getenv('NEAR_DUP_MAX_PER_GENERATION', '100000'))
+
+# A batch's key starts with the time it was written, and no write takes
+# longer than outbox_worker's timeout: listing from this long before the
+# last listing started finds every batch written since
+MAX_WRITE_MS = 60_000
+
+# An hour gets no batches once it is over; compaction waits an hour more
+CLOSED_AFTER = timedelta(hours=2)
+
+# signature (little-endian uint64), decision, sentiment, submission_id
+# (ASCII, NUL padded). Fixed size, so batches concatenate into a segment
+# that is readable as a NumPy structured array.
+RECORD = struct.Struct('<QBB36s')
+
+DECISIONS = ('APPROVE', 'REJECT', 'AMBIGUOUS')
+SENTIMENTS = ('POSITIVE', 'NEGATIVE', 'NEUTRAL', 'MIXED')
+
+
+def hour_of(moment):
+    return f"{moment.astimezone(timezone.utc):%Y-%m-%dT%H}"
+
+
+def batch_prefix(hour):
+    return f"{PREFIX}{hour}/"
+
+
+def segment_key(hour):
+    return f"{PREFIX}{hour}.bin"
+
+
+def recent_hours(now, generations=NEAR_DUP_GENERATIONS):
+    """Hours text_moderator looks in, newest first"""
+    return [hour_of(now - timedelta(hours=i)) for i in range(generations)]
+
+
+def pack(signature_hex, decision, sentiment, submission_id):
+    """One record, or None for what can't be stored (e.g. an id longer than a UUID)"""
+    encoded = (submission_id or '').encode('ascii', 'ignore')
+    if not encoded or len(encoded) > 36 or decision not in DECISIONS or sentiment not in SENTIMENTS:
+        return None
+    return RECORD.pack(int(signature_hex, 16), DECISIONS.index(decision), SENTIMENTS.index(sentiment), encoded)
+
+
+def write_batch(s3, records, sequence, now, bucket=ANALYTICS_BUCKET):
+    """
+    Store packed records as a new batch object named after now and the
+    batch's first stream sequence number; returns its key
+    """
+    key = f"{batch_prefix(hour_of(now))}{int(now.timestamp() * 1000):013d}-{sequence}.bin"
+    s3.put_object(Bucket=bucket, Key=key, Body=b''.join(records), ContentType='application/octet-stream')
+    return key
+
+
+def list_batches(s3, hour, since_ms=0, bucket=ANALYTICS_BUCKET):
+    """Keys of hour's batches written from since_ms on, oldest first"""
+    kwargs = {'Bucket': bucket, 'Prefix': batch_prefix(hour)}
+    if since_ms > 0:
+        kwargs['StartAfter'] = f"{batch_prefix(hour)}{since_ms:013d}"
+    keys = []
+    for page in s3.get_paginator('list_objects_v2').paginate(**kwargs):
+        keys.extend(obj['Key'] for obj in page.get('Contents', []))
+    return keys
+
+
+def fetch(s3, key, bucket=ANALYTICS_BUCKET):
+    """The object's bytes, or None if it doesn't exist (yet, or any more)"""
+    try:
+        return s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return None
+        raise
+
+
+def compact(s3, hour, bucket=ANALYTICS_BUCKET, workers=8):
+    """
+    Write a closed hour's batches as its one segment, so a text_moderator
+    starting cold makes one GET per hour. Returns False if the segment is
+    already there (another outbox_worker may have got there first).
+    """
+    try:
+        s3.head_object(Bucket=bucket, Key=segment_key(hour))
+        return False
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+            raise
+    keys = list_batches(s3, hour, bucket=bucket)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        batches = list(pool.map(lambda key: fetch(s3, key, bucket) or b'', keys))
+    try:
+        s3.put_object(
+            Bucket=bucket,
+            Key=segment_key(hour),
+            Body=b''.join(batches)[:MAX_PER_GENERATION * RECORD.size],
+            ContentType='application/octet-stream',
+            IfNoneMatch='*'
+        )
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+            raise
+        return False
+    return True
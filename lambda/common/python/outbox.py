@@ -0,0 +1,43 @@
+# Side effects of a decision, written on the decision item itself in the
+# same put_item. outbox_worker reads them back from the table streams and
+# performs them, so a decision is a single write and its follow-ups are
+# never lost. Effects are performed at least once.
+OUTBOX = 'outbox'
+
+NOTIFY = 'notify'
+RECORD_DEDUPE = 'record_dedupe'
+BUMP_QUEUE = 'bump_queue'
+THUMBNAIL = 'thumbnail'
+NEAR_DUP = 'near_dup'
+
+
+def notify(subject, message):
+    """Email the admins through ADMIN_NOTIFICATION_TOPIC"""
+    return {'type': NOTIFY, 'subject': subject, 'message': message}
+
+
+def record_dedupe(content_hash, decision):
+    """dedupe.record_decision for the item's submission"""
+    return {'type': RECORD_DEDUPE, 'content_hash': content_hash, 'decision': decision}
+
+
+def bump_queue():
+    """queue_version.bump; coalesced to one bump per batch"""
+    return {'type': BUMP_QUEUE}
+
+
+def thumbnail(image_key):
+    """Invoke the thumbnailer for the item's submission"""
+    return {'type': THUMBNAIL, 'image_key': image_key}
+
+
+def near_dup(simhash, decision, sentiment):
+    """Add the item's text signature to the near-duplicate index (see near_dup)"""
+    return {'type': NEAR_DUP, 'simhash': simhash, 'decision': decision, 'sentiment': sentiment}
+
+
+def attach(item, effects):
+    """item with its outbox, if there is anything to do"""
+    if effects:
+        item[OUTBOX] = effects
+    return item
@@ -0,0 +1,34 @@
+import os
+
+COUNTERS_TABLE = os.getenv('COUNTERS_TABLE')
+
+# Bumped whenever the set of pending review items (or anything shown
+# with them) changes; admin_list builds its ETag from it.
+REVIEW_QUEUE_COUNTER = 'review_queue'
+
+
+def bump(dynamodb):
+    """
+    Atomically increment the review queue version. A failed bump only
+    delays dashboards noticing the change, so it never fails the caller.
+    """
+    if not COUNTERS_TABLE:
+        return
+    try:
+        dynamodb.Table(COUNTERS_TABLE).update_item(
+            Key={'counter_id': REVIEW_QUEUE_COUNTER},
+            UpdateExpression='ADD version :one',
+            ExpressionAttributeValues={':one': 1}
+        )
+    except Exception as e:
+        print(f"Review queue version bump failed: {str(e)}")
+
+
+def current(dynamodb):
+    if not COUNTERS_TABLE:
+        return None
+    response = dynamodb.Table(COUNTERS_TABLE).get_item(
+        Key={'counter_id': REVIEW_QUEUE_COUNTER},
+        ProjectionExpression='version'
+    )
+    return int(response.get('Item', {}).get('version', 0))
@@ -0,0 +1,384 @@
+import os
+import random
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+from ttl_cache import TTLCache
+
+RATE_LIMIT_TABLE = os.getenv('RATE_LIMIT_TABLE')
+
+# Error codes AWS services use to say "slow down"
+THROTTLE_CODES = {
+    'ThrottlingException',
+    'Throttling',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+    'LimitExceededException',
+}
+
+# Pause after losing a conditional write to another container, before
+# trying again with the winner's state
+CONTENTION_BACKOFF = 0.01
+
+_dynamodb_client = None
+
+
+def dynamodb_client():
+    """Made on first use, so the handler's Metrics hooks are on the default session by then"""
+    global _dynamodb_client
+    if _dynamodb_client is None:
+        _dynamodb_client = boto3.client('dynamodb')
+    return _dynamodb_client
+
+
+class RateLimitTimeout(Exception):
+    """No token became available within the allowed wait"""
+
+
+def is_throttle(error):
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in THROTTLE_CODES
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket shared by every container through one DynamoDB item,
+    with an AIMD controller on its refill rate.
+
+    - Additive increase: the rate grows by increase_per_second for every
+      second of wall time, however many containers are calling, and
+      grows four times slower once it is within 10% of the rate that
+      last got throttled, so it settles just below the service limit.
+    - Multiplicative decrease: a throttle multiplies the rate by
+      decrease_factor, at most once per decrease_cooldown so one burst
+      of throttles from many containers only counts once.
+
+    Every state change is a conditional write on a version number; a
+    lost race returns the winner's item and the caller recomputes.
+    With no table configured, or if DynamoDB itself fails, the limiter
+    lets calls through rather than blocking moderation.
+    """
+
+    def __init__(self, limiter_id, initial_rate=5.0, min_rate=1.0, max_rate=20.0,
+                 increase_per_second=0.5, decrease_factor=0.7, decrease_cooldown=1.0,
+                 max_wait=5.0, max_attempts=3, table_name=RATE_LIMIT_TABLE, metrics=None):
+        self.limiter_id = limiter_id
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_per_second = increase_per_second
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.max_wait = max_wait
+        self.max_attempts = max_attempts
+        self.table_name = table_name
+        self.metrics = metrics
+        self._state = None
+
+    def call(self, fn, *args, max_wait=None, deadline=None, attempt_ms=0, **kwargs):
+        """
+        Invoke fn under the limiter. Throttled calls lower the shared rate
+        and are retried (after waiting for a new token) up to max_attempts.
+        max_wait overrides the constructor's wait for each token. With a
+        deadline, no attempt starts unless it can wait for its token and
+        still have attempt_ms left for fn (see deadline.attempt_ms); past
+        that the call ends in RateLimitTimeout, or the last throttle.
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            wait = self.max_wait if max_wait is None else max_wait
+            if deadline is not None:
+                spare = (deadline.remaining_ms() - attempt_ms) / 1000
+                if spare < 0:
+                    self._count('timeouts')
+                    raise RateLimitTimeout(f"{self.limiter_id}: {deadline.remaining_ms()}ms left, not enough for another attempt")
+                wait = min(wait, spare)
+            self.acquire(wait)
+            try:
+                return fn(*args, **kwargs)
+            except ClientError as e:
+                if not is_throttle(e):
+                    raise
+                self._count('throttled')
+                self.on_throttle()
+                if attempt == self.max_attempts or \
+                        deadline is not None and deadline.remaining_ms() < attempt_ms:
+                    raise
+
+    def acquire(self, max_wait=None):
+        """Take one token, sleeping until one is available"""
+        if not self.table_name:
+            return
+        max_wait = self.max_wait if max_wait is None else max_wait
+        started = time.monotonic()
+        try:
+            state = self._state or self._load()
+            while True:
+                now = time.time()
+                rate = self._increased_rate(state, now)
+                tokens = min(self._capacity(rate), state['tokens'] + (now - state['updated_at']) * rate)
+
+                if tokens >= 1:
+                    new_state = dict(state, tokens=tokens - 1, rate=rate, updated_at=now)
+                    current = self._write(state, new_state)
+                    if current is None:
+                        self._state = new_state
+                        break
+                    # Lost the race for the item: back off a little so
+                    # contending containers spread out, within max_wait
+                    backoff = CONTENTION_BACKOFF * random.uniform(1.0, 2.0)
+                    if time.monotonic() - started + backoff > max_wait:
+                        self._count('timeouts')
+                        raise RateLimitTimeout(f"{self.limiter_id}: no token within {max_wait}s (contention)")
+                    time.sleep(backoff)
+                    state = current
+                    continue
+
+                wait = (1 - tokens) / rate
+                if time.monotonic() - started + wait > max_wait:
+                    self._count('timeouts')
+                    raise RateLimitTimeout(f"{self.limiter_id}: no token within {max_wait}s")
+                time.sleep(wait * random.uniform(1.0, 1.2))
+                state = self._load()
+        except ClientError as e:
+            print(f"Rate limiter {self.limiter_id} unavailable, allowing call: {str(e)}")
+            self._state = None
+        self._put_wait((time.monotonic() - started) * 1000)
+
+    def on_throttle(self):
+        """Multiplicative decrease of the shared rate"""
+        if not self.table_name:
+            return
+        try:
+            state = self._load()
+            for _ in range(3):
+                now = time.time()
+                if now - state['last_decrease'] < self.decrease_cooldown:
+                    return
+                new_state = dict(
+                    state,
+                    rate=max(self.min_rate, state['rate'] * self.decrease_factor),
+                    ceiling=state['rate'],
+                    tokens=0.0,
+                    updated_at=now,
+                    last_decrease=now
+                )
+                current = self._write(state, new_state)
+                if current is None:
+                    self._state = new_state
+                    print(f"Rate limiter {self.limiter_id}: throttled, rate {state['rate']:.2f} -> {new_state['rate']:.2f}/s")
+                    return
+                state = current
+        except ClientError as e:
+            print(f"Rate limiter {self.limiter_id} unavailable on throttle: {str(e)}")
+
+    def _increased_rate(self, state, now):
+        elapsed = max(0.0, now - state['updated_at'])
+        step = self.increase_per_second * elapsed
+        if state['ceiling'] and state['rate'] >= 0.9 * state['ceiling']:
+            step /= 4
+        return min(self.max_rate, max(self.min_rate, state['rate'] + step))
+
+    def _capacity(self, rate):
+        # One second of tokens, so an idle limiter can't release a large burst
+        return max(1.0, rate)
+
+    def _initial_state(self):
+        return {
+            'version': 0,
+            'tokens': self._capacity(self.initial_rate),
+            'rate': self.initial_rate,
+            'ceiling': 0.0,
+            'updated_at': time.time(),
+            'last_decrease': 0.0
+        }
+
+    def _load(self):
+        response = dynamodb_client().get_item(
+            TableName=self.table_name,
+            Key={'limiter_id': {'S': self.limiter_id}},
+            ConsistentRead=True
+        )
+        item = response.get('Item')
+        return self._from_item(item) if item else self._initial_state()
+
+    def _write(self, old, new):
+        """
+        Conditionally replace old with new, bumping new's version in place.
+        Returns None on success, or the current state if someone else won.
+        """
+        new['version'] = old['version'] + 1
+        kwargs = {
+            'TableName': self.table_name,
+            'Item': self._to_item(new),
+            'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+        }
+        if old['version'] == 0:
+            kwargs['ConditionExpression'] = 'attribute_not_exists(limiter_id)'
+        else:
+            kwargs['ConditionExpression'] = 'version = :expected'
+            kwargs['ExpressionAttributeValues'] = {':expected': {'N': str(old['version'])}}
+        try:
+            dynamodb_client().put_item(**kwargs)
+            return None
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            self._count('contention')
+            item = e.response.get('Item')
+            return self._from_item(item) if item else self._load()
+
+    def _to_item(self, state):
+        return {
+            'limiter_id': {'S': self.limiter_id},
+            'version': {'N': str(state['version'])},
+            'tokens': {'N': f"{state['tokens']:.4f}"},
+            'rate': {'N': f"{state['rate']:.4f}"},
+            'ceiling': {'N': f"{state['ceiling']:.4f}"},
+            'updated_at': {'N': f"{state['updated_at']:.3f}"},
+            'last_decrease': {'N': f"{state['last_decrease']:.3f}"}
+        }
+
+    def _from_item(self, item):
+        return {
+            'version': int(item['version']['N']),
+            'tokens': float(item['tokens']['N']),
+            'rate': float(item['rate']['N']),
+            'ceiling': float(item['ceiling']['N']),
+            'updated_at': float(item['updated_at']['N']),
+            'last_decrease': float(item['last_decrease']['N'])
+        }
+
+    def _count(self, name):
+        if self.metrics:
+            self.metrics.count(f"ratelimit.{self.limiter_id}.{name}")
+
+    def _put_wait(self, ms):
+        if self.metrics:
+            self.metrics.put(f"ratelimit.{self.limiter_id}.wait", ms)
+
+
+class SlidingWindowLimiter:
+    """
+    Per-client request limit over a sliding window, shared by every
+    container through one DynamoDB item per client.
+
+    Uses the sliding window counter approximation: the previous fixed
+    window's count, weighted by how much of it still overlaps the
+    sliding window, plus the current window's count. Each client item
+    keeps one attribute per window (w<index>), ADDed to atomically and
+    expired by TTL.
+
+    Containers don't write on every request. Allowed requests are counted
+    locally and synced with one ADD, which also returns the global counts,
+    on a client's first request in a container or window, or when either:
+    - the local batch reaches sync_fraction of the client's remaining
+      headroom (so a client close to its limit syncs on every request), or
+    - max_sync_interval has passed.
+    Clients already over the limit are refused from the local counts with
+    no write at all. Like AdaptiveRateLimiter, a DynamoDB failure lets
+    requests through.
+    """
+
+    def __init__(self, name, limit, window_seconds=60, sync_fraction=0.25, max_sync_interval=5.0,
+                 max_clients=10000, table_name=RATE_LIMIT_TABLE, metrics=None):
+        self.name = name
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.sync_fraction = sync_fraction
+        self.max_sync_interval = max_sync_interval
+        self.table_name = table_name
+        self.metrics = metrics
+        self._clients = TTLCache(maxsize=max_clients)
+
+    def allow(self, client_id, now=None):
+        """
+        Count one request from client_id.
+        Returns (True, None) if it's within the limit, else (False, retry_after_seconds).
+        """
+        if not self.table_name:
+            return True, None
+        now = time.time() if now is None else now
+        window = int(now // self.window_seconds)
+        overlap = 1 - (now - window * self.window_seconds) / self.window_seconds
+        state = self._local_state(client_id, window)
+
+        estimate = state['previous'] * overlap + state['current'] + state['pending']
+        if estimate + 1 > self.limit:
+            self._count('rejected_local')
+            return False, self._retry_after(state, now, window)
+
+        state['pending'] += 1
+        batch = max(1, int((self.limit - estimate) * self.sync_fraction))
+        if state['synced_at'] is None or state['pending'] >= batch or \
+                now - state['synced_at'] >= self.max_sync_interval:
+            self._sync(client_id, state, window, now)
+            if state['previous'] * overlap + state['current'] > self.limit:
+                # Refunded in the next sync, so refused requests don't
+                # keep a persistent client locked out
+                state['pending'] -= 1
+                self._count('rejected')
+                return False, self._retry_after(state, now, window)
+        return True, None
+
+    def _local_state(self, client_id, window):
+        state = self._clients.get(client_id)
+        if state is not None and state['window'] != window:
+            if state['window'] == window - 1:
+                # Roll over; the next request syncs to learn the global counts
+                state = dict(self._empty(window), previous=state['current'] + state['pending'])
+            else:
+                state = None
+        if state is None:
+            state = self._empty(window)
+        self._clients.set(client_id, state, ttl=2 * self.window_seconds)
+        return state
+
+    def _empty(self, window):
+        return {'window': window, 'previous': 0, 'current': 0, 'pending': 0, 'synced_at': None}
+
+    def _sync(self, client_id, state, window, now):
+        try:
+            response = dynamodb_client().update_item(
+                TableName=self.table_name,
+                Key={'limiter_id': {'S': f"{self.name}:{client_id}"}},
+                UpdateExpression='ADD #current :n SET #ttl = :ttl REMOVE #stale',
+                ExpressionAttributeNames={
+                    '#current': f"w{window}",
+                    '#stale': f"w{window - 2}",
+                    '#ttl': 'ttl'
+                },
+                ExpressionAttributeValues={
+                    ':n': {'N': str(state['pending'])},
+                    ':ttl': {'N': str(int((window + 2) * self.window_seconds))}
+                },
+                ReturnValues='ALL_NEW'
+            )
+        except ClientError as e:
+            print(f"Rate limiter {self.name} unavailable, allowing request: {str(e)}")
+            return
+        item = response.get('Attributes', {})
+        state['previous'] = int(item.get(f"w{window - 1}", {}).get('N', 0))
+        state['current'] = int(item.get(f"w{window}", {}).get('N', 0))
+        state['pending'] = 0
+        state['synced_at'] = now
+        self._count('syncs')
+
+    def _retry_after(self, state, now, window):
+        """Seconds until the weighted count drops enough for one more request"""
+        window_end = (window + 1) * self.window_seconds
+        current = state['current'] + state['pending']
+        if state['previous'] and current + 1 <= self.limit:
+            # The previous window's share shrinks linearly until it ends
+            needed = 1 - (self.limit - 1 - current) / state['previous']
+            wait = window_end - self.window_seconds + needed * self.window_seconds - now
+        else:
+            # Wait for this window to become the previous one and decay
+            needed = 1 - (self.limit - 1) / current if current else 0
+            wait = window_end + max(0.0, needed) * self.window_seconds - now
+        return max(1, int(wait + 0.999))
+
+    def _count(self, name):
+        if self.metrics:
+            self.metrics.count(f"ratelimit.{self.name}.{name}")
@@ -0,0 +1,145 @@
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+# Reviewers identify themselves with this header unless an authorizer
+# already did (see reviewer_id)
+REVIEWER_HEADER = 'X-Reviewer'
+
+# A claimed item goes back to the pool if it isn't decided within this
+LEASE_SECONDS = int(os.getenv('REVIEW_LEASE_SECONDS', '600'))
+
+MAX_CLAIM = 25
+
+PENDING = 'PENDING_REVIEW'
+
+
+def reviewer_id(event):
+    """Authorizer identity if there is one, else the X-Reviewer header; None if neither"""
+    claims = ((event.get('requestContext') or {}).get('authorizer') or {}).get('claims') or {}
+    reviewer = claims.get('email') or claims.get('sub')
+    if not reviewer:
+        for key, value in (event.get('headers') or {}).items():
+            if key.lower() == REVIEWER_HEADER.lower():
+                reviewer = value
+    reviewer = (reviewer or '').strip()[:64]
+    return reviewer or None
+
+
+def lease_live(item, now=None):
+    now = time.time() if now is None else now
+    return bool(item.get('lease_owner')) and float(item.get('lease_expires', 0)) > now
+
+
+def held_by(item, reviewer, now=None):
+    return lease_live(item, now) and item.get('lease_owner') == reviewer
+
+
+def held_by_other(item, reviewer, now=None):
+    return lease_live(item, now) and item.get('lease_owner') != reviewer
+
+
+def pending_pages(review_table, page_size):
+    """Pending items, oldest first, with just what leasing needs, page_size at a time"""
+    kwargs = {
+        'IndexName': 'status-index',
+        'KeyConditionExpression': '#status = :status',
+        'ExpressionAttributeNames': {'#status': 'status'},
+        'ExpressionAttributeValues': {':status': PENDING},
+        'ProjectionExpression': 'submission_id, created_at, lease_owner, lease_expires',
+        'ScanIndexForward': True,
+        'Limit': page_size
+    }
+    while True:
+        response = review_table.query(**kwargs)
+        yield response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            return
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def _lease(review_table, submission_id, reviewer, now, expires):
+    """
+    Take or renew the lease on one item. The condition is checked against
+    the table, not the (eventually consistent) index the candidate came
+    from, so two reviewers can never both win the same item.
+    """
+    try:
+        review_table.update_item(
+            Key={'submission_id': submission_id},
+            UpdateExpression='SET lease_owner = :me, lease_expires = :expires',
+            ConditionExpression='#status = :pending AND (attribute_not_exists(lease_expires) OR '
+                                'lease_expires < :now OR lease_owner = :me)',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':me': reviewer,
+                ':expires': expires,
+                ':now': int(now),
+                ':pending': PENDING
+            }
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+
+def claim(review_table, reviewer, n, now=None):
+    """
+    Lease up to n pending items to reviewer, oldest first, counting the
+    ones it already holds (those are renewed first within each page) and
+    taking unleased or expired ones. Reads the queue a page at a time and
+    stops once n are won. Returns (claimed submission_ids, lease expiry,
+    items lost to other reviewers on the way).
+    """
+    now = time.time() if now is None else now
+    expires = int(now) + LEASE_SECONDS
+    claimed = []
+    conflicts = 0
+    for items in pending_pages(review_table, max(2 * n, MAX_CLAIM)):
+        own = [item for item in items if held_by(item, reviewer, now)]
+        free = [item for item in items if not lease_live(item, now)]
+        for item in own + free:
+            if len(claimed) >= n:
+                break
+            if _lease(review_table, item['submission_id'], reviewer, now, expires):
+                claimed.append(item['submission_id'])
+            else:
+                conflicts += 1
+        if len(claimed) >= n:
+            break
+    return claimed, expires, conflicts
+
+
+def resolve(review_table, submission_id, reviewer, status, resolved_at, now=None):
+    """
+    Record the decision on a review item, ending its lease. Only a pending
+    item that nobody else holds a live lease on can be resolved, or one
+    reviewer already resolved with the same decision (a retried request).
+    Returns False if the condition failed.
+    """
+    now = time.time() if now is None else now
+    try:
+        review_table.update_item(
+            Key={'submission_id': submission_id},
+            UpdateExpression='SET #status = :status, resolved_at = :resolved_at, resolved_by = :me '
+                             'REMOVE lease_owner, lease_expires',
+            ConditionExpression='(#status = :pending AND (attribute_not_exists(lease_owner) OR '
+                                'lease_owner = :me OR lease_expires < :now)) OR '
+                                '(#status = :status AND resolved_by = :me)',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':status': status,
+                ':resolved_at': resolved_at,
+                ':me': reviewer,
+                ':now': int(now),
+                ':pending': PENDING
+            }
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
@@ -0,0 +1,161 @@
+import hashlib
+import math
+import zlib
+from array import array
+
+# Fixed-size summaries for streams of strings. Each one can be merged with
+# another of the same shape and packed to a few kilobytes, so per-batch
+# deltas can be folded into a checkpoint however much traffic there is.
+
+
+def hash64(value):
+    """Stable 64-bit hash of a string (Python's hash() is salted per process)"""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def pack(values):
+    return zlib.compress(values.tobytes())
+
+
+def unpack(typecode, data):
+    values = array(typecode)
+    values.frombytes(zlib.decompress(data))
+    return values
+
+
+class CountMinSketch:
+    """
+    Approximate per-item counts in depth * width counters. Estimates never
+    undercount; with width w they overcount by at most e/w of the total
+    with probability 1 - e^-depth.
+    """
+
+    def __init__(self, width=2048, depth=4, counts=None, total=0):
+        self.width = width
+        self.depth = depth
+        self.counts = counts if counts is not None else array('Q', bytes(8 * width * depth))
+        self.total = total
+
+    def _cells(self, item):
+        h = hash64(item)
+        h1, h2 = h & 0xFFFFFFFF, h >> 32
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, item, count=1):
+        for cell in self._cells(item):
+            self.counts[cell] += count
+        self.total += count
+
+    def estimate(self, item):
+        return min(self.counts[cell] for cell in self._cells(item))
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError('Count-Min sketches of different shapes')
+        for i, value in enumerate(other.counts):
+            if value:
+                self.counts[i] += value
+        self.total += other.total
+
+    def to_dict(self):
+        return {'width': self.width, 'depth': self.depth, 'total': self.total, 'counts': pack(self.counts)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['width'], data['depth'], unpack('Q', data['counts']), data['total'])
+
+
+class SpaceSaving:
+    """
+    Top-k heavy hitters in k counters. Each kept item has a count that
+    overestimates its true count by at most its error; any item seen
+    more than total/k times is guaranteed to be kept.
+    """
+
+    def __init__(self, k=100, counters=None, total=0):
+        self.k = k
+        self.counters = counters if counters is not None else {}  # item -> [count, error]
+        self.total = total
+
+    def add(self, item, count=1):
+        self.total += count
+        if item in self.counters:
+            self.counters[item][0] += count
+        elif len(self.counters) < self.k:
+            self.counters[item] = [count, 0]
+        else:
+            # Replace the smallest counter; its count becomes the newcomer's error
+            victim = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(victim)[0]
+            self.counters[item] = [floor + count, floor]
+
+    def _floor(self):
+        """What an unkept item may have had: 0 unless every counter is in use"""
+        if len(self.counters) < self.k:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def merge(self, other):
+        """Mergeable summaries merge: add counts, charging absent items the other side's floor"""
+        mine, theirs = self._floor(), other._floor()
+        merged = {}
+        for item in set(self.counters) | set(other.counters):
+            count_a, error_a = self.counters.get(item, (mine, mine))
+            count_b, error_b = other.counters.get(item, (theirs, theirs))
+            merged[item] = [count_a + count_b, error_a + error_b]
+        kept = sorted(merged.items(), key=lambda kv: -kv[1][0])[:self.k]
+        self.counters = {item: counts for item, counts in kept}
+        self.total += other.total
+
+    def top(self, n=10):
+        """[(item, count, error)] largest first"""
+        ranked = sorted(self.counters.items(), key=lambda kv: -kv[1][0])[:n]
+        return [(item, count, error) for item, (count, error) in ranked]
+
+    def to_dict(self):
+        return {'k': self.k, 'total': self.total, 'counters': [[item, c, e] for item, (c, e) in self.counters.items()]}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['k'], {item: [c, e] for item, c, e in data['counters']}, data['total'])
+
+
+class HyperLogLog:
+    """
+    Distinct count in 2^precision one-byte registers; standard error is
+    about 1.04 / sqrt(2^precision), 1.6% at the default precision 12.
+    Adding the same item twice changes nothing, so replays are harmless.
+    """
+
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        self.registers = registers if registers is not None else bytearray(1 << precision)
+
+    def add(self, item):
+        h = hash64(item)
+        index = h >> (64 - self.precision)
+        rest = (h << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = (64 - self.precision + 1) if rest == 0 else (64 - rest.bit_length() + 1)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))  # Linear counting for small sets
+        return round(raw)
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError('HyperLogLogs of different precision')
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def to_dict(self):
+        return {'precision': self.precision, 'registers': zlib.compress(bytes(self.registers))}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['precision'], bytearray(zlib.decompress(data['registers'])))
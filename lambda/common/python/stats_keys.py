@@ -0,0 +1,43 @@
+import os
+from datetime import timedelta, timezone
+
+STATS_TABLE = os.getenv('STATS_TABLE')
+
+# Counter items, all in the stats table under stat_id:
+#   all                   totals since the table was created
+#   day#YYYY-MM-DD        one item per UTC day
+#   hour#YYYY-MM-DDTHH    one item per UTC hour
+# Each holds the counter attributes below plus label:<name> per label.
+TOTALS = 'all'
+
+APPROVED = 'APPROVED'
+REJECTED = 'REJECTED'
+REVIEW = 'REVIEW'
+ADMIN_APPROVED = 'ADMIN_APPROVED'
+ADMIN_REJECTED = 'ADMIN_REJECTED'
+COUNTERS = (APPROVED, REJECTED, REVIEW, ADMIN_APPROVED, ADMIN_REJECTED)
+
+# Kept on the totals item only: items waiting in the review queue
+PENDING_REVIEW = 'pending_review'
+
+LABEL_PREFIX = 'label:'
+
+
+def day_key(moment):
+    return f"day#{moment.astimezone(timezone.utc):%Y-%m-%d}"
+
+
+def hour_key(moment):
+    return f"hour#{moment.astimezone(timezone.utc):%Y-%m-%dT%H}"
+
+
+def bucket_keys(moment):
+    """Every counter item an event at this moment adds to"""
+    return [TOTALS, day_key(moment), hour_key(moment)]
+
+
+def recent_keys(now, days=7, hours=24):
+    """Fixed set of items GET /admin/stats reads, newest first"""
+    day_keys = [day_key(now - timedelta(days=d)) for d in range(days)]
+    hour_keys = [hour_key(now - timedelta(hours=h)) for h in range(hours)]
+    return day_keys, hour_keys
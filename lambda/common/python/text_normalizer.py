@@ -0,0 +1,106 @@
+import re
+import unicodedata
+
+# Canonical form of submitted text for hashing and matching, so case,
+# invisible characters, look-alike letters, leetspeak and stretched words
+# don't make content new. Never shown or sent to Comprehend: it folds
+# Cyrillic and Greek letters into Latin and rewrites digits inside words.
+
+# Dropped outright: zero-width and bidi controls, soft hyphens, variation
+# selectors, stray combining marks (left over from NFKC, e.g. zalgo text)
+# and non-whitespace control characters
+INVISIBLE = (
+    [0x00AD, 0x034F, 0x061C, 0x115F, 0x1160, 0x17B4, 0x17B5, 0x180E, 0x3164, 0xFEFF, 0xFFA0]
+    + list(range(0x0300, 0x0370))
+    + list(range(0x200B, 0x2010))
+    + list(range(0x202A, 0x202F))
+    + list(range(0x2060, 0x2070))
+    + list(range(0xFE00, 0xFE10))
+    + list(range(0x00, 0x09)) + list(range(0x0E, 0x20)) + [0x7F]
+)
+
+# Lowercase letters from other scripts that pass for Latin ones
+HOMOGLYPHS = {
+    # Cyrillic
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o', 'р': 'p',
+    'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'ѕ': 's', 'і': 'i', 'ї': 'i', 'ј': 'j', 'ԁ': 'd',
+    'ԛ': 'q', 'ԝ': 'w', 'һ': 'h', 'ӏ': 'l', 'ь': 'b', 'г': 'r', 'п': 'n',
+    # Greek
+    'α': 'a', 'β': 'b', 'γ': 'y', 'ε': 'e', 'η': 'n', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o',
+    'ρ': 'p', 'τ': 't', 'υ': 'u', 'χ': 'x', 'ω': 'w', 'ς': 's',
+    # Latin letters without a decomposition
+    'ø': 'o', 'đ': 'd', 'ł': 'l', 'ħ': 'h', 'ı': 'i', 'ƅ': 'b', 'ɡ': 'g', 'ɑ': 'a', 'ꞵ': 'b',
+    'æ': 'ae', 'œ': 'oe', 'ŀ': 'l',
+    # Punctuation variants
+    '‘': "'", '’': "'", '‚': "'", '‛': "'", '′': "'", '`': "'", '´': "'",
+    '“': '"', '”': '"', '„': '"', '‟': '"', '″': '"', '«': '"', '»': '"',
+    '‐': '-', '‑': '-', '‒': '-', '–': '-', '—': '-', '―': '-', '−': '-',
+}
+
+
+def _fold_table():
+    """One str.translate table: invisibles, homoglyphs and accented Latin letters"""
+    table = dict.fromkeys(INVISIBLE)
+    # é, ñ, ŵ ... -> their base letter; decomposed once here instead of per text
+    for code in range(0x00C0, 0x0250):
+        base = unicodedata.normalize('NFD', chr(code))[0]
+        if base != chr(code) and base.isascii() and base.isalpha():
+            table[code] = base.lower()
+    table.update({ord(char): target for char, target in HOMOGLYPHS.items()})
+    return table
+
+
+FOLD = _fold_table()
+
+# FOLD restricted to ASCII, for bytes.translate: most submissions are
+# ASCII, and the bytes table is several times faster than the dict one
+ASCII_FOLD = bytes.maketrans(b'`', b"'")
+ASCII_DROP = bytes(code for code in INVISIBLE if code < 0x80)
+
+# Digits and symbols standing in for letters, inside words only
+LEET = str.maketrans({'0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '8': 'b', '9': 'g',
+                      '@': 'a', '$': 's'})
+# A leet character next to a letter; most text has none and skips
+# LEET_WORD. Patterns here start with a character class and look behind
+# afterwards, so sre can scan for the class instead of trying every position
+LEET_MIXED = re.compile(r"[0-9@$](?:(?<=[a-z].)|(?=[a-z]))")
+
+# A run of word characters with a letter and either @/$ or digits between
+# letters (h3ll0, n00b, $pam). Digits only at an edge are part of a name or
+# number (mp3, ipv4, 4x4, covid19), and plain numbers and words are left alone
+LEET_WORD = re.compile(r"(?<![\w@$])(?=[\w@$]*[a-z])(?=[\w@$]*(?:[@$]|[a-z][0-9]+[a-z]))[\w@$]+")
+# ! and | between letters: sh!t, k|ll
+LEET_INNER = re.compile(r"[!|](?<=[a-z].)[!|]*(?=[a-z])")
+# Letters spelled out with separators: s.p.a.m, f-r-e-e, c_a_s_h
+SPACED_LETTERS = re.compile(r"(?<![a-z])[a-z](?:[._*\-][a-z]){2,}(?![a-z])")
+SPACED_HINT = re.compile(r"[._*\-][a-z][._*\-]")
+SEPARATORS = re.compile(r"[._*\-]")
+# Stretched words: sooooo, !!!!! -> two of them. Letters and punctuation
+# only: digit runs are amounts, years and phone numbers (1000 is not 100).
+# \1\1+ rather than \1{2,}, which sre searches at half the speed; any
+# run at all is rare, and looking for one is cheaper than for REPEATS
+REPEATS = re.compile(r"([^\d\s_])\1\1+")
+RUN_HINT = re.compile(r"(.)\1\1")
+
+
+def normalize(text):
+    """
+    Canonical form of text: equal for text that only differs in
+    obfuscation. Each rewrite is skipped when a cheap search shows it has
+    nothing to do, which is the common case.
+    """
+    if not text:
+        return ''
+    if text.isascii():
+        text = text.lower().encode('ascii').translate(ASCII_FOLD, ASCII_DROP).decode('ascii')
+    else:
+        text = unicodedata.normalize('NFKC', text).casefold().translate(FOLD)
+    if LEET_MIXED.search(text):
+        text = LEET_WORD.sub(lambda match: match.group().translate(LEET), text)
+    text = LEET_INNER.sub('i', text)
+    if SPACED_HINT.search(text):
+        text = SPACED_LETTERS.sub(lambda match: SEPARATORS.sub('', match.group()), text)
+    if RUN_HINT.search(text):
+        text = REPEATS.sub(r'\1\1', text)
+    # str.split() splits on every Unicode space, like \s+
+    return ' '.join(text.split())
@@ -0,0 +1,136 @@
+import base64
+import json
+import os
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+from sketches import CountMinSketch, HyperLogLog, SpaceSaving
+
+ANALYTICS_BUCKET = os.getenv('ANALYTICS_BUCKET')
+
+# Checkpoints in the analytics bucket: one running since the start, one per UTC day
+TOTAL_CHECKPOINT = 'sketches/all.json'
+
+FORMAT_VERSION = 1
+
+
+def day_checkpoint(moment):
+    return f"sketches/day/{moment.astimezone(timezone.utc):%Y-%m-%d}.json"
+
+
+def _encode(data):
+    return {k: base64.b64encode(v).decode('ascii') if isinstance(v, bytes) else v for k, v in data.items()}
+
+
+def _decode(data, binary_field):
+    return {k: base64.b64decode(v) if k == binary_field else v for k, v in data.items()}
+
+
+class TrafficSketches:
+    """
+    What the traffic looks like, in bounded memory:
+      labels    Count-Min counts and Space-Saving top-k of Rekognition labels
+      mixes     Space-Saving top-k of text sentiment + final decision pairs
+      contents  HyperLogLog of distinct text contents
+    """
+
+    def __init__(self, label_counts=None, top_labels=None, top_mixes=None, contents=None,
+                 records=0, updated_at=None):
+        self.label_counts = label_counts or CountMinSketch()
+        self.top_labels = top_labels or SpaceSaving(k=100)
+        self.top_mixes = top_mixes or SpaceSaving(k=50)
+        self.contents = contents or HyperLogLog()
+        self.records = records
+        self.updated_at = updated_at
+
+    def add(self, labels=(), mix=None, content_hash=None):
+        self.records += 1
+        for label in labels:
+            self.label_counts.add(label)
+            self.top_labels.add(label)
+        if mix:
+            self.top_mixes.add(mix)
+        if content_hash:
+            self.contents.add(content_hash)
+
+    def merge(self, other):
+        self.label_counts.merge(other.label_counts)
+        self.top_labels.merge(other.top_labels)
+        self.top_mixes.merge(other.top_mixes)
+        self.contents.merge(other.contents)
+        self.records += other.records
+
+    def summary(self, n=10):
+        return {
+            'records': self.records,
+            'updated_at': self.updated_at,
+            'distinct_contents': self.contents.estimate(),
+            'top_labels': [
+                {'label': label, 'count': count, 'max_error': error, 'cms_estimate': self.label_counts.estimate(label)}
+                for label, count, error in self.top_labels.top(n)
+            ],
+            'top_mixes': [
+                {'mix': mix, 'count': count, 'max_error': error}
+                for mix, count, error in self.top_mixes.top(n)
+            ]
+        }
+
+    def to_bytes(self):
+        return json.dumps({
+            'version': FORMAT_VERSION,
+            'records': self.records,
+            'updated_at': datetime.now(timezone.utc).isoformat(),
+            'label_counts': _encode(self.label_counts.to_dict()),
+            'top_labels': self.top_labels.to_dict(),
+            'top_mixes': self.top_mixes.to_dict(),
+            'contents': _encode(self.contents.to_dict())
+        }, separators=(',', ':')).encode('utf-8')
+
+    @classmethod
+    def from_bytes(cls, data):
+        state = json.loads(data)
+        return cls(
+            CountMinSketch.from_dict(_decode(state['label_counts'], 'counts')),
+            SpaceSaving.from_dict(state['top_labels']),
+            SpaceSaving.from_dict(state['top_mixes']),
+            HyperLogLog.from_dict(_decode(state['contents'], 'registers')),
+            state['records'],
+            state.get('updated_at')
+        )
+
+
+def load(s3, key, bucket=ANALYTICS_BUCKET):
+    """(TrafficSketches, ETag); empty sketches and None if there's no checkpoint yet"""
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return TrafficSketches(), None
+        raise
+    return TrafficSketches.from_bytes(obj['Body'].read()), obj['ETag']
+
+
+def merge_into(s3, key, delta, bucket=ANALYTICS_BUCKET, max_attempts=5):
+    """
+    Fold delta into the checkpoint at key with a conditional PUT on the
+    ETag that was read (or on the key not existing), re-reading and
+    re-merging if another writer got there first.
+    """
+    for _ in range(max_attempts):
+        current, etag = load(s3, key, bucket)
+        current.merge(delta)
+        condition = {'IfMatch': etag} if etag else {'IfNoneMatch': '*'}
+        try:
+            s3.put_object(
+                Bucket=bucket,
+                Key=key,
+                Body=current.to_bytes(),
+                ContentType='application/json',
+                **condition
+            )
+            return current
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise
+    raise RuntimeError(f"Checkpoint {key} kept changing underneath us")
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import re
+
+from botocore.exceptions import ClientError
+
+from ttl_cache import TTLCache
+
+UPLOAD_PREFIX = 'uploads/'
+
+# Review thumbnails: thumbs/<2 hex>/<submission_id><ext>
+THUMB_PREFIX = 'thumbs/'
+
+# submission: uploads/<2 hex of sha256(submission_id)>/<submission_id>/<filename>
+# content:    uploads/<2 hex>/<2 hex>/sha256-<hex digest><ext>, for clients that
+#             declare the image's SHA-256 (S3 verifies it on upload)
+UPLOAD_KEY_SCHEME = os.getenv('UPLOAD_KEY_SCHEME', 'submission')
+
+# Keys written before hashed prefixes: uploads/YYYYmmdd-HHMMSS-<filename>
+LEGACY_KEY = re.compile(r'^uploads/\d{8}-\d{6}-[^/]+$')
+
+# Metadata the migration leaves on a legacy key once its object has moved
+MOVED_TO = 'moved-to'
+
+SHA256_HEX = re.compile(r'^[0-9a-f]{64}$')
+
+# What a submission_id may be, since it is a key segment (upload_key,
+# thumb_key); generated ones are UUIDs
+SUBMISSION_ID = re.compile(r'^[A-Za-z0-9_-]{1,80}$')
+
+# Keys made by content_key(), which any number of submissions may share
+CONTENT_KEY = re.compile(r'^uploads/([0-9a-f]{2})/([0-9a-f]{2})/sha256-\1\2[0-9a-f]{60}(\.[A-Za-z0-9_-]*)?$')
+
+_resolved = TTLCache(maxsize=5000)
+
+
+def safe_filename(filename):
+    """Last path segment, limited to characters that need no escaping in keys"""
+    name = re.sub(r'[^A-Za-z0-9._-]+', '-', os.path.basename(filename or '')).strip('-.')
+    return name[-100:] or 'image'
+
+
+def valid_submission_id(submission_id):
+    return isinstance(submission_id, str) and bool(SUBMISSION_ID.match(submission_id))
+
+
+def partition(value):
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()[:2]
+
+
+def upload_key(submission_id, filename):
+    """
+    Spreads uploads over 256 prefixes so S3 can scale each one, and
+    never collides: the submission_id is unique.
+    """
+    return f"{UPLOAD_PREFIX}{partition(submission_id)}/{submission_id}/{safe_filename(filename)}"
+
+
+def content_key(sha256_hex, filename):
+    """Same image, same key; the caller must make S3 verify the checksum"""
+    _, ext = os.path.splitext(safe_filename(filename))
+    return f"{UPLOAD_PREFIX}{sha256_hex[:2]}/{sha256_hex[2:4]}/sha256-{sha256_hex}{ext.lower()}"
+
+
+def thumb_key(submission_id, ext):
+    return f"{THUMB_PREFIX}{partition(submission_id)}/{submission_id}{ext}"
+
+
+def submission_id_from_key(key):
+    """The submission a submission-scheme key belongs to, else None"""
+    if CONTENT_KEY.match(key):
+        return None
+    parts = key[len(UPLOAD_PREFIX):].split('/') if key.startswith(UPLOAD_PREFIX) else []
+    if len(parts) == 3 and len(parts[0]) == 2 and partition(parts[1]) == parts[0]:
+        return parts[1]
+    return None
+
+
+def is_legacy(key):
+    return bool(key) and bool(LEGACY_KEY.match(key))
+
+
+def resolve(s3, bucket, key):
+    """
+    Where the image for key lives now. Only legacy keys can have moved,
+    so every other key is returned without a request.
+    """
+    if not is_legacy(key):
+        return key
+    cached = _resolved.get(key)
+    if cached is not None:
+        return cached
+    try:
+        metadata = s3.head_object(Bucket=bucket, Key=key).get('Metadata', {})
+    except ClientError as e:
+        print(f"Could not resolve {key}: {str(e)}")
+        return key
+    current = metadata.get(MOVED_TO) or key
+    # A move is final; a key that hasn't moved yet may move at any time
+    _resolved.set(key, current, ttl=None if current != key else 60)
+    return current
@@ -0,0 +1,23 @@
+import os
+from urllib.parse import quote, unquote
+
+# User metadata the presigned POST puts on an upload; S3 returns it
+# lowercased and without the x-amz-meta- prefix from head_object
+SUBMISSION_ID = 'submission-id'
+TEXT = 'text'
+
+# S3 allows 2 KB of user metadata in total; keep the text well inside it
+MAX_TEXT_BYTES = 1800
+
+# Rekognition reads images of up to 15 MB from S3
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_BYTES', str(15 * 1000 * 1000)))
+
+
+def encode_text(text):
+    """Metadata values must be ASCII; None if the encoded text doesn't fit"""
+    encoded = quote(text or '', safe='')
+    return encoded if len(encoded) <= MAX_TEXT_BYTES else None
+
+
+def decode_text(value):
+    return unquote(value or '')
@@ -1,15 +1,29 @@
+import hashlib
 import json
-import boto3
 import os
 from datetime import datetime
 import logging
+from instrumentation import Metrics
+from deadline import Deadline, client, resource
+import dedupe
+import outbox
 
-dynamodb = boto3.resource('dynamodb')
-sns_client = boto3.client('sns')
+metrics = Metrics('decision_handler')
+
+# immediate: one email per REVIEW item, through the outbox
+# digest: no email per item; review_digest summarizes the queue on a schedule
+NOTIFICATION_MODE = os.getenv('NOTIFICATION_MODE', 'immediate')
 
 logger = logging.getLogger(__name__)  
 logger.setLevel(logging.INFO)
 
+def text_hash(text):
+    """Hash of the text with case and whitespace normalized, for distinct-content analytics"""
+    if not text:
+        return None
+    return hashlib.sha256(dedupe.normalize_text(text).encode('utf-8')).hexdigest()
+
+@metrics.handler
 def lambda_handler(event, context):
     """
     Receives array of [text_result, image_result] from parallel tasks
@@ -24,6 +38,7 @@ def lambda_handler(event, context):
         submission_id = event.get('submission_id')
         text = event.get('text')
         image_key = event.get('image_key')
+        content_hash = event.get('content_hash')
         logger.info("Moderation Results: %s", moderation_results)
         logger.info(
             "text: %s image_key: %s submissionId: %s",
@@ -31,80 +46,96 @@ def lambda_handler(event, context):
             image_key,
             submission_id
         )       
+        deadline = Deadline(context)
+        dynamodb = resource('dynamodb', deadline)
         approved_table = dynamodb.Table(os.getenv('APPROVED_TABLE'))
         review_table = dynamodb.Table(os.getenv('REVIEW_TABLE'))
         rejected_table = dynamodb.Table(os.getenv('REJECTED_TABLE'))
-        notification_topic = os.getenv('ADMIN_NOTIFICATION_TOPIC')
         
-        # Parse results
-        text_result = None
-        image_result = None
+        with metrics.stage('decision'):
+            # Parse results
+            text_result = None
+            image_result = None
+        
+            for result in moderation_results:
+                if result.get('type') == 'text':
+                    text_result = result
+                elif result.get('type') == 'image':
+                    image_result = result
         
-        for result in moderation_results:
-            if result.get('type') == 'text':
-                text_result = result
-            elif result.get('type') == 'image':
-                image_result = result
+            # Determine overall decision
+            has_reject = False
+            has_ambiguous = False
         
-        # Determine overall decision
-        has_reject = False
-        has_ambiguous = False
+            if text_result and not text_result.get('skipped'):
+                if text_result.get('decision') == 'REJECT':
+                    has_reject = True
+                elif text_result.get('decision') == 'AMBIGUOUS':
+                    has_ambiguous = True
         
-        if text_result and not text_result.get('skipped'):
-            if text_result.get('decision') == 'REJECT':
-                has_reject = True
-            elif text_result.get('decision') == 'AMBIGUOUS':
-                has_ambiguous = True
+            if image_result and not image_result.get('skipped'):
+                if image_result.get('decision') == 'REJECT':
+                    has_reject = True
+                elif image_result.get('decision') == 'AMBIGUOUS':
+                    has_ambiguous = True
         
-        if image_result and not image_result.get('skipped'):
-            if image_result.get('decision') == 'REJECT':
-                has_reject = True
-            elif image_result.get('decision') == 'AMBIGUOUS':
-                has_ambiguous = True
+            timestamp = datetime.now().isoformat()
         
-        timestamp = datetime.now().isoformat()
+            if has_reject:
+                final_decision = 'REJECT'
+            elif has_ambiguous:
+                final_decision = 'REVIEW'
+            else:
+                final_decision = 'APPROVE'
         
-        if has_reject:
-            final_decision = 'REJECT'
-        elif has_ambiguous:
-            final_decision = 'REVIEW'
-        else:
-            final_decision = 'APPROVE'
+            moderation_details = json.dumps({
+                'text_decision': text_result.get('decision') if text_result else None,
+                'text_sentiment': text_result.get('sentiment') if text_result else None,
+                'text_near_duplicate_of': text_result.get('near_duplicate_of') if text_result else None,
+                'text_language': text_result.get('language') if text_result else None,
+                'image_decision': image_result.get('decision') if image_result else None,
+                'image_labels': image_result.get('labels') if image_result else [],
+                'image_known_bad': bool(image_result and image_result.get('known_bad')),
+                # Raw scores, so tools/threshold_simulator.py can replay other thresholds
+                'text_source': text_result.get('source') if text_result else None,
+                'text_scores': text_result.get('confidence_scores') if text_result else None,
+                'image_max_confidence': image_result.get('max_confidence') if image_result else None
+            })
+            content_text_hash = text_hash(text)
         
         
+
+        # Follow-ups travel with the decision in its one write (see outbox)
+        effects = []
+        if content_hash and dedupe.enabled():
+            # Identical submissions within the dedupe window get this decision
+            effects.append(outbox.record_dedupe(content_hash, final_decision))
+        if text_result and text_result.get('simhash') and text_result.get('source') == 'comprehend':
+            # Later near-duplicates of this text reuse its text decision;
+            # local and reused decisions aren't passed on
+            effects.append(outbox.near_dup(text_result['simhash'], text_result['decision'], text_result['sentiment']))
+
         # Save based on decision
         if final_decision == 'APPROVE':
             approved_table.put_item(
-                Item={
+                Item=outbox.attach({
                     'submission_id': submission_id,
                     'status': 'APPROVED',
                     'text': text or '',
                     'image_key': image_key or '',
                     'approved_at': timestamp,
+                    'moderation_details': moderation_details,
+                    'text_hash': content_text_hash,
                     'ttl': int(datetime.now().timestamp()) + (86400 * 30 * 12)
-                }
+                }, effects)
             )
         
         elif final_decision == 'REVIEW':
-            review_table.put_item(
-                Item={
-                    'submission_id': submission_id,
-                    'status': 'PENDING_REVIEW',
-                    'text': text or '',
-                    'image_key': image_key or '',
-                    'created_at': timestamp,
-                    'moderation_details': json.dumps({
-                        'text_decision': text_result.get('decision') if text_result else None,
-                        'text_sentiment': text_result.get('sentiment') if text_result else None,
-                        'image_decision': image_result.get('decision') if image_result else None,
-                        'image_labels': image_result.get('labels') if image_result else []
-                    }),
-                    'ttl': int(datetime.now().timestamp()) + (86400 * 30)
-                }
-            )
-            
-            # Send admin notification
-            message = f"""
+            effects.append(outbox.bump_queue())
+            if image_key:
+                effects.append(outbox.thumbnail(image_key))
+            if NOTIFICATION_MODE == 'immediate':
+                message = f"""
 New content requires admin review:
 
 Submission ID: {submission_id}
@@ -119,32 +150,38 @@ Please review on Admin Dashboard!
 
 Admin Dashboard Link: http://amit-moderation-admin-frontend.s3-website-eu-west-1.amazonaws.com/
             """
-            
-            sns_client.publish(
-                TopicArn=notification_topic,
-                Subject='Content Requires Review',
-                Message=message
+                effects.append(outbox.notify('Content Requires Review', message))
+
+            review_table.put_item(
+                Item=outbox.attach({
+                    'submission_id': submission_id,
+                    'status': 'PENDING_REVIEW',
+                    'text': text or '',
+                    'image_key': image_key or '',
+                    'created_at': timestamp,
+                    'moderation_details': moderation_details,
+                    'text_hash': content_text_hash,
+                    'content_hash': content_hash,
+                    'ttl': int(datetime.now().timestamp()) + (86400 * 30)
+                }, effects)
             )
         elif final_decision == 'REJECT':
             rejected_table.put_item(
-                Item={
+                Item=outbox.attach({
                     'submission_id': submission_id,
                     'status': 'REJECTED',
                     'rejected_at': timestamp,
-                    'moderation_details': json.dumps({
-                        'text_decision': text_result.get('decision') if text_result else None,
-                        'text_sentiment': text_result.get('sentiment') if text_result else None,
-                        'image_decision': image_result.get('decision') if image_result else None,
-                        'image_labels': image_result.get('labels') if image_result else []
-                    }),
+                    'moderation_details': moderation_details,
+                    'text_hash': content_text_hash,
                     'ttl': int(datetime.now().timestamp()) + (86400 * 7)
-                }
+                }, effects)
             )
         
         # Return result to caller (via Step Functions)
         return {
             'submission_id': submission_id,
             'final_decision': final_decision,
+            'image_key': image_key,
             'timestamp': timestamp,
             'text_result': text_result,
             'image_result': image_result
@@ -152,8 +189,12 @@ Admin Dashboard Link: http://amit-moderation-admin-frontend.s3-website-eu-west-1
     
     except Exception as e:
         print(f"Decision handler error: {str(e)}")
+        if event.get('content_hash') and dedupe.enabled():
+            # Let the next identical submission be moderated instead of pointing at this one
+            dedupe.release(client('dynamodb', Deadline(context)), event['content_hash'], event.get('submission_id'))
         return {
             'submission_id': event.get('submission_id'),
             'final_decision': 'ERROR',
+            'image_key': event.get('image_key'),
             'error': str(e)
         }
@@ -1,141 +1,411 @@
+import hashlib
 import json
-import boto3
 import os
+import random
+import time
+from instrumentation import Metrics
+from deadline import Deadline, client, is_timeout, resource
+from ttl_cache import TTLCache
+import dedupe
 
-dynamodb = boto3.resource('dynamodb')
+metrics = Metrics('get_status')
 
+# Approved/rejected never change, so they stay until evicted. Pending and
+# not-found can change at any moment and are only kept for a few seconds.
+status_cache = TTLCache(maxsize=int(os.getenv('STATUS_CACHE_SIZE', '20000')))
+PENDING_TTL = 5
+NOT_FOUND_TTL = 2
+TERMINAL_STATUSES = ('approved', 'rejected')
+
+# Don't start a table read with less time than this left
+MIN_READ_MS = 300
+
+# POST /status/batch accepts at most this many ids
+MAX_BATCH_IDS = 100
+
+# BatchGetItem takes at most 100 keys per request, across all tables
+BATCH_GET_KEYS = 100
+
+# Only the attributes the status mapping reads
+STATUS_PROJECTION = 'submission_id, #status, approved_at, created_at, resolved_at, rejected_at'
+
+def response(status_code, body, headers=None):
+    return {
+        'statusCode': status_code,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': '*',
+            'Access-Control-Allow-Headers': '*',
+            **(headers or {})
+        },
+        'body': json.dumps(body)
+    }
+
+def resolve_status(submission_id, approved_item=None, review_item=None, rejected_item=None):
+    """
+    Maps whatever the three tables hold for one submission to (statusCode, body).
+    Precedence: approved table, then review table, then rejected table.
+    """
+    if approved_item:
+        return 200, {
+            'submission_id': submission_id,
+            'status': 'approved',
+            'approved_at': approved_item.get('approved_at')
+        }
+
+    if review_item:
+        status = review_item.get('status', 'PENDING_REVIEW')
+
+        if status == 'APPROVED':
+            return 200, {
+                'submission_id': submission_id,
+                'status': 'approved',
+                'approved_at': review_item.get('created_at'),
+                'reviewed_by': 'admin'
+            }
+        elif status == 'REJECTED':
+            return 200, {
+                'submission_id': submission_id,
+                'status': 'rejected',
+                'rejected_at': review_item.get('resolved_at')
+            }
+        else:  # PENDING_REVIEW
+            return 200, {
+                'submission_id': submission_id,
+                'status': 'pending',
+                'created_at': review_item.get('created_at')
+            }
+
+    if rejected_item:
+        return 200, {
+            'submission_id': submission_id,
+            'status': 'rejected',
+            'rejected_at': rejected_item.get('rejected_at')
+        }
+
+    # Not found
+    return 404, {
+        'submission_id': submission_id,
+        'status': 'Not Found',
+        'message': 'Please enter a valid submission id.'
+    }
+
+def cache_ttl(status_code, body):
+    """Seconds to cache a resolved status for; None means until evicted"""
+    if body.get('status') in TERMINAL_STATUSES:
+        return None
+    return NOT_FOUND_TTL if status_code == 404 else PENDING_TTL
+
+def cache_control(status_code, body):
+    if body.get('status') in TERMINAL_STATUSES:
+        return 'public, max-age=86400, immutable'
+    return f'public, max-age={NOT_FOUND_TTL if status_code == 404 else PENDING_TTL}'
+
+def etag(body):
+    digest = hashlib.sha1(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()
+    return f'"{digest[:20]}"'
+
+def request_header(event, name):
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+def status_response(event, status_code, body, cache_hit):
+    """
+    The ETag is a hash of the status record as served, so it changes
+    exactly when the record's status or timestamps do. A matching
+    If-None-Match gets an empty 304.
+    """
+    tag = etag(body)
+    headers = {
+        'Access-Control-Expose-Headers': 'ETag',
+        'Cache-Control': cache_control(status_code, body),
+        'ETag': tag,
+        'X-Cache': 'HIT' if cache_hit else 'MISS'
+    }
+    if status_code == 200 and request_header(event, 'If-None-Match') == tag:
+        metrics.count('not_modified')
+        not_modified = response(304, None, headers)
+        not_modified['body'] = ''
+        return not_modified
+    return response(status_code, body, headers)
+
+def remember(event, submission_id, status_code, body):
+    """Cache a freshly resolved status and build its response"""
+    status_cache.set(submission_id, (status_code, body), cache_ttl(status_code, body))
+    return status_response(event, status_code, body, cache_hit=False)
+
+def record_cache_metrics(hits, misses):
+    metrics.count('cache.hit', hits)
+    metrics.count('cache.miss', misses)
+    metrics.put('cache.size', len(status_cache), unit='Count')
+    metrics.set_property('CacheHitRate', round(status_cache.hit_rate(), 4))
+
+def degraded_body(submission_id):
+    return {
+        'submission_id': submission_id,
+        'status': 'pending',
+        'degraded': True,
+        'message': 'Status lookup is slow right now, please retry.'
+    }
+
+def degraded_response(submission_id):
+    """
+    Ran out of time before every table was checked. Report pending so
+    clients keep polling instead of seeing a Lambda timeout.
+    """
+    metrics.count('degraded')
+    return response(200, degraded_body(submission_id), {'Retry-After': '2'})
+
+def batch_get_items(dynamodb, table_names, submission_ids, deadline):
+    """
+    Reads every id from every table with BatchGetItem, 100 keys per request,
+    retrying UnprocessedKeys with jittered exponential backoff.
+    Returns ({table_name: {submission_id: item}}, ids that couldn't be read in time).
+    """
+    found = {name: {} for name in table_names}
+    pending = [(name, sid) for sid in submission_ids for name in table_names]
+    unfinished = set()
+
+    for start in range(0, len(pending), BATCH_GET_KEYS):
+        request_items = {}
+        for name, sid in pending[start:start + BATCH_GET_KEYS]:
+            request_items.setdefault(name, {
+                'Keys': [],
+                'ProjectionExpression': STATUS_PROJECTION,
+                'ExpressionAttributeNames': {'#status': 'status'}
+            })['Keys'].append({'submission_id': sid})
+
+        attempt = 0
+        while request_items:
+            result = None
+            if not deadline.expired(MIN_READ_MS):
+                try:
+                    result = dynamodb.batch_get_item(RequestItems=request_items)
+                except Exception as e:
+                    if not is_timeout(e):
+                        raise
+                    print(f"Batch status read timed out: {str(e)}")
+            if result is None:
+                for table_request in request_items.values():
+                    unfinished.update(key['submission_id'] for key in table_request['Keys'])
+                break
+
+            for name, items in result.get('Responses', {}).items():
+                for item in items:
+                    found[name][item['submission_id']] = item
+
+            request_items = result.get('UnprocessedKeys') or {}
+            if request_items:
+                metrics.count('batch.unprocessed_retries')
+                backoff = min(1.0, 0.05 * (2 ** attempt)) * random.uniform(0.5, 1.0)
+                time.sleep(min(backoff, deadline.remaining_ms() / 1000))
+                attempt += 1
+
+    return found, unfinished
+
+def batch_status(event, context):
+    """
+    POST /status/batch
+    Body: { submission_ids: [...] } (at most 100)
+    Returns { results: { submission_id: <same body as GET /status/{id}> } }
+    """
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except ValueError:
+        return response(400, {'error': 'Body must be a JSON object'})
+    if not isinstance(body, dict):
+        return response(400, {'error': 'Body must be a JSON object'})
+    submission_ids = body.get('submission_ids')
+
+    if not isinstance(submission_ids, list) or not submission_ids or \
+            not all(isinstance(sid, str) and sid for sid in submission_ids):
+        return response(400, {'error': 'submission_ids must be a non-empty list of ids'})
+
+    submission_ids = list(dict.fromkeys(submission_ids))
+    if len(submission_ids) > MAX_BATCH_IDS:
+        return response(400, {'error': f'At most {MAX_BATCH_IDS} submission_ids per request'})
+
+    results = {}
+    misses = []
+    for sid in submission_ids:
+        cached = status_cache.get(sid)
+        if cached is not None:
+            results[sid] = cached[1]
+        else:
+            misses.append(sid)
+    record_cache_metrics(len(submission_ids) - len(misses), len(misses))
+
+    deadline = Deadline(context)
+    approved_name = os.getenv('APPROVED_TABLE')
+    review_name = os.getenv('REVIEW_TABLE')
+    rejected_name = os.getenv('REJECTED_TABLE')
+
+    found, unfinished = {approved_name: {}, review_name: {}, rejected_name: {}}, set()
+    if misses:
+        found, unfinished = batch_get_items(
+            resource('dynamodb', deadline),
+            [approved_name, review_name, rejected_name],
+            misses,
+            deadline
+        )
+
+    not_found = []
+    for sid in misses:
+        approved_item = found[approved_name].get(sid)
+        if sid in unfinished and not approved_item:
+            # A higher-precedence table may not have been read yet
+            results[sid] = degraded_body(sid)
+            continue
+        status_code, results[sid] = resolve_status(
+            sid,
+            approved_item,
+            found[review_name].get(sid),
+            found[rejected_name].get(sid)
+        )
+        if status_code == 404:
+            not_found.append(sid)
+        else:
+            status_cache.set(sid, (status_code, results[sid]), cache_ttl(status_code, results[sid]))
+
+    # Direct uploads deduplicated into an earlier submission, as in the single GET
+    aliases = batch_aliases(deadline, not_found)
+    if aliases:
+        originals = list(dict.fromkeys(aliases.values()))
+        original_found, original_unfinished = batch_get_items(
+            resource('dynamodb', deadline),
+            [approved_name, review_name, rejected_name],
+            originals,
+            deadline
+        )
+        unfinished |= {sid for sid, original_id in aliases.items()
+                       if original_id in original_unfinished and original_id not in original_found[approved_name]}
+        for sid, original_id in aliases.items():
+            if sid in unfinished:
+                results[sid] = degraded_body(sid)
+                continue
+            status_code, body = resolve_status(
+                original_id,
+                original_found[approved_name].get(original_id),
+                original_found[review_name].get(original_id),
+                original_found[rejected_name].get(original_id)
+            )
+            if status_code != 404:
+                results[sid] = {**body, 'submission_id': sid, 'duplicate_of': original_id}
+                status_cache.set(sid, (status_code, results[sid]), cache_ttl(status_code, results[sid]))
+    # Ids that may be aliases (the lookup failed) or whose original isn't
+    # visible yet stay uncached, so the next GET looks again
+    for sid in not_found:
+        if aliases is not None and sid not in aliases:
+            status_cache.set(sid, (404, results[sid]), NOT_FOUND_TTL)
+
+    # Keep the caller's order
+    results = {sid: results[sid] for sid in submission_ids}
+
+    metrics.put('batch.size', len(submission_ids), unit='Count')
+    if unfinished:
+        metrics.count('degraded')
+    return response(200, {
+        'count': len(results),
+        'results': results,
+        'degraded': bool(unfinished)
+    })
+
+def read_status(deadline, submission_id):
+    """
+    Reads the three tables in precedence order, stopping at the first hit.
+    Returns (statusCode, body), or None if time ran out first.
+    """
+    # Check approved table
+    approved_table = resource('dynamodb', deadline).Table(os.getenv('APPROVED_TABLE'))
+    approved_response = approved_table.get_item(Key={'submission_id': submission_id})
+    if 'Item' in approved_response:
+        return resolve_status(submission_id, approved_item=approved_response['Item'])
+
+    # Check review table
+    if deadline.expired(MIN_READ_MS):
+        return None
+    review_table = resource('dynamodb', deadline).Table(os.getenv('REVIEW_TABLE'))
+    review_response = review_table.get_item(Key={'submission_id': submission_id})
+    if 'Item' in review_response:
+        return resolve_status(submission_id, review_item=review_response['Item'])
+
+    # Check rejected table
+    if deadline.expired(MIN_READ_MS):
+        return None
+    rejected_table = resource('dynamodb', deadline).Table(os.getenv('REJECTED_TABLE'))
+    rejected_response = rejected_table.get_item(Key={'submission_id': submission_id})
+
+    # Rejected, or not found
+    return resolve_status(submission_id, rejected_item=rejected_response.get('Item'))
+
+def read_alias(deadline, submission_id):
+    """
+    Status of a direct upload that upload_trigger deduplicated into an
+    earlier submission, reported under the id the client holds.
+    None if submission_id isn't an alias or time ran out.
+    """
+    if not dedupe.enabled() or deadline.expired(2 * MIN_READ_MS):
+        return None
+    original_id = dedupe.resolve_alias(client('dynamodb', deadline), submission_id)
+    if not original_id:
+        return None
+    result = read_status(deadline, original_id)
+    if result is None or result[0] == 404:
+        return None
+    return result[0], {**result[1], 'submission_id': submission_id, 'duplicate_of': original_id}
+
+def batch_aliases(deadline, submission_ids):
+    """
+    {submission_id: original_id} for the ids that are aliases (see
+    read_alias); None if that couldn't be checked in time
+    """
+    if not submission_ids or not dedupe.enabled():
+        return {}
+    if deadline.expired(2 * MIN_READ_MS):
+        return None
+    try:
+        return dedupe.resolve_aliases(client('dynamodb', deadline), submission_ids)
+    except Exception as e:
+        print(f"Batch alias lookup failed: {str(e)}")
+        metrics.count('batch.alias_errors')
+        return None
+
+@metrics.handler
 def lambda_handler(event, context):
     """
     GET /status/{submissionId}
     Returns current status: pending | approved | rejected | error
+    POST /status/batch is handled by batch_status
     """
+    submission_id = None
     try:
-        submission_id = event.get('pathParameters', {}).get('submissionId')
-        
+        if event.get('resource') == '/status/batch':
+            return batch_status(event, context)
+
+        submission_id = (event.get('pathParameters') or {}).get('submissionId')
+
         if not submission_id:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': '*',
-                    'Access-Control-Allow-Headers': '*'
-                },
-                'body': json.dumps({'error': 'Missing submissionId'})
-            }
-        
-        approved_table = dynamodb.Table(os.getenv('APPROVED_TABLE'))
-        review_table = dynamodb.Table(os.getenv('REVIEW_TABLE'))
-        rejected_table = dynamodb.Table(os.getenv('REJECTED_TABLE'))
-        
-        # Check approved table
-        approved_response = approved_table.get_item(Key={'submission_id': submission_id})
-        if 'Item' in approved_response:
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': '*',
-                    'Access-Control-Allow-Headers': '*'
-                },
-                'body': json.dumps({
-                    'submission_id': submission_id,
-                    'status': 'approved',
-                    'approved_at': approved_response['Item'].get('approved_at')
-                })
-            }
-        
-        # Check review table
-        review_response = review_table.get_item(Key={'submission_id': submission_id})
-        if 'Item' in review_response:
-            item = review_response['Item']
-            status = item.get('status', 'PENDING_REVIEW')
-            
-            if status == 'APPROVED':
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Methods': '*',
-                        'Access-Control-Allow-Headers': '*'
-                    },
-                    'body': json.dumps({
-                        'submission_id': submission_id,
-                        'status': 'approved',
-                        'approved_at': item.get('created_at'),
-                        'reviewed_by': 'admin'
-                    })
-                }
-            elif status == 'REJECTED':
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Methods': '*',
-                        'Access-Control-Allow-Headers': '*'
-                    },
-                    'body': json.dumps({
-                        'submission_id': submission_id,
-                        'status': 'rejected',
-                        'rejected_at': item.get('resolved_at')
-                    })
-                }
-            else:  # PENDING_REVIEW
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Access-Control-Allow-Origin': '*',
-                        'Access-Control-Allow-Methods': '*',
-                        'Access-Control-Allow-Headers': '*'
-                    },
-                    'body': json.dumps({
-                        'submission_id': submission_id,
-                        'status': 'pending',
-                        'created_at': item.get('created_at')
-                    })
-                }
-
-        # Check rejected table
-        rejected_response = rejected_table.get_item(Key={'submission_id': submission_id})
-        if 'Item' in rejected_response:
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': '*',
-                    'Access-Control-Allow-Headers': '*'
-                },
-                'body': json.dumps({
-                    'submission_id': submission_id,
-                    'status': 'rejected',
-                    'rejected_at': rejected_response['Item'].get('rejected_at')
-                    
-                })
-            }
-            
-        
-        # Not found 
-        return {
-            'statusCode': 404,
-            'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': '*',
-                    'Access-Control-Allow-Headers': '*'
-                },
-            'body': json.dumps({
-                'submission_id': submission_id,
-                'status': 'Not Found',
-                'message': 'Please enter a valid submission id.'
-            })
-        }
-    
+            return response(400, {'error': 'Missing submissionId'})
+
+        cached = status_cache.get(submission_id)
+        if cached is not None:
+            record_cache_metrics(1, 0)
+            return status_response(event, *cached, cache_hit=True)
+        record_cache_metrics(0, 1)
+
+        deadline = Deadline(context)
+        result = read_status(deadline, submission_id)
+        if result is None:
+            return degraded_response(submission_id)
+        if result[0] == 404:
+            result = read_alias(deadline, submission_id) or result
+        return remember(event, submission_id, *result)
+
     except Exception as e:
+        if is_timeout(e):
+            print(f"Get status timed out: {str(e)}")
+            return degraded_response(submission_id)
         print(f"Get status error: {str(e)}")
-        return {
-            'statusCode': 500,
-            'headers': {
-                    'Access-Control-Allow-Origin': '*',
-                    'Access-Control-Allow-Methods': '*',
-                    'Access-Control-Allow-Headers': '*'
-                },
-            'body': json.dumps({'error': 'Internal server error'})
-        }
+        return response(500, {'error': 'Internal server error'})
@@ -1,14 +1,65 @@
 import json
-import boto3
 import os
 from datetime import datetime
+from instrumentation import Metrics
+from deadline import Deadline, attempt_ms, client
+from rate_limiter import AdaptiveRateLimiter, RateLimitTimeout, is_throttle
+from circuit_breaker import CircuitBreaker, CircuitOpen, is_outage
+import upload_keys
+from known_bad import KNOWN_BAD_BUCKET, KnownBadImages, image_digest
 
-rekognition = boto3.client('rekognition')
+metrics = Metrics('image_moderator')
 
+# Throttles are retried by the shared limiter, not by botocore, and reads
+# are capped at 5s so the circuit breaker notices an outage quickly
+MAX_READ_TIMEOUT = 5
+
+# Below this there's no point calling Rekognition; route to review instead
+MIN_CALL_MS = 1500
+
+rekognition_limiter = AdaptiveRateLimiter(
+    'rekognition:DetectModerationLabels',
+    initial_rate=float(os.getenv('REKOGNITION_INITIAL_TPS', '10')),
+    max_rate=float(os.getenv('REKOGNITION_MAX_TPS', '50')),
+    metrics=metrics
+)
+
+rekognition_breaker = CircuitBreaker('rekognition', metrics=metrics)
+
+# Loaded on the first invocation (mapped, not read into memory) and
+# re-checked for a newer list every KNOWN_BAD_REFRESH_SECONDS
+known_bad_images = KnownBadImages()
+
+class DeadlineTooClose(Exception):
+    """Too little of the invocation is left to call Rekognition"""
+
+def find_known_bad(deadline, bucket, image_key):
+    """The image's SHA-256 (hex) if it is on the known-bad list, else None; never raises"""
+    if not KNOWN_BAD_BUCKET:
+        return None
+    try:
+        with metrics.stage('known_bad'):
+            s3 = client('s3', deadline)
+            if known_bad_images.refresh(s3) and known_bad_images.filter:
+                metrics.put('known_bad.entries', known_bad_images.filter.count, unit='Count')
+            if known_bad_images.filter is None:
+                return None
+            digest = image_digest(s3, bucket, image_key)
+            listed = known_bad_images.check(s3, digest)
+    except Exception as e:
+        # Without the list every image is simply moderated by Rekognition
+        print(f"Known-bad lookup failed: {str(e)}")
+        metrics.count('known_bad.errors')
+        return None
+    metrics.count({None: 'known_bad.miss', False: 'known_bad.false_positive', True: 'known_bad.hit'}[listed])
+    return digest.hex() if listed else None
+
+@metrics.handler
 def lambda_handler(event, context):
     """
-    Analyzes image for explicit content using Rekognition
-    Returns: { type, decision, labels, max_confidence }
+    Analyzes image for explicit content using Rekognition. Images on the
+    known-bad list (by SHA-256) are rejected before Rekognition is called.
+    Returns: { type, decision, labels, max_confidence, known_bad }
     decision = APPROVE | REJECT | AMBIGUOUS
     rule:
       - If ANY moderation label has confidence > 75 → REJECT
@@ -29,25 +80,70 @@ def lambda_handler(event, context):
         bucket = os.getenv('UPLOADS_BUCKET')
         
         # Call Rekognition
-        response = rekognition.detect_moderation_labels(
-            Image={'S3Object': {'Bucket': bucket, 'Name': image_key}}
-        )
+        deadline = Deadline(context)
+        try:
+            if deadline.expired(MIN_CALL_MS):
+                raise DeadlineTooClose(f"{deadline.remaining_ms()}ms left, not calling Rekognition")
+            # Keys from before hashed prefixes may have been migrated since
+            image_key = upload_keys.resolve(client('s3', deadline), bucket, image_key)
+            known_bad = find_known_bad(deadline, bucket, image_key)
+            if known_bad:
+                print(f"Image moderation: {submission_id} - Decision: REJECT (known bad image {known_bad})")
+                return {
+                    'type': 'image',
+                    'submission_id': submission_id,
+                    'decision': 'REJECT',
+                    'labels': [],
+                    'max_confidence': 0.0,
+                    'label_details': [],
+                    'known_bad': True,
+                    'sha256': known_bad,
+                    'timestamp': datetime.now().isoformat()
+                }
+            # The lookup may have read the whole image
+            if deadline.expired(MIN_CALL_MS):
+                raise DeadlineTooClose(f"{deadline.remaining_ms()}ms left after the known-bad check, not calling Rekognition")
+            rekognition = client('rekognition', deadline, max_attempts=1, max_read_timeout=MAX_READ_TIMEOUT)
+            response = rekognition_breaker.call(
+                rekognition_limiter.call,
+                rekognition.detect_moderation_labels,
+                max_wait=5,
+                deadline=deadline,
+                attempt_ms=attempt_ms(rekognition),
+                Image={'S3Object': {'Bucket': bucket, 'Name': image_key}}
+            )
+        except Exception as e:
+            if not isinstance(e, (CircuitOpen, DeadlineTooClose, RateLimitTimeout)) and \
+                    not is_throttle(e) and not is_outage(e):
+                raise
+            # Rekognition is throttling, down or we're out of time: send straight to human review
+            print(f"Image moderation: {submission_id} - {str(e)}, routing to review")
+            metrics.count('review.fallback')
+            return {
+                'type': 'image',
+                'submission_id': submission_id,
+                'decision': 'AMBIGUOUS',
+                'degraded': True,
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }
         
         labels = response.get('ModerationLabels', [])
         
         max_confidence = max([l['Confidence'] for l in labels], default=0.0)
         
-        # Default decision
-        decision = 'APPROVE'
-        
-        # Apply your rule
-        for label in labels:
-            conf = label['Confidence']
-            if conf > 75:
-                decision = 'REJECT'
-                break
-            elif 40 <= conf <= 75 and decision != 'REJECT':
-                decision = 'AMBIGUOUS'
+        with metrics.stage('decision'):
+            # Default decision
+            decision = 'APPROVE'
+            
+            # Apply your rule
+            for label in labels:
+                conf = label['Confidence']
+                if conf > 75:
+                    decision = 'REJECT'
+                    break
+                elif 40 <= conf <= 75 and decision != 'REJECT':
+                    decision = 'AMBIGUOUS'
         
         result = {
             'type': 'image',
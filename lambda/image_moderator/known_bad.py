@@ -0,0 +1,210 @@
+import base64
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+import time
+
+from botocore.exceptions import ClientError
+
+from ttl_cache import TTLCache
+import upload_keys
+
+KNOWN_BAD_BUCKET = os.getenv('KNOWN_BAD_BUCKET')
+
+# SHA-256 digests of images that are always rejected, as built by
+# tools/build_known_bad.py:
+#   known_bad/filter.bin          blocked Bloom filter plus a fence index
+#   known_bad/hashes-<id>.bin     every digest, sorted, 32 bytes each
+# The filter names the exact list it was built from, so a filter and the
+# list it confirms against are always a pair.
+PREFIX = 'known_bad/'
+FILTER_KEY = f"{PREFIX}filter.bin"
+
+# A filter deployed with the code is used as is; otherwise FILTER_KEY is
+# downloaded here and checked for a newer version every REFRESH_SECONDS
+PACKAGED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'known_bad.bin')
+DOWNLOAD_PATH = '/tmp/known_bad.bin'
+REFRESH_SECONDS = int(os.getenv('KNOWN_BAD_REFRESH_SECONDS', '300'))
+
+# magic, probes per digest, blocks, digests, fence step, exact list id
+HEADER = struct.Struct('<4sB3xQQI8s28x')
+MAGIC = b'KBF1'
+
+# Each digest sets all its bits in one 64-byte block, so a lookup reads a
+# single cache line (and at most one page of the mapped file)
+BLOCK_BYTES = 64
+BLOCK_BITS = BLOCK_BYTES * 8
+MAX_PROBES = 14  # 9 bits each from bytes 8-24 of the digest
+
+DIGEST_BYTES = 32
+
+
+def hashes_key(list_id):
+    return f"{PREFIX}hashes-{list_id.hex()}.bin"
+
+
+def probes(digest, blocks, k):
+    """(block, bit mask within it) a digest sets; SHA-256 output needs no further hashing"""
+    block = int.from_bytes(digest[:8], 'little') % blocks
+    bits = int.from_bytes(digest[8:24], 'little')
+    mask = 0
+    for _ in range(k):
+        mask |= 1 << (bits & (BLOCK_BITS - 1))
+        bits >>= 9
+    return block, mask
+
+
+def image_digest(s3, bucket, key):
+    """
+    SHA-256 of the image: from a content key for free, else from the
+    checksum S3 stored with the upload (one HEAD), else by reading it
+    """
+    if upload_keys.CONTENT_KEY.match(key):
+        return bytes.fromhex(key.split('sha256-', 1)[1][:64])
+    checksum = s3.head_object(Bucket=bucket, Key=key, ChecksumMode='ENABLED').get('ChecksumSHA256')
+    # A multipart upload's checksum is of its parts' checksums ("<base64>-<parts>")
+    if checksum and '-' not in checksum:
+        stored = base64.b64decode(checksum)
+        if len(stored) == DIGEST_BYTES:
+            return stored
+    digest = hashlib.sha256()
+    body = s3.get_object(Bucket=bucket, Key=key)['Body']
+    for chunk in body.iter_chunks(1 << 20):
+        digest.update(chunk)
+    return digest.digest()
+
+
+class Digests:
+    """Sorted 32-byte digests in a buffer, as a sequence bisect can search"""
+
+    def __init__(self, buffer, offset=0, count=None):
+        self.buffer = buffer
+        self.offset = offset
+        self.count = (len(buffer) - offset) // DIGEST_BYTES if count is None else count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        start = self.offset + i * DIGEST_BYTES
+        return self.buffer[start:start + DIGEST_BYTES]
+
+    def __contains__(self, digest):
+        i = bisect.bisect_left(self, digest)
+        return i < self.count and self[i] == digest
+
+
+class BloomFilter:
+    """A filter file, memory-mapped: nothing is read until a lookup touches it"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.k, self.blocks, self.count, self.step, self.list_id = HEADER.unpack_from(self.map)
+        if magic != MAGIC or not 0 < self.k <= MAX_PROBES or not self.blocks:
+            self.map.close()
+            raise ValueError(f"{path} is not a known-bad filter")
+        # Every step-th digest of the exact list: which range of it to fetch
+        fences = HEADER.size + self.blocks * BLOCK_BYTES
+        self.fences = Digests(self.map, fences, -(-self.count // self.step))
+
+    def __contains__(self, digest):
+        block, mask = probes(digest, self.blocks, self.k)
+        start = HEADER.size + block * BLOCK_BYTES
+        return int.from_bytes(self.map[start:start + BLOCK_BYTES], 'little') & mask == mask
+
+    def exact_range(self, digest):
+        """Byte range of the exact list digest would be in, or None if it sorts before all of it"""
+        fence = bisect.bisect_right(self.fences, digest) - 1
+        if fence < 0:
+            return None
+        first = fence * self.step
+        last = min(first + self.step, self.count)
+        return first * DIGEST_BYTES, last * DIGEST_BYTES - 1
+
+    def close(self):
+        self.map.close()
+
+
+class KnownBadImages:
+    """
+    The known-bad filter, held per container. A miss is answered from the
+    mapped filter alone; a hit is confirmed by fetching the stretch of the
+    exact list it would be in (one ranged GET of at most fence step x 32
+    bytes), so false positives never reject an image.
+    """
+
+    def __init__(self, bucket=KNOWN_BAD_BUCKET, refresh_seconds=REFRESH_SECONDS,
+                 packaged_path=PACKAGED_PATH, download_path=DOWNLOAD_PATH):
+        self.bucket = bucket
+        self.refresh_seconds = refresh_seconds
+        self.packaged_path = packaged_path
+        self.download_path = download_path
+        self.filter = None
+        self.etag = None
+        self.checked_at = None
+        self.confirmed = TTLCache(maxsize=1000)
+
+    def _replace(self, new_filter):
+        old, self.filter = self.filter, new_filter
+        self.confirmed = TTLCache(maxsize=1000)
+        if old:
+            old.close()
+
+    def refresh(self, s3):
+        """Map the packaged filter, or download FILTER_KEY if it changed; True if a new filter was loaded"""
+        packaged = bool(self.packaged_path) and os.path.exists(self.packaged_path)
+        if self.checked_at is not None and (packaged or time.monotonic() - self.checked_at < self.refresh_seconds):
+            return False
+        self.checked_at = time.monotonic()
+        if packaged:
+            self._replace(BloomFilter(self.packaged_path))
+            return True
+        kwargs = {'Bucket': self.bucket, 'Key': FILTER_KEY}
+        if self.etag:
+            kwargs['IfNoneMatch'] = self.etag
+        try:
+            obj = s3.get_object(**kwargs)
+        except ClientError as e:
+            code = e.response.get('Error', {}).get('Code')
+            if code in ('304', 'NotModified'):
+                return False
+            if code in ('NoSuchKey', '404'):
+                # No list has been built yet
+                self.etag = None
+                self._replace(None)
+                return False
+            raise
+        partial = f"{self.download_path}.part"
+        with open(partial, 'wb') as f:
+            for chunk in obj['Body'].iter_chunks(1 << 20):
+                f.write(chunk)
+        os.replace(partial, self.download_path)
+        self._replace(BloomFilter(self.download_path))
+        self.etag = obj['ETag']
+        return True
+
+    def check(self, s3, digest):
+        """None if digest isn't listed, True if it is, False for a filter false positive"""
+        if self.filter is None or digest not in self.filter:
+            return None
+        known = self.confirmed.get(digest)
+        if known is None:
+            byte_range = self.filter.exact_range(digest)
+            known = False
+            if byte_range:
+                try:
+                    data = s3.get_object(
+                        Bucket=self.bucket,
+                        Key=hashes_key(self.filter.list_id),
+                        Range=f"bytes={byte_range[0]}-{byte_range[1]}"
+                    )['Body'].read()
+                except ClientError:
+                    # Most likely replaced by a newer list since: look for its filter next time
+                    self.checked_at = None
+                    raise
+                known = digest in Digests(data)
+            self.confirmed.set(digest, known, ttl=self.refresh_seconds)
+        return known or False
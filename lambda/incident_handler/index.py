@@ -3,6 +3,10 @@ import boto3
 import requests
 from datetime import datetime
 from botocore.exceptions import ClientError
+from instrumentation import Metrics
+from deadline import Deadline, client_config
+
+metrics = Metrics('incident_handler')
 
 # AWS Secrets Manager
 REGION_NAME = "eu-west-1"
@@ -10,22 +14,25 @@ SECRET_NAME = "amit-AWS-incident-creation-token"
 GITHUB_REPO = "amitvg1997/content-moderation-system"  
 GITHUB_API_URL = f'https://api.github.com/repos/{GITHUB_REPO}/issues'
 
-def get_github_token():
+def get_github_token(deadline):
     """Fetch GitHub token from AWS Secrets Manager"""
-    session = boto3.session.Session()
+    session = metrics.instrument(boto3.session.Session())
     client = session.client(
         service_name='secretsmanager',
-        region_name=REGION_NAME
+        region_name=REGION_NAME,
+        config=client_config(deadline)
     )
     
     response = client.get_secret_value(SecretId=SECRET_NAME)
     secret = response['SecretString']
     return json.loads(secret)['amit-AWS-incident-creation-token']
 
+@metrics.handler
 def lambda_handler(event, context):
     
     try:
-        github_token = get_github_token()
+        deadline = Deadline(context)
+        github_token = get_github_token(deadline)
         
         # Extract basic error info
         detail = event.get('detail', {})
@@ -47,7 +54,13 @@ def lambda_handler(event, context):
             'Accept': 'application/vnd.github.v3+json'
         }
         
-        response = requests.post(GITHUB_API_URL, json=payload, headers=headers)
+        with metrics.stage('github_issue'):
+            response = requests.post(
+                GITHUB_API_URL,
+                json=payload,
+                headers=headers,
+                timeout=max(1, deadline.remaining_ms() / 1000)
+            )
         
         if response.status_code == 201:
             issue = response.json()
@@ -0,0 +1,151 @@
+import json
+import os
+from datetime import datetime, timezone
+from boto3.dynamodb.types import TypeDeserializer
+from instrumentation import Metrics
+from deadline import Deadline, client, resource
+import dedupe
+import near_dup
+import outbox
+import queue_version
+
+metrics = Metrics('outbox_worker')
+
+deserializer = TypeDeserializer()
+
+# PublishBatch takes at most 10 messages
+PUBLISH_BATCH = 10
+
+def pending_effects(records):
+    """
+    [(sequence number, submission_id, effects)] for records that carry an
+    outbox. Only INSERTs do: decision_handler writes each item once, and a
+    later write to the same item (a retried run, a thumbnail, a lease)
+    must not repeat its effects.
+    """
+    pending = []
+    for record in records:
+        if record.get('eventName') != 'INSERT':
+            continue
+        image = record['dynamodb'].get('NewImage', {})
+        if outbox.OUTBOX not in image:
+            continue
+        item = {name: deserializer.deserialize(value) for name, value in image.items()
+                if name in ('submission_id', outbox.OUTBOX)}
+        pending.append((record['dynamodb']['SequenceNumber'], item['submission_id'], item[outbox.OUTBOX]))
+    return pending
+
+def notify(sns, notifications):
+    """PublishBatch in tens; returns the sequence numbers whose message failed"""
+    failed = set()
+    for start in range(0, len(notifications), PUBLISH_BATCH):
+        chunk = notifications[start:start + PUBLISH_BATCH]
+        entries = {str(i): (sequence, effect) for i, (sequence, effect) in enumerate(chunk)}
+        try:
+            result = sns.publish_batch(
+                TopicArn=os.getenv('ADMIN_NOTIFICATION_TOPIC'),
+                PublishBatchRequestEntries=[
+                    {'Id': entry_id, 'Subject': effect['subject'], 'Message': effect['message']}
+                    for entry_id, (_, effect) in entries.items()
+                ]
+            )
+            failures = result.get('Failed', [])
+        except Exception as e:
+            print(f"Notification batch failed: {str(e)}")
+            failures = [{'Id': entry_id} for entry_id in entries]
+        failed.update(entries[failure['Id']][0] for failure in failures)
+    return failed
+
+def invoke_thumbnailer(lambda_client, submission_id, effect):
+    lambda_client.invoke(
+        FunctionName=os.getenv('THUMBNAILER_FUNCTION'),
+        InvocationType='Event',
+        Payload=json.dumps({'submission_id': submission_id, 'image_key': effect['image_key']}).encode('utf-8')
+    )
+
+# Closed near-duplicate hours this container has seen compacted
+compacted_hours = set()
+
+def index_near_dups(s3, entries):
+    """
+    Write the batch's signatures as one new near-duplicate object, then
+    compact the newest closed hour if that hasn't been done yet. Never
+    raises: like a lost dedupe decision, a lost signature only means a
+    near copy of the text is moderated again.
+    """
+    packed = [near_dup.pack(effect['simhash'], effect['decision'], effect['sentiment'], submission_id)
+              for _, submission_id, effect in entries]
+    packed = [record for record in packed if record]
+    now = datetime.now(timezone.utc)
+    if packed:
+        try:
+            near_dup.write_batch(s3, packed, min((sequence for sequence, _, _ in entries), key=int), now)
+        except Exception as e:
+            print(f"Near-duplicate signatures not indexed: {str(e)}")
+            metrics.count('near_dup.dropped', len(packed))
+    closed = near_dup.hour_of(now - near_dup.CLOSED_AFTER)
+    if closed not in compacted_hours:
+        try:
+            if near_dup.compact(s3, closed):
+                metrics.count('near_dup.compacted')
+            compacted_hours.add(closed)
+        except Exception as e:
+            print(f"Near-duplicate hour {closed} not compacted: {str(e)}")
+
+@metrics.handler
+def lambda_handler(event, context):
+    """
+    DynamoDB Streams consumer for the approved, review and rejected tables.
+    Performs the side effects decision_handler left in each new item's
+    outbox: admin emails (PublishBatch), dedupe decisions, thumbnails,
+    near-duplicate signatures (one new object per batch) and one
+    review queue version bump per batch.
+    Records whose effects fail are reported as batch item failures, so
+    Lambda retries from the first of them; effects are at-least-once.
+    """
+    pending = pending_effects(event.get('Records', []))
+    metrics.put('outboxes', len(pending), unit='Count')
+    if not pending:
+        return {'batchItemFailures': []}
+
+    deadline = Deadline(context)
+    failed = set()
+    by_type = {}
+    for sequence, submission_id, effects in pending:
+        for effect in effects:
+            by_type.setdefault(effect['type'], []).append((sequence, submission_id, effect))
+
+    if by_type.get(outbox.NOTIFY):
+        with metrics.stage('notify'):
+            failed |= notify(client('sns', deadline), [(seq, effect) for seq, _, effect in by_type[outbox.NOTIFY]])
+
+    if by_type.get(outbox.RECORD_DEDUPE) and dedupe.enabled():
+        dynamodb = client('dynamodb', deadline)
+        with metrics.stage('record_dedupe'):
+            for sequence, submission_id, effect in by_type[outbox.RECORD_DEDUPE]:
+                # Never raises: a lost decision only means the next duplicate is moderated again
+                dedupe.record_decision(dynamodb, effect['content_hash'], submission_id, effect['decision'])
+
+    if by_type.get(outbox.THUMBNAIL):
+        lambda_client = client('lambda', deadline)
+        with metrics.stage('thumbnail'):
+            for sequence, submission_id, effect in by_type[outbox.THUMBNAIL]:
+                try:
+                    invoke_thumbnailer(lambda_client, submission_id, effect)
+                except Exception as e:
+                    print(f"Thumbnail for {submission_id} not requested: {str(e)}")
+                    failed.add(sequence)
+
+    if by_type.get(outbox.NEAR_DUP) and near_dup.ANALYTICS_BUCKET:
+        with metrics.stage('near_dup'):
+            # Never raises: see index_near_dups
+            index_near_dups(client('s3', deadline), by_type[outbox.NEAR_DUP])
+
+    if by_type.get(outbox.BUMP_QUEUE):
+        queue_version.bump(resource('dynamodb', deadline))
+
+    for effect_type, entries in by_type.items():
+        metrics.count(f"effects.{effect_type}", len(entries))
+    metrics.count('effects.failed_records', len(failed))
+    print(f"Outbox worker: {len(pending)} outboxes, {sum(len(e) for e in by_type.values())} effects, {len(failed)} records failed")
+    return {'batchItemFailures': [{'itemIdentifier': sequence} for sequence in sorted(failed, key=int)]}
@@ -0,0 +1,183 @@
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from instrumentation import Metrics
+from deadline import Deadline, client, resource
+
+metrics = Metrics('review_digest')
+
+DIGEST_COUNTER = 'review_digest'
+
+# First run, or a lost watermark: summarize this far back
+DIGEST_WINDOW_MINUTES = int(os.getenv('DIGEST_WINDOW_MINUTES', '15'))
+
+# The status index is eventually consistent; items newer than this may
+# not be in it yet and are left for the next digest
+INDEX_LAG = timedelta(seconds=60)
+
+DASHBOARD_URL = 'http://amit-moderation-admin-frontend.s3-website-eu-west-1.amazonaws.com/'
+
+def read_watermark(counters_table):
+    response = counters_table.get_item(Key={'counter_id': DIGEST_COUNTER}, ConsistentRead=True)
+    return response.get('Item', {}).get('watermark')
+
+def move_watermark(counters_table, old, new):
+    """
+    Compare-and-set, so a duplicate scheduled invocation can't send the
+    same window twice. Returns False if another run moved it first.
+    """
+    try:
+        counters_table.update_item(
+            Key={'counter_id': DIGEST_COUNTER},
+            UpdateExpression='SET watermark = :new',
+            ConditionExpression='attribute_not_exists(watermark)' if old is None else 'watermark = :old',
+            ExpressionAttributeValues={':new': new, **({} if old is None else {':old': old})}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+def restore_watermark(counters_table, current, previous):
+    """Undo move_watermark after a failed send, unless a later run has moved on"""
+    kwargs = {
+        'Key': {'counter_id': DIGEST_COUNTER},
+        'ConditionExpression': 'watermark = :current'
+    }
+    if previous is None:
+        kwargs.update(UpdateExpression='REMOVE watermark', ExpressionAttributeValues={':current': current})
+    else:
+        kwargs.update(UpdateExpression='SET watermark = :previous',
+                      ExpressionAttributeValues={':current': current, ':previous': previous})
+    try:
+        counters_table.update_item(**kwargs)
+    except ClientError as e:
+        print(f"Digest watermark not restored: {str(e)}")
+
+def query_status(review_table, status, since=None, until=None, projection='submission_id, created_at, moderation_details'):
+    """Review items with status, oldest first, optionally created in (since, until]"""
+    condition = Key('status').eq(status)
+    if since is not None:
+        condition = condition & Key('created_at').between(since, until)
+    items = []
+    kwargs = {
+        'IndexName': 'status-index',
+        'KeyConditionExpression': condition,
+        'ProjectionExpression': projection,
+        'ScanIndexForward': True
+    }
+    while True:
+        response = review_table.query(**kwargs)
+        items.extend(item for item in response.get('Items', []) if since is None or item['created_at'] != since)
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def summarize(new_items, resolved, pending, now):
+    """Counts, top labels and sentiments of the window, plus the queue as it is now"""
+    labels = Counter()
+    sentiments = Counter()
+    for item in new_items:
+        try:
+            details = json.loads(item.get('moderation_details') or '{}')
+        except ValueError:
+            details = {}
+        labels.update(details.get('image_labels') or [])
+        sentiments[details.get('text_sentiment') or 'NO_TEXT'] += 1
+    oldest = pending[0] if pending else None
+    oldest_age = None
+    if oldest:
+        try:
+            oldest_age = (now - datetime.fromisoformat(oldest['created_at'])).total_seconds()
+        except (TypeError, ValueError):
+            pass
+    return {
+        'new': len(new_items),
+        'resolved_already': resolved,
+        'pending': len(pending),
+        'oldest_pending_id': oldest['submission_id'] if oldest else None,
+        'oldest_pending_seconds': oldest_age,
+        'top_labels': labels.most_common(5),
+        'sentiments': sentiments.most_common()
+    }
+
+def format_age(seconds):
+    if seconds is None:
+        return 'unknown'
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f} h"
+    return f"{seconds / 86400:.1f} days"
+
+def format_message(summary, since, until):
+    top_labels = ', '.join(f"{label} ({count})" for label, count in summary['top_labels']) or 'none'
+    sentiments = ', '.join(f"{sentiment} ({count})" for sentiment, count in summary['sentiments']) or 'none'
+    return f"""
+Review queue digest, {since[:16]} to {until[:16]} UTC:
+
+New items for review: {summary['new']} ({summary['resolved_already']} already decided)
+Pending now: {summary['pending']}
+Oldest pending: {format_age(summary['oldest_pending_seconds'])} ({summary['oldest_pending_id'] or 'none'})
+
+Top image labels: {top_labels}
+Text sentiment: {sentiments}
+
+Please review on Admin Dashboard!
+
+Admin Dashboard Link: {DASHBOARD_URL}
+    """
+
+@metrics.handler
+def lambda_handler(event, context):
+    """
+    Scheduled. With NOTIFICATION_MODE=digest, decision_handler doesn't
+    publish per REVIEW item; this sends one summary of the items queued
+    since the last digest instead. Nothing is sent for an empty window.
+    The window is read back from the review table's status index (the
+    review items are the record), with its end kept in the counters table.
+    """
+    deadline = Deadline(context)
+    dynamodb = resource('dynamodb', deadline)
+    review_table = dynamodb.Table(os.getenv('REVIEW_TABLE'))
+    counters_table = dynamodb.Table(os.getenv('COUNTERS_TABLE'))
+
+    # created_at is written as naive local time by decision_handler, which is UTC in Lambda
+    now = datetime.now()
+    until = (now - INDEX_LAG).isoformat()
+    watermark = read_watermark(counters_table)
+    since = watermark or (now - INDEX_LAG - timedelta(minutes=DIGEST_WINDOW_MINUTES)).isoformat()
+
+    with metrics.stage('query'):
+        pending_all = query_status(review_table, 'PENDING_REVIEW', projection='submission_id, created_at')
+        new_pending = query_status(review_table, 'PENDING_REVIEW', since, until)
+        new_resolved = [
+            item
+            for status in ('APPROVED', 'REJECTED')
+            for item in query_status(review_table, status, since, until)
+        ]
+    summary = summarize(new_pending + new_resolved, len(new_resolved), pending_all, now)
+    metrics.count('digest.items', summary['new'])
+
+    if not move_watermark(counters_table, watermark, until):
+        print("Another digest run covered this window")
+        return {'sent': False, 'reason': 'concurrent run'}
+    if summary['new'] == 0:
+        return {'sent': False, **summary}
+
+    try:
+        client('sns', deadline).publish(
+            TopicArn=os.getenv('ADMIN_NOTIFICATION_TOPIC'),
+            Subject=f"Content Requires Review: {summary['new']} new, {summary['pending']} pending",
+            Message=format_message(summary, since, until)
+        )
+    except Exception:
+        # Give the window back so the next run includes it
+        restore_watermark(counters_table, until, watermark)
+        raise
+    metrics.count('digest.sent')
+    return {'sent': True, **summary}
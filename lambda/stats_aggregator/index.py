@@ -0,0 +1,248 @@
+import json
+import os
+import random
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+from instrumentation import Metrics
+from deadline import Deadline, client
+import stats_keys
+import traffic_sketches
+
+metrics = Metrics('stats_aggregator')
+
+deserializer = TypeDeserializer()
+
+# TransactWriteItems takes at most 100 actions
+MAX_TRANSACT_ITEMS = 100
+
+# Event markers only have to outlive the stream's 24h retention
+EVENT_MARKER_TTL = 86400 * 2
+
+# Hourly buckets are only served for the last day (stats_keys.recent_keys);
+# the TTL is set on an hour's first write, so two days keep all 24 readable
+HOUR_BUCKET_TTL = 86400 * 2
+
+MAX_TRANSACT_ATTEMPTS = 5
+
+def table_name(record):
+    # arn:aws:dynamodb:<region>:<account>:table/<name>/stream/<label>
+    return record.get('eventSourceARN', '').split(':table/')[-1].split('/')[0]
+
+def record_counts(record):
+    """
+    What one stream record adds to the counters, as
+    ({counter: n}, pending_review delta, sketch input), or None if it
+    doesn't count. Sketch input is None for admin resolutions, whose
+    content was already seen when it entered the review queue.
+
+    Only INSERTs count: decision_handler and admin_decision write each
+    submission to a table once, and a MODIFY is either admin_decision
+    resolving a review item (counted through the approved/rejected
+    INSERT it also makes) or a retried put of the same item.
+    """
+    if record.get('eventName') != 'INSERT':
+        return None
+
+    image = {k: deserializer.deserialize(v) for k, v in record['dynamodb'].get('NewImage', {}).items()}
+    source = table_name(record)
+    counts = Counter()
+    pending = 0
+    decision = None
+
+    if source == os.getenv('APPROVED_TABLE'):
+        if image.get('initially_ambiguous'):
+            counts[stats_keys.ADMIN_APPROVED] += 1
+            pending = -1
+        else:
+            decision = stats_keys.APPROVED
+            counts[decision] += 1
+    elif source == os.getenv('REJECTED_TABLE'):
+        if image.get('initially_ambiguous'):
+            counts[stats_keys.ADMIN_REJECTED] += 1
+            pending = -1
+        else:
+            decision = stats_keys.REJECTED
+            counts[decision] += 1
+    elif source == os.getenv('REVIEW_TABLE'):
+        decision = stats_keys.REVIEW
+        counts[decision] += 1
+        pending = 1
+    else:
+        return None
+
+    try:
+        details = json.loads(image.get('moderation_details') or '{}')
+    except ValueError:
+        details = {}
+    labels = sorted(set(details.get('image_labels') or []))
+    for label in labels:
+        counts[stats_keys.LABEL_PREFIX + label] += 1
+
+    sketch_input = None
+    if decision:
+        sketch_input = {
+            'labels': labels,
+            'mix': f"{details.get('text_sentiment') or 'NO_TEXT'}/{decision}",
+            'content_hash': image.get('text_hash')
+        }
+
+    return counts, pending, sketch_input
+
+def parse(records):
+    parsed = []
+    for record in records:
+        result = record_counts(record)
+        if result is None:
+            continue
+        counts, pending, sketch_input = result
+        created = record['dynamodb'].get('ApproximateCreationDateTime', time.time())
+        parsed.append({
+            'event_id': record['eventID'],
+            'moment': datetime.fromtimestamp(float(created), tz=timezone.utc),
+            'counts': counts,
+            'pending': pending,
+            'sketch_input': sketch_input
+        })
+    return parsed
+
+def chunks(parsed):
+    """Split records so each chunk's markers plus counter items fit one transaction"""
+    chunk, keys = [], set()
+    for entry in parsed:
+        entry_keys = keys | set(stats_keys.bucket_keys(entry['moment']))
+        if chunk and len(chunk) + 1 + len(entry_keys) > MAX_TRANSACT_ITEMS:
+            yield chunk
+            chunk, entry_keys = [], set(stats_keys.bucket_keys(entry['moment']))
+        chunk.append(entry)
+        keys = entry_keys
+    if chunk:
+        yield chunk
+
+def transact_items(table, chunk, now):
+    """
+    One conditional marker Put per record, then one ADD Update per
+    counter item with the chunk's counts summed. A replayed record
+    fails its marker's condition, which cancels the whole transaction
+    so nothing is counted twice.
+    """
+    deltas = defaultdict(Counter)
+    for entry in chunk:
+        for key in stats_keys.bucket_keys(entry['moment']):
+            deltas[key].update(entry['counts'])
+        deltas[stats_keys.TOTALS][stats_keys.PENDING_REVIEW] += entry['pending']
+
+    items = [{
+        'Put': {
+            'TableName': table,
+            'Item': {
+                'stat_id': {'S': f"event#{entry['event_id']}"},
+                'ttl': {'N': str(now + EVENT_MARKER_TTL)}
+            },
+            'ConditionExpression': 'attribute_not_exists(stat_id)'
+        }
+    } for entry in chunk]
+
+    for key, counts in deltas.items():
+        counts = {name: n for name, n in counts.items() if n}
+        if not counts:
+            continue
+        names, values, adds = {}, {}, []
+        for i, (name, n) in enumerate(sorted(counts.items())):
+            names[f'#c{i}'] = name
+            values[f':c{i}'] = {'N': str(n)}
+            adds.append(f'#c{i} :c{i}')
+        expression = 'ADD ' + ', '.join(adds)
+        if key.startswith('hour#'):
+            names['#ttl'] = 'ttl'
+            values[':ttl'] = {'N': str(now + HOUR_BUCKET_TTL)}
+            expression += ' SET #ttl = if_not_exists(#ttl, :ttl)'
+        items.append({
+            'Update': {
+                'TableName': table,
+                'Key': {'stat_id': {'S': key}},
+                'UpdateExpression': expression,
+                'ExpressionAttributeNames': names,
+                'ExpressionAttributeValues': values
+            }
+        })
+    return items
+
+def apply_chunk(dynamodb, table, chunk):
+    """
+    Write one chunk, dropping records whose marker already exists and
+    retrying conflicts with other shards. Returns the records that were new.
+    """
+    for attempt in range(MAX_TRANSACT_ATTEMPTS):
+        if not chunk:
+            return []
+        items = transact_items(table, chunk, int(time.time()))
+        try:
+            dynamodb.transact_write_items(TransactItems=items)
+            return chunk
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'TransactionCanceledException':
+                raise
+            reasons = e.response.get('CancellationReasons', [])
+            # Markers come first, one per record, in chunk order
+            seen = {
+                i for i, reason in enumerate(reasons[:len(chunk)])
+                if reason.get('Code') == 'ConditionalCheckFailed'
+            }
+            if seen:
+                metrics.count('duplicate_records', len(seen))
+                chunk = [entry for i, entry in enumerate(chunk) if i not in seen]
+                continue
+            metrics.count('transaction_conflicts')
+            time.sleep(min(1.0, 0.05 * (2 ** attempt)) * random.uniform(0.5, 1.0))
+    raise RuntimeError(f"Stats transaction still cancelled after {MAX_TRANSACT_ATTEMPTS} attempts")
+
+def update_sketches(s3, counted):
+    """
+    Fold the newly counted records into the running and per-day sketch
+    checkpoints. Only records that passed the marker check are added, so
+    a replayed batch can't inflate the heavy-hitter counts.
+    """
+    deltas = defaultdict(traffic_sketches.TrafficSketches)
+    for entry in counted:
+        if entry['sketch_input']:
+            deltas[traffic_sketches.TOTAL_CHECKPOINT].add(**entry['sketch_input'])
+            deltas[traffic_sketches.day_checkpoint(entry['moment'])].add(**entry['sketch_input'])
+    for key, delta in deltas.items():
+        with metrics.stage('sketch_checkpoint'):
+            traffic_sketches.merge_into(s3, key, delta)
+
+@metrics.handler
+def lambda_handler(event, context):
+    """
+    DynamoDB Streams consumer for the approved, review and rejected tables.
+    Adds every new submission to the stats table's counters (see stats_keys)
+    and to the label/sentiment/content sketches checkpointed in S3
+    (see traffic_sketches).
+    Errors are raised so Lambda retries (and bisects) the batch; the
+    per-record markers make those retries safe.
+    """
+    records = event.get('Records', [])
+    parsed = parse(records)
+    metrics.put('records', len(records), unit='Count')
+
+    deadline = Deadline(context)
+    dynamodb = client('dynamodb', deadline)
+    counted = []
+    for chunk in chunks(parsed):
+        counted += apply_chunk(dynamodb, stats_keys.STATS_TABLE, chunk)
+
+    if traffic_sketches.ANALYTICS_BUCKET and counted:
+        try:
+            update_sketches(client('s3', deadline), counted)
+        except Exception as e:
+            # The counters are already committed; a lost sketch delta only
+            # makes the approximate analytics a little more approximate
+            metrics.count('sketch_checkpoint.errors')
+            print(f"Sketch checkpoint failed: {str(e)}")
+
+    metrics.put('counted', len(counted), unit='Count')
+    print(f"Stats aggregator: {len(records)} records, {len(counted)} counted")
+    return {'records': len(records), 'counted': len(counted)}
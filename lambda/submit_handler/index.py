@@ -1,43 +1,315 @@
+import base64
 import json
 import boto3
 import uuid
 import os
 from datetime import datetime
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from instrumentation import Metrics
+from deadline import Deadline, client, is_timeout
+from rate_limiter import SlidingWindowLimiter
+import dedupe
+import upload_metadata
+import upload_keys
 
-sfn_client = boto3.client('stepfunctions')
-s3_client = boto3.client('s3')
+metrics = Metrics('submit_handler')
 
+# Presigning is local, so this client never makes a network call.
+# SigV4 so presigned POST policies are accepted by every bucket
+s3_client = boto3.client('s3', config=Config(signature_version='s3v4'))
+
+# Moderation runs each client may start per window
+submission_limiter = SlidingWindowLimiter(
+    'submit',
+    limit=int(os.getenv('SUBMIT_RATE_LIMIT', '30')),
+    window_seconds=int(os.getenv('SUBMIT_RATE_WINDOW_SECONDS', '60')),
+    metrics=metrics
+)
+
+# S3's floor for every part but the last, and its part count ceiling
+MIN_PART_BYTES = 5 * 1024 * 1024
+MAX_PARTS = 10000
+
+# Parts a multipart upload is split into when the size allows, so the
+# browser can send them over that many connections at once
+MULTIPART_TARGET_PARTS = int(os.getenv('MULTIPART_TARGET_PARTS', '8'))
+
+# Time for one short attempt at dropping the dedupe claim of a failed submit;
+# with less it stays until abandoned (dedupe.CLAIM_TIMEOUT_SECONDS)
+MIN_RELEASE_MS = 700
+
+def client_id(event):
+    """API key if the request used one, else the caller's IP"""
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    if identity.get('apiKeyId'):
+        return f"key:{identity['apiKeyId']}"
+    return f"ip:{identity.get('sourceIp') or 'unknown'}"
+
+def part_size(size):
+    """Smallest whole-MiB part giving at most MULTIPART_TARGET_PARTS parts, but never below S3's 5 MiB floor"""
+    mib = 1024 * 1024
+    part = max(MIN_PART_BYTES, -(-size // MULTIPART_TARGET_PARTS), -(-size // MAX_PARTS))
+    return -(-part // mib) * mib
+
+def start_multipart(deadline, bucket, key, content_type, size):
+    """
+    Create the multipart upload and presign one upload_part URL per part.
+    Each URL signs that part's exact Content-Length, so S3 refuses parts
+    that don't add up to the declared size.
+    """
+    upload_id = client('s3', deadline).create_multipart_upload(
+        Bucket=bucket,
+        Key=key,
+        ContentType=content_type
+    )['UploadId']
+    chunk = part_size(size)
+    parts = []
+    for number, offset in enumerate(range(0, size, chunk), start=1):
+        parts.append({
+            'part_number': number,
+            'size': min(chunk, size - offset),
+            'url': s3_client.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': bucket,
+                    'Key': key,
+                    'UploadId': upload_id,
+                    'PartNumber': number,
+                    'ContentLength': min(chunk, size - offset)
+                },
+                ExpiresIn=3600
+            )
+        })
+    return upload_id, chunk, parts
+
+def complete_multipart(deadline, bucket, body):
+    """
+    POST /submit/complete: stitch the uploaded parts together.
+    Returns the object's ETag, or an error message for the client.
+    """
+    upload_id = body.get('upload_id')
+    parts = body.get('parts')
+    if not body.get('image_key') or not upload_id or not isinstance(parts, list) or not parts:
+        return None, 'image_key, upload_id and parts are required'
+    try:
+        response = client('s3', deadline).complete_multipart_upload(
+            Bucket=bucket,
+            Key=body['image_key'],
+            UploadId=upload_id,
+            MultipartUpload={'Parts': sorted(
+                ({'ETag': part['etag'], 'PartNumber': int(part['part_number'])} for part in parts),
+                key=lambda part: part['PartNumber']
+            )}
+        )
+    except (ClientError, KeyError, TypeError, ValueError) as e:
+        print(f"Multipart upload {upload_id} not completed: {str(e)}")
+        return None, 'Upload could not be completed; upload the parts again'
+    return response.get('ETag'), None
+
+def submission_digest(deadline, bucket, text, image_key, image_etag=None):
+    """Content hash of the text plus the uploaded image's ETag; None if the image isn't there"""
+    if image_key and not image_etag:
+        try:
+            image_etag = client('s3', deadline).head_object(Bucket=bucket, Key=image_key)['ETag']
+        except ClientError as e:
+            print(f"Could not read {image_key} for dedupe, skipping: {str(e)}")
+            return None
+    return dedupe.content_hash(text, image_etag)
+
+def release_claim(context, content_hash, submission_id):
+    """
+    Best effort: drop this submission's dedupe claim when its execution may
+    not have started, so identical content isn't pointed at a submission
+    that never gets a status. If it did start, only reuse is lost.
+    """
+    if not content_hash:
+        return
+    deadline = Deadline(context)
+    if deadline.expired(MIN_RELEASE_MS):
+        return
+    try:
+        dedupe.release(client('dynamodb', deadline, max_attempts=1, max_read_timeout=1), content_hash, submission_id)
+    except Exception as e:
+        print(f"Dedupe claim for {submission_id} not released: {str(e)}")
+
+@metrics.handler
 def lambda_handler(event, context):
     """
     POST /submit
+    - If image_file provided with upload='multipart' and its size: returns
+      a multipart upload with one pre-signed URL per part; the frontend
+      uploads the parts in parallel, then calls POST /submit/complete
+      with their ETags, which completes the upload and starts moderation
+    - If image_file provided with upload='post': returns a pre-signed POST
+      carrying the submission; upload_trigger starts moderation once the
+      object lands, so there is no second call
     - If image_file provided: generates pre-signed URL
     - Frontend uploads image, then calls again with image_key
-    - Starts Step Functions execution
+    - Starts Step Functions execution, unless identical content was
+      submitted within the dedupe window: then the earlier submission
+      is returned instead
     """
+    content_hash = None
     try:
         body = json.loads(event.get('body', '{}'))
         text = body.get('text', '').strip()
         image_key = body.get('image_key')
         filename = body.get('filename')
         content_type = body.get('content_type')
-        submission_id = body.get('submission_id') or str(uuid.uuid4())
+        # An upload's key names its submission; upload_reaper relies on the two matching
+        submission_id = (body.get('submission_id') or
+                         (image_key and upload_keys.submission_id_from_key(image_key)) or
+                         str(uuid.uuid4()))
+        if not upload_keys.valid_submission_id(submission_id):
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                    'Access-Control-Allow-Headers': 'Content-Type'
+                },
+                'body': json.dumps({'error': 'submission_id must be 1-80 letters, digits, - or _'})
+            }
         
         bucket = os.getenv('UPLOADS_BUCKET')
         
+        # A presigned POST starts a run when the upload lands, so it is
+        # charged now; text that doesn't fit in metadata uses the PUT flow
+        encoded_text = upload_metadata.encode_text(text)
+        direct_upload = bool(filename and content_type and not image_key and
+                             body.get('upload') == 'post' and encoded_text is not None)
+        
+        # Only calls that start a moderation run count against the limit;
+        # asking for an upload URL is free
+        if image_key or not (filename and content_type) or direct_upload:
+            allowed, retry_after = submission_limiter.allow(client_id(event))
+            if not allowed:
+                return {
+                    'statusCode': 429,
+                    'headers': {
+                        'Access-Control-Allow-Origin': '*',
+                        'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                        'Access-Control-Allow-Headers': 'Content-Type',
+                        'Access-Control-Expose-Headers': 'Retry-After',
+                        'Retry-After': str(retry_after)
+                    },
+                    'body': json.dumps({
+                        'error': 'Too many submissions, please slow down',
+                        'retry_after': retry_after
+                    })
+                }
+        
         state_machine_arn = os.getenv('STATE_MACHINE_ARN')
+        deadline = Deadline(context)
+        sfn_client = client('stepfunctions', deadline)
+
+        # Multipart, second call: complete the upload, then moderate as Case 2
+        image_etag = None
+        if event.get('resource') == '/submit/complete':
+            image_etag, error = complete_multipart(deadline, bucket, body)
+            if error:
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Access-Control-Allow-Origin': '*',
+                        'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                        'Access-Control-Allow-Headers': 'Content-Type'
+                    },
+                    'body': json.dumps({'submission_id': submission_id, 'error': error})
+                }
+
+        # Multipart, first call: parts sized from the declared file size
+        if filename and content_type and not image_key and body.get('upload') == 'multipart':
+            size = body.get('size')
+            if not isinstance(size, int) or not 0 < size <= upload_metadata.MAX_UPLOAD_BYTES:
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Access-Control-Allow-Origin': '*',
+                        'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                        'Access-Control-Allow-Headers': 'Content-Type'
+                    },
+                    'body': json.dumps({
+                        'error': f'size must be between 1 and {upload_metadata.MAX_UPLOAD_BYTES} bytes'
+                    })
+                }
+            key = upload_keys.upload_key(submission_id, filename)
+            upload_id, chunk, parts = start_multipart(deadline, bucket, key, content_type, size)
+            
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                    'Access-Control-Allow-Headers': 'Content-Type'
+                },
+                'body': json.dumps({
+                    'submission_id': submission_id,
+                    'image_key': key,
+                    'upload_id': upload_id,
+                    'part_size': chunk,
+                    'parts': parts,
+                    'next_step': 'upload_parts_then_complete'
+                })
+            }
 
+        # Case 0: Single call - pre-signed POST, S3 notification starts moderation
+        if direct_upload:
+            key = upload_keys.upload_key(submission_id, filename)
+            fields = {
+                'Content-Type': content_type,
+                f'x-amz-meta-{upload_metadata.SUBMISSION_ID}': submission_id,
+                f'x-amz-meta-{upload_metadata.TEXT}': encoded_text
+            }
+            presigned_post = s3_client.generate_presigned_post(
+                Bucket=bucket,
+                Key=key,
+                Fields=fields,
+                Conditions=[{name: value} for name, value in fields.items()] + [
+                    ['content-length-range', 1, upload_metadata.MAX_UPLOAD_BYTES]
+                ],
+                ExpiresIn=300
+            )
+            
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                    'Access-Control-Allow-Headers': 'Content-Type'
+                },
+                'body': json.dumps({
+                    'submission_id': submission_id,
+                    'presigned_post': presigned_post,
+                    'image_key': key,
+                    'max_bytes': upload_metadata.MAX_UPLOAD_BYTES,
+                    'next_step': 'upload_image'
+                })
+            }
+        
         # Case 1: First call - generate pre-signed URL for image
         if filename and content_type and not image_key:
             
-            key = f"uploads/{datetime.now().strftime('%Y%m%d-%H%M%S')}-{filename}"
+            params = {
+                'Bucket': bucket,
+                'Key': upload_keys.upload_key(submission_id, filename),
+                'ContentType': content_type
+            }
+            required_headers = {'Content-Type': content_type}
+            
+            # Content-addressed: the key is the image's SHA-256, which S3
+            # checks against the body through the signed checksum header
+            sha256 = str(body.get('sha256') or '').lower()
+            if upload_keys.UPLOAD_KEY_SCHEME == 'content' and upload_keys.SHA256_HEX.match(sha256):
+                params['Key'] = upload_keys.content_key(sha256, filename)
+                params['ChecksumSHA256'] = base64.b64encode(bytes.fromhex(sha256)).decode('ascii')
+                required_headers['x-amz-checksum-sha256'] = params['ChecksumSHA256']
+            
+            key = params['Key']
             presigned_url = s3_client.generate_presigned_url(
                 'put_object',
-                Params={
-                    'Bucket': bucket,
-                    'Key': key,
-                    'ContentType': content_type
-                },
+                Params=params,
                 ExpiresIn=300
             )
             
@@ -51,13 +323,38 @@ def lambda_handler(event, context):
                 'body': json.dumps({
                     'submission_id': submission_id,
                     'presigned_url': presigned_url,
+                    'required_headers': required_headers,
                     'image_key': key,
                     'next_step': 'upload_image_then_submit'
                 })
             }
         
+        # Same text and image as a recent submission: answer with that one
+        if dedupe.enabled():
+            with metrics.stage('dedupe'):
+                content_hash = submission_digest(deadline, bucket, text, image_key, image_etag)
+                duplicate = content_hash and dedupe.claim(client('dynamodb', deadline), content_hash, submission_id)
+            if duplicate:
+                metrics.count('dedupe.hit')
+                print(f"Submission {submission_id} duplicates {duplicate['submission_id']}")
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        'Access-Control-Allow-Origin': '*',
+                        'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                        'Access-Control-Allow-Headers': 'Content-Type'
+                    },
+                    'body': json.dumps({
+                        'submission_id': duplicate['submission_id'],
+                        'status': dedupe.DECISION_STATUS.get(duplicate['decision'], 'pending'),
+                        'duplicate_of': duplicate['submission_id'],
+                        'message': 'Identical content was already submitted'
+                    })
+                }
+            metrics.count('dedupe.miss')
+        
         # Case 2: Second call - image uploaded, start moderation
-        elif image_key:
+        if image_key:
             sfn_client.start_execution(
                 stateMachineArn=state_machine_arn,
                 name=submission_id,
@@ -65,6 +362,7 @@ def lambda_handler(event, context):
                     'submission_id': submission_id,
                     'text': text,
                     'image_key': image_key,
+                    'content_hash': content_hash,
                     'created_at': datetime.now().isoformat()
                 })
             )
@@ -92,6 +390,7 @@ def lambda_handler(event, context):
                     'submission_id': submission_id,
                     'text': text,
                     'image_key': None,
+                    'content_hash': content_hash,
                     'created_at': datetime.now().isoformat()
                 })
             )
@@ -133,6 +432,7 @@ def lambda_handler(event, context):
             }
 
         # Any other error is real and should surface
+        release_claim(context, content_hash, submission_id)
         return {
             'statusCode': 500,
             'headers': {
@@ -142,3 +442,25 @@ def lambda_handler(event, context):
                 },
             'body': json.dumps({'error': 'Internal server error'})
         }
+
+    except Exception as e:
+        if not is_timeout(e):
+            raise
+        # Resubmitting with the same submission_id is safe: a started
+        # execution comes back as ExecutionAlreadyExists
+        print(f"Submit timed out for submission_id={submission_id}: {str(e)}")
+        # The client may never retry, and start_execution wasn't confirmed
+        release_claim(context, content_hash, submission_id)
+        return {
+            'statusCode': 503,
+            'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                    'Access-Control-Allow-Headers': 'Content-Type',
+                    'Retry-After': '2'
+                },
+            'body': json.dumps({
+                'submission_id': submission_id,
+                'error': 'Submission timed out, please retry'
+            })
+        }
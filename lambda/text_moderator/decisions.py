@@ -0,0 +1,27 @@
+import os
+
+# Reject on the local scorer's toxicity alone at or above this
+TOXICITY_REJECT = float(os.getenv('LOCAL_TOXICITY_REJECT', '0.8'))
+
+
+def decide(sentiment, confidence):
+    """
+    APPROVE: Only POSITIVE sentiment with high confidence
+    REJECT: NEGATIVE with high confidence
+    AMBIGUOUS: NEUTRAL, MIXED, or low confidence
+    """
+    if sentiment == 'POSITIVE' and confidence['Positive'] > 0.85:
+        return 'APPROVE'
+    if sentiment == 'NEGATIVE' and confidence['Negative'] > 0.85:
+        return 'REJECT'
+    return 'AMBIGUOUS'
+
+
+def decide_local(scores):
+    """decide() for the lexicon scorer, which also rejects toxic text and never approves it"""
+    if scores['Toxicity'] >= TOXICITY_REJECT:
+        return 'REJECT'
+    decision = decide(scores['Sentiment'], scores['SentimentScore'])
+    if decision == 'APPROVE' and scores['Toxicity'] > 0:
+        return 'AMBIGUOUS'
+    return decision
@@ -1,14 +1,140 @@
 import json
-import boto3
+import os
 from datetime import datetime
+from instrumentation import Metrics
+from deadline import Deadline, attempt_ms, client
+import near_dup
+from rate_limiter import AdaptiveRateLimiter, RateLimitTimeout, is_throttle
+from circuit_breaker import CircuitBreaker, CircuitOpen, is_outage
+from local_scorer import LexiconScorer
+from decisions import decide, decide_local
+from near_dup_index import MAX_DISTANCE, NearDupIndex, simhash
+from language_id import COMPREHEND_LANGUAGES, LanguageIdentifier
 
-comprehend = boto3.client('comprehend')
+metrics = Metrics('text_moderator')
 
+# Throttles are retried by the shared limiter, not by botocore, and reads
+# are capped at 5s so the circuit breaker notices an outage quickly
+MAX_READ_TIMEOUT = 5
+
+# Below this there's no point calling Comprehend; score locally instead
+MIN_CALL_MS = 1500
+
+comprehend_limiter = AdaptiveRateLimiter(
+    'comprehend:DetectSentiment',
+    initial_rate=float(os.getenv('COMPREHEND_INITIAL_TPS', '5')),
+    max_rate=float(os.getenv('COMPREHEND_MAX_TPS', '20')),
+    metrics=metrics
+)
+
+comprehend_breaker = CircuitBreaker('comprehend', metrics=metrics)
+
+# Loaded once per container; scores text when Comprehend can't
+local_scorer = LexiconScorer()
+
+# Loaded once per container; picks the LanguageCode for Comprehend
+language_identifier = LanguageIdentifier()
+
+# Used when the text is too short to identify; the local scorer's lexicon
+# is in this language too
+DEFAULT_LANGUAGE = 'en'
+
+# Score locally before calling Comprehend, and reject clearly toxic text
+# without calling it
+LOCAL_PREFILTER = os.getenv('LOCAL_PREFILTER', 'false') == 'true'
+
+# reuse: a close match to an earlier text takes its decision, without Comprehend
+# flag: Comprehend still decides; the match is reported as near_duplicate_of
+# off: no near-duplicate lookups
+NEAR_DUP_MODE = os.getenv('NEAR_DUP_MODE', 'reuse') if near_dup.ANALYTICS_BUCKET else 'off'
+NEAR_DUP_DISTANCE = min(int(os.getenv('NEAR_DUP_DISTANCE', str(MAX_DISTANCE))), MAX_DISTANCE)
+
+# Recent signatures, loaded on the first invocation and kept fresh after
+near_dup_index = NearDupIndex()
+
+class DeadlineTooClose(Exception):
+    """Too little of the invocation is left to call Comprehend"""
+
+def build_result(submission_id, decision, sentiment, confidence, source, **extra):
+    return {
+        'type': 'text',
+        'submission_id': submission_id,
+        'decision': decision,
+        'sentiment': sentiment,
+        'confidence_scores': {
+            'Positive': round(confidence['Positive'], 4),
+            'Negative': round(confidence['Negative'], 4),
+            'Neutral': round(confidence['Neutral'], 4),
+            'Mixed': round(confidence['Mixed'], 4)
+        },
+        'max_confidence': round(max([confidence['Positive'], confidence['Negative'], confidence['Neutral'], confidence['Mixed']]), 4),
+        'source': source,
+        'timestamp': datetime.now().isoformat(),
+        **extra
+    }
+
+def near_dup_result(submission_id, match, **extra):
+    """The earlier submission's text decision, reused"""
+    return {
+        'type': 'text',
+        'submission_id': submission_id,
+        'decision': match['decision'],
+        'sentiment': match['sentiment'],
+        'source': 'near_duplicate',
+        'near_duplicate_of': match['submission_id'],
+        'near_duplicate_distance': match['distance'],
+        'timestamp': datetime.now().isoformat(),
+        **extra
+    }
+
+def find_near_duplicate(deadline, signature):
+    """The earlier submission closest to signature, or None; never raises"""
+    try:
+        with metrics.stage('near_dup'):
+            added = near_dup_index.refresh(client('s3', deadline))
+            match = near_dup_index.nearest(signature, NEAR_DUP_DISTANCE)
+    except Exception as e:
+        # Without the index every text is simply moderated on its own
+        print(f"Near-duplicate lookup failed: {str(e)}")
+        metrics.count('near_dup.errors')
+        return None
+    if added:
+        metrics.put('near_dup.signatures', len(near_dup_index), unit='Count')
+    metrics.count('near_dup.hit' if match else 'near_dup.miss')
+    return match
+
+def unscored_result(submission_id, **extra):
+    """Nothing can score text in this language: a reviewer decides"""
+    return {
+        'type': 'text',
+        'submission_id': submission_id,
+        'decision': 'AMBIGUOUS',
+        'sentiment': None,
+        'source': 'language',
+        'timestamp': datetime.now().isoformat(),
+        **extra
+    }
+
+def local_result(submission_id, text, **extra):
+    with metrics.stage('local_score'):
+        scores = local_scorer.score(text)
+        decision = decide_local(scores)
+    return build_result(submission_id, decision, scores['Sentiment'], scores['SentimentScore'], 'local',
+                        toxicity=round(scores['Toxicity'], 4), **extra)
+
+@metrics.handler
 def lambda_handler(event, context):
     """
-    Analyzes text sentiment using AWS Comprehend
-    Returns: { type, decision, sentiment, confidence }
+    Analyzes text sentiment using AWS Comprehend, or the local lexicon
+    scorer when Comprehend is throttling, down or out of time. Text close
+    to a recently moderated one (SimHash within NEAR_DUP_DISTANCE bits)
+    reuses that decision, or is flagged with NEAR_DUP_MODE=flag.
+    The language is identified in process and passed to Comprehend; text
+    in a language Comprehend can't score goes to review unscored.
+    Returns: { type, decision, sentiment, confidence_scores, source, language, simhash }
     decision = APPROVE | REJECT | AMBIGUOUS
+    source = comprehend | local | near_duplicate | language (local results
+    are also marked degraded); only comprehend results are added to the index
     """
     try:
         # Extract from Step Functions input
@@ -28,41 +154,70 @@ def lambda_handler(event, context):
         
         
 
+        with metrics.stage('language'):
+            identified, reliable = language_identifier.identify(text)
+        language = identified if reliable else DEFAULT_LANGUAGE
+        metrics.count(f"language.{language if language in COMPREHEND_LANGUAGES else 'unsupported'}")
+        if language not in COMPREHEND_LANGUAGES:
+            print(f"Text moderation: {submission_id} - Decision: AMBIGUOUS (language {language})")
+            return unscored_result(submission_id, language=language)
+
+        signature = simhash(text)
+        fingerprint = {'language': language, **({'simhash': signature} if signature else {})}
+
+        if LOCAL_PREFILTER and language == DEFAULT_LANGUAGE:
+            result = local_result(submission_id, text, **fingerprint)
+            if result['decision'] == 'REJECT':
+                metrics.count('local.prefilter_reject')
+                print(f"Text moderation: {submission_id} - Decision: REJECT (local prefilter)")
+                return result
+
+        deadline = Deadline(context)
+        match = None
+        if signature and NEAR_DUP_MODE != 'off':
+            match = find_near_duplicate(deadline, signature)
+        if match and NEAR_DUP_MODE == 'reuse':
+            print(f"Text moderation: {submission_id} - Decision: {match['decision']} (near duplicate of {match['submission_id']})")
+            return near_dup_result(submission_id, match, **fingerprint)
+        if match:
+            fingerprint.update(near_duplicate_of=match['submission_id'], near_duplicate_distance=match['distance'])
+
         # Call Comprehend
-        response = comprehend.detect_sentiment(
-            Text=text,
-            LanguageCode='en'
-        )
+        try:
+            if deadline.expired(MIN_CALL_MS):
+                raise DeadlineTooClose(f"{deadline.remaining_ms()}ms left, not calling Comprehend")
+            comprehend = client('comprehend', deadline, max_attempts=1, max_read_timeout=MAX_READ_TIMEOUT)
+            response = comprehend_breaker.call(
+                comprehend_limiter.call,
+                comprehend.detect_sentiment,
+                max_wait=5,
+                deadline=deadline,
+                attempt_ms=attempt_ms(comprehend),
+                Text=text,
+                LanguageCode=language
+            )
+        except Exception as e:
+            if not isinstance(e, (CircuitOpen, DeadlineTooClose, RateLimitTimeout)) and \
+                    not is_throttle(e) and not is_outage(e):
+                raise
+            if language != DEFAULT_LANGUAGE:
+                # The lexicon is English only
+                print(f"Text moderation: {submission_id} - {str(e)}, no local scorer for {language}")
+                return unscored_result(submission_id, degraded=True, error=str(e), **fingerprint)
+            # Comprehend is throttling, down or we're out of time: score locally
+            print(f"Text moderation: {submission_id} - {str(e)}, using local scorer")
+            metrics.count('local.fallback')
+            result = local_result(submission_id, text, degraded=True, error=str(e), **fingerprint)
+            print(f"Text moderation: {submission_id} - Decision: {result['decision']} (local)")
+            return result
         
         sentiment = response['Sentiment']
         confidence = response['SentimentScore']
         
-        # Decision logic
-        # APPROVE: Only POSITIVE sentiment with high confidence
-        # REJECT: NEGATIVE with high confidence
-        # AMBIGUOUS: NEUTRAL, MIXED, or low confidence
-        
-        if sentiment == 'POSITIVE' and confidence['Positive'] > 0.85:
-            decision = 'APPROVE'
-        elif sentiment == 'NEGATIVE' and confidence['Negative'] > 0.85:
-            decision = 'REJECT'
-        else:
-            decision = 'AMBIGUOUS'
+        with metrics.stage('decision'):
+            decision = decide(sentiment, confidence)
         
-        result = {
-            'type': 'text',
-            'submission_id': submission_id,
-            'decision': decision,
-            'sentiment': sentiment,
-            'confidence_scores': {
-                'Positive': round(confidence['Positive'], 4),
-                'Negative': round(confidence['Negative'], 4),
-                'Neutral': round(confidence['Neutral'], 4),
-                'Mixed': round(confidence['Mixed'], 4)
-            },
-            'max_confidence': round(max([confidence['Positive'], confidence['Negative'], confidence['Neutral'], confidence['Mixed']]), 4),
-            'timestamp': datetime.now().isoformat()
-        }
+        result = build_result(submission_id, decision, sentiment, confidence, 'comprehend', **fingerprint)
         
         print(f"Text moderation: {submission_id} - Decision: {decision}")
         return result
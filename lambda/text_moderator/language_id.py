@@ -0,0 +1,106 @@
+import base64
+import json
+import os
+import re
+
+import numpy as np
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'language_model.json')
+
+# Languages DetectSentiment accepts
+COMPREHEND_LANGUAGES = frozenset(('ar', 'hi', 'ko', 'ja', 'zh', 'zh-TW', 'de', 'pt', 'en', 'it', 'fr', 'es'))
+
+# Letters per script. Texts mostly in one of the non-Latin scripts are
+# identified by it alone; Latin text goes to the trigram model.
+SCRIPTS = {
+    'Latn': re.compile(r"[a-zA-ZÀ-ɏ]"),
+    'Hang': re.compile(r"[가-힯ᄀ-ᇿ㄰-㆏]"),
+    'Kana': re.compile(r"[぀-ヿ]"),
+    'Hani': re.compile(r"[一-鿿㐀-䶿]"),
+    'Arab': re.compile(r"[؀-ۿݐ-ݿ]"),
+    'Deva': re.compile(r"[ऀ-ॿ]"),
+    'Cyrl': re.compile(r"[Ѐ-ӿ]"),
+    'Grek': re.compile(r"[Ͱ-Ͽ]"),
+    'Hebr': re.compile(r"[֐-׿]"),
+    'Thai': re.compile(r"[฀-๿]"),
+}
+SCRIPT_LANGUAGES = {'Hang': 'ko', 'Arab': 'ar', 'Deva': 'hi'}
+
+# Common characters that differ between Traditional and Simplified Chinese
+TRADITIONAL = frozenset('們這個國會時對來為學體開關長門問間見電話實點發現應進當經過還讓從頭無與請買賣愛東紙機車書說嗎濕飛適')
+SIMPLIFIED = frozenset('们这个国会时对来为学体开关长门问间见电话实点发现应进当经过还让从头无与请买卖爱东纸机车书说吗湿飞适')
+
+WORD = re.compile(r"[^\W\d_]+")
+
+# Only the start of long texts is looked at
+MAX_CHARS = 500
+
+# Latin text with fewer known trigrams than this, or a winner ahead by
+# less than MIN_MARGIN nats per trigram, isn't identified
+MIN_NGRAMS = 8
+MIN_MARGIN = 0.1
+
+
+def ngrams(text):
+    """Character trigrams of the lowercased words, each padded with spaces"""
+    grams = []
+    for word in WORD.findall(text[:MAX_CHARS].lower()):
+        padded = f" {word} "
+        grams.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class LanguageIdentifier:
+    """
+    Script detection plus a naive Bayes character-trigram model for Latin
+    script text. The model (language_model.json) is built by
+    tools/build_language_model.py: the most frequent trigrams of each
+    language's seed text and their int8-quantized log-probabilities.
+    """
+
+    def __init__(self, path=MODEL_PATH):
+        with open(path, encoding='utf-8') as f:
+            model = json.load(f)
+        self.languages = model['languages']
+        # Row 0 is every trigram the model doesn't know: no evidence either way
+        self.index = {gram: i + 1 for i, gram in enumerate(model['ngrams'])}
+        scores = np.frombuffer(base64.b64decode(model['scores']), dtype=np.int8)
+        self.log_probs = np.zeros((len(self.index) + 1, len(self.languages)), dtype=np.float32)
+        self.log_probs[1:] = scores.reshape(len(self.index), len(self.languages)) * np.float32(model['scale'])
+
+    def script(self, text):
+        """(dominant script, its letter count) of the start of text"""
+        sample = text[:MAX_CHARS]
+        counts = {name: len(pattern.findall(sample)) for name, pattern in SCRIPTS.items()}
+        # Japanese is kana and kanji together
+        if counts['Kana']:
+            counts['Kana'] += counts.pop('Hani')
+        name = max(counts, key=counts.get)
+        return name, counts[name]
+
+    def identify(self, text):
+        """
+        (language, reliable): a code from the model's languages (which
+        include Latin script ones Comprehend doesn't score) or from
+        SCRIPT_LANGUAGES, 'und-<Script>' for other scripts, or None when
+        there are no letters to go on
+        """
+        script, letters = self.script(text)
+        if not letters:
+            return None, False
+        if script == 'Kana':
+            return 'ja', True
+        if script == 'Hani':
+            traditional = sum(char in TRADITIONAL for char in text[:MAX_CHARS])
+            simplified = sum(char in SIMPLIFIED for char in text[:MAX_CHARS])
+            return ('zh-TW' if traditional > simplified else 'zh'), True
+        if script != 'Latn':
+            return SCRIPT_LANGUAGES.get(script, f"und-{script}"), True
+
+        indices = [i for i in (self.index.get(gram, 0) for gram in ngrams(text)) if i]
+        if not indices:
+            return None, False
+        totals = self.log_probs[indices].sum(axis=0)
+        ranked = np.argsort(totals)[::-1]
+        margin = (totals[ranked[0]] - totals[ranked[1]]) / len(indices)
+        return self.languages[ranked[0]], len(indices) >= MIN_NGRAMS and margin >= MIN_MARGIN
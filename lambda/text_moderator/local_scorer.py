@@ -0,0 +1,126 @@
+import os
+import re
+
+import numpy as np
+
+import text_normalizer
+
+LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lexicon.tsv')
+
+TOKEN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+# Flip (and damp) the valence of the next NEGATION_WINDOW tokens
+NEGATORS = frozenset(("not", "no", "never", "none", "nobody", "nothing", "neither", "nor", "cannot",
+                      "don't", "doesn't", "didn't", "isn't", "aren't", "wasn't", "weren't", "won't",
+                      "wouldn't", "can't", "couldn't", "shouldn't", "hardly"))
+NEGATION_WINDOW = 3
+NEGATION_FACTOR = -0.5
+
+# Scale the valence of the token right after
+INTENSIFIERS = {
+    "very": 1.5, "really": 1.4, "so": 1.3, "extremely": 1.8, "absolutely": 1.6, "totally": 1.5,
+    "completely": 1.5, "incredibly": 1.7, "super": 1.4, "too": 1.2,
+    "slightly": 0.6, "somewhat": 0.7, "kinda": 0.7, "barely": 0.5, "little": 0.8
+}
+
+# Sentiment mass that makes a text half neutral; weaker texts stay mostly
+# NEUTRAL, and only several strong words clear decide()'s 0.85 confidence
+NEUTRAL_MASS = 1.0
+
+SENTIMENTS = ('Positive', 'Negative', 'Neutral', 'Mixed')
+
+
+class LexiconScorer:
+    """
+    Lexicon sentiment and toxicity scorer, shaped like Comprehend's
+    DetectSentiment. Tokens are looked up in Python; negation, intensifiers
+    and the per-text sums are NumPy operations over every token of a
+    batch at once.
+    """
+
+    def __init__(self, path=LEXICON_PATH):
+        terms, valence, toxicity = [], [], []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                term, value, toxic = line.rstrip('\n').split('\t')
+                terms.append(term)
+                valence.append(float(value))
+                toxicity.append(float(toxic))
+        specials = sorted(NEGATORS | set(INTENSIFIERS))
+        # Index 0 is every unknown token
+        self.vocabulary = {term: i + 1 for i, term in enumerate(terms + [t for t in specials if t not in terms])}
+        size = len(self.vocabulary) + 1
+        self.valence = np.zeros(size)
+        self.toxicity = np.zeros(size)
+        self.valence[1:len(terms) + 1] = valence
+        self.toxicity[1:len(terms) + 1] = toxicity
+        self.negator = np.zeros(size, dtype=bool)
+        self.intensity = np.ones(size)
+        for term in specials:
+            index = self.vocabulary[term]
+            self.negator[index] = term in NEGATORS
+            self.intensity[index] = INTENSIFIERS.get(term, 1.0)
+
+    def _indices(self, text):
+        vocabulary = self.vocabulary
+        return [vocabulary.get(token, 0) for token in TOKEN.findall(text_normalizer.normalize(text))]
+
+    def score_batch(self, texts):
+        """
+        Arrays over texts: (probabilities shaped (n, 4) in SENTIMENTS order,
+        sentiment index per text, max toxicity per text)
+        """
+        n = len(texts)
+        if not n:
+            return np.zeros((0, len(SENTIMENTS))), np.zeros(0, dtype=np.int64), np.zeros(0)
+        per_text = [self._indices(text) for text in texts]
+        lengths = np.fromiter((len(indices) for indices in per_text), dtype=np.int64, count=n)
+        tokens = np.fromiter((i for indices in per_text for i in indices), dtype=np.int64, count=int(lengths.sum()))
+        owner = np.repeat(np.arange(n), lengths)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        position = np.arange(len(tokens)) - np.repeat(starts, lengths)
+
+        values = self.valence[tokens]
+
+        # Intensifier directly before a token, within the same text
+        boost = np.ones(len(tokens))
+        if len(tokens) > 1:
+            boost[1:] = np.where(position[1:] > 0, self.intensity[tokens[:-1]], 1.0)
+        values = values * boost
+
+        # Negator among the previous NEGATION_WINDOW tokens of the same text
+        negated_count = np.cumsum(self.negator[tokens])
+        before = np.concatenate(([0], negated_count))
+        window_start = np.maximum(np.arange(len(tokens)) - NEGATION_WINDOW, np.repeat(starts, lengths))
+        negated = (before[np.arange(len(tokens))] - before[window_start]) > 0
+        values = np.where(negated, values * NEGATION_FACTOR, values)
+
+        positive = np.bincount(owner, weights=np.clip(values, 0, None), minlength=n)
+        negative = np.bincount(owner, weights=np.clip(-values, 0, None), minlength=n)
+        toxicity = np.zeros(n)
+        np.maximum.at(toxicity, owner, self.toxicity[tokens])
+
+        total = positive + negative
+        neutral = NEUTRAL_MASS / (total + NEUTRAL_MASS)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mixed_share = np.where(total > 0, 2 * np.minimum(positive, negative) / total, 0.0)
+            positive_share = np.where(total > 0, positive / total, 0.0)
+        polar = (1 - neutral) * (1 - mixed_share)
+        probabilities = np.stack([
+            polar * positive_share,
+            polar * (1 - positive_share) * (total > 0),
+            neutral,
+            (1 - neutral) * mixed_share
+        ], axis=1)
+        return probabilities, probabilities.argmax(axis=1), toxicity
+
+    def score(self, text):
+        """{'Sentiment', 'SentimentScore', 'Toxicity'} for one text, like DetectSentiment"""
+        probabilities, sentiment, toxicity = self.score_batch([text])
+        return {
+            'Sentiment': SENTIMENTS[sentiment[0]].upper(),
+            'SentimentScore': {name: float(p) for name, p in zip(SENTIMENTS, probabilities[0])},
+            'Toxicity': float(toxicity[0])
+        }
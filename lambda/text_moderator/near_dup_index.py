@@ -0,0 +1,186 @@
+import hashlib
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+import near_dup
+import text_normalizer
+
+WORD = re.compile(r"\w+")
+
+# Below this, one changed word moves a signature as far as an unrelated
+# text's; shorter texts are never indexed or matched
+MIN_TOKENS = 6
+
+# Six blocks: two signatures within 5 bits agree exactly on at least one
+# block, so looking up each block in a table sorted by it finds every
+# match within MAX_DISTANCE without comparing against everything
+BLOCK_BITS = (11, 11, 11, 11, 10, 10)
+BLOCK_SHIFTS = tuple(sum(BLOCK_BITS[:i]) for i in range(len(BLOCK_BITS)))
+MAX_DISTANCE = len(BLOCK_BITS) - 1
+
+RECORDS = np.dtype([('signature', '<u8'), ('decision', 'u1'), ('sentiment', 'u1'), ('submission_id', 'S36')])
+assert RECORDS.itemsize == near_dup.RECORD.size
+
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def simhash(text):
+    """
+    64-bit SimHash over the words of the normalized text, as 16 hex
+    digits; None for texts shorter than MIN_TOKENS words. Words alone move
+    the signature less per edited word than word pairs or character
+    n-grams do (see tools/near_dup_benchmark.py)
+    """
+    features = WORD.findall(text_normalizer.normalize(text))
+    if len(features) < MIN_TOKENS:
+        return None
+    digests = b''.join(hashlib.blake2b(f.encode('utf-8'), digest_size=8).digest() for f in features)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8)).reshape(len(features), 64)
+    # Each feature votes +1/-1 per bit; the signature keeps the majority
+    votes = bits.sum(axis=0, dtype=np.int32) * 2 - len(features)
+    signature = np.packbits(votes > 0).view('>u8')[0]
+    return f"{int(signature):016x}"
+
+
+def distances(signatures, signature):
+    """Hamming distance from signature to each of signatures (uint64)"""
+    return POPCOUNT[(signatures ^ np.uint64(signature)).view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class Generation:
+    """
+    One segment's records, with one table per block: record indices ordered
+    by that block's value, and where each value's run starts
+    """
+
+    def __init__(self, data=b''):
+        self.data = data
+        self.records = np.frombuffer(data, dtype=RECORDS)
+        self.signatures = np.ascontiguousarray(self.records['signature'])
+        self.tables = []
+        for shift, bits in zip(BLOCK_SHIFTS, BLOCK_BITS):
+            keys = ((self.signatures >> np.uint64(shift)) & np.uint64((1 << bits) - 1)).astype(np.uint16)
+            order = np.argsort(keys, kind='stable').astype(np.uint32)
+            starts = np.zeros((1 << bits) + 1, dtype=np.uint32)
+            np.cumsum(np.bincount(keys, minlength=1 << bits), out=starts[1:])
+            self.tables.append((starts, order))
+
+    def __len__(self):
+        return len(self.records)
+
+    def nearest(self, signature, max_distance):
+        """(distance, record index) of the closest record within max_distance, or None"""
+        candidates = []
+        for shift, bits, (starts, order) in zip(BLOCK_SHIFTS, BLOCK_BITS, self.tables):
+            key = (signature >> shift) & ((1 << bits) - 1)
+            lo, hi = starts[key], starts[key + 1]
+            if hi > lo:
+                candidates.append(order[lo:hi])
+        if not candidates:
+            return None
+        candidates = np.concatenate(candidates)
+        found = distances(self.signatures[candidates], signature)
+        best = int(found.argmin())
+        if found[best] > max_distance:
+            return None
+        return int(found[best]), int(candidates[best])
+
+    def match(self, index, distance):
+        record = self.records[index]
+        return {
+            'submission_id': record['submission_id'].decode('ascii'),
+            'decision': near_dup.DECISIONS[record['decision']],
+            'sentiment': near_dup.SENTIMENTS[record['sentiment']],
+            'distance': distance
+        }
+
+
+class NearDupIndex:
+    """
+    The newest near_dup hours, held per container, at most every
+    refresh_seconds. A closed hour is one GET of its compacted segment,
+    once; the two newest are read batch by batch, listing only the keys
+    written since the last refresh and fetching those in parallel.
+    """
+
+    def __init__(self, bucket=near_dup.ANALYTICS_BUCKET, generations=near_dup.NEAR_DUP_GENERATIONS,
+                 refresh_seconds=30, workers=8):
+        self.bucket = bucket
+        self.generations = generations
+        self.refresh_seconds = refresh_seconds
+        self.workers = workers
+        self.segments = {}
+        # Hours still being written: (ms the last listing started, batch keys loaded)
+        self.listed = {}
+        self.refreshed_at = None
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments.values())
+
+    def _list(self, s3, hour):
+        """(ms this listing started, keys of hour's batches not loaded yet)"""
+        started = int(time.time() * 1000)
+        since, loaded = self.listed.get(hour, (0, set()))
+        since = since - near_dup.MAX_WRITE_MS if since else 0
+        return started, [key for key in near_dup.list_batches(s3, hour, since, self.bucket) if key not in loaded]
+
+    def _add(self, hour, data):
+        """Index data's records under hour, up to MAX_PER_GENERATION; returns how many"""
+        previous = self.segments[hour].data if hour in self.segments else b''
+        room = max(0, near_dup.MAX_PER_GENERATION - len(previous) // RECORDS.itemsize)
+        whole = min(room, len(data) // RECORDS.itemsize)
+        if not whole and hour in self.segments:
+            return 0
+        self.segments[hour] = Generation(previous + data[:whole * RECORDS.itemsize])
+        return whole
+
+    def refresh(self, s3, now=None):
+        """Load what's new; returns how many records were added"""
+        if self.refreshed_at is not None and time.monotonic() - self.refreshed_at < self.refresh_seconds:
+            return 0
+        hours = near_dup.recent_hours(now or datetime.now(timezone.utc), self.generations)
+        live = hours[:2]
+        closed = [hour for hour in hours[2:] if hour not in self.segments]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            fetched = dict(zip(closed, pool.map(
+                lambda hour: near_dup.fetch(s3, near_dup.segment_key(hour), self.bucket), closed)))
+            # A closed hour nobody has compacted yet is read like a live one
+            unlisted = live + [hour for hour in closed if fetched[hour] is None]
+            listed = dict(zip(unlisted, pool.map(lambda hour: self._list(s3, hour), unlisted)))
+            keys = [key for _, new in listed.values() for key in new]
+            batches = dict(zip(keys, pool.map(lambda key: near_dup.fetch(s3, key, self.bucket) or b'', keys)))
+        added = 0
+        for hour in hours:
+            if hour in listed:
+                started, new = listed[hour]
+                added += self._add(hour, b''.join(batches[key] for key in new))
+                if hour in live:
+                    # Keys before the next listing's start can't come up again
+                    floor = f"{near_dup.batch_prefix(hour)}{started - near_dup.MAX_WRITE_MS:013d}"
+                    loaded = self.listed.get(hour, (0, set()))[1] | set(new)
+                    self.listed[hour] = (started, {key for key in loaded if key >= floor})
+            elif fetched.get(hour) is not None:
+                added += self._add(hour, fetched[hour])
+        self.segments = {hour: self.segments[hour] for hour in hours if hour in self.segments}
+        self.listed = {hour: self.listed[hour] for hour in live if hour in self.listed}
+        self.refreshed_at = time.monotonic()
+        return added
+
+    def nearest(self, signature_hex, max_distance=MAX_DISTANCE):
+        """The closest earlier submission within max_distance bits, newest segment first on ties, or None"""
+        signature = int(signature_hex, 16)
+        best = None
+        for segment in self.segments.values():
+            found = segment.nearest(signature, max_distance)
+            if found and (best is None or found[0] < best[0]):
+                best = (found[0], segment, found[1])
+                if found[0] == 0:
+                    break
+        if best is None:
+            return None
+        distance, segment, index = best
+        return segment.match(index, distance)
@@ -0,0 +1,59 @@
+import os
+from botocore.exceptions import ClientError
+from instrumentation import Metrics
+from deadline import Deadline, client, resource
+import queue_version
+import upload_keys
+import thumbnails
+
+metrics = Metrics('thumbnailer')
+
+@metrics.handler
+def lambda_handler(event, context):
+    """
+    Invoked asynchronously by outbox_worker when decision_handler routes
+    an item with an image to REVIEW.
+    Writes a small thumbnail under thumbs/ and records it on the review
+    item as thumb_key, so the admin list loads thumbnails and fetches the
+    original only when a reviewer opens it.
+    Returns: { submission_id, thumb_key } or { submission_id, skipped }
+    """
+    submission_id = event.get('submission_id')
+    image_key = event.get('image_key')
+    if not submission_id or not image_key:
+        return {'submission_id': submission_id, 'skipped': 'no image'}
+
+    deadline = Deadline(context)
+    bucket = os.getenv('UPLOADS_BUCKET')
+    s3 = client('s3', deadline)
+
+    with metrics.stage('download'):
+        source = s3.get_object(Bucket=bucket, Key=upload_keys.resolve(s3, bucket, image_key))['Body'].read()
+    with metrics.stage('resize'):
+        data, content_type, ext = thumbnails.make_thumbnail(source)
+    metrics.put('original_bytes', len(source), unit='Bytes')
+    metrics.put('thumb_bytes', len(data), unit='Bytes')
+
+    key = upload_keys.thumb_key(submission_id, ext)
+    with metrics.stage('upload'):
+        s3.put_object(Bucket=bucket, Key=key, Body=data, ContentType=content_type)
+
+    dynamodb = resource('dynamodb', deadline)
+    review_table = dynamodb.Table(os.getenv('REVIEW_TABLE'))
+    try:
+        review_table.update_item(
+            Key={'submission_id': submission_id},
+            UpdateExpression='SET thumb_key = :key',
+            ConditionExpression='#status = :pending',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':key': key, ':pending': 'PENDING_REVIEW'}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        # Decided already; the thumbs/ lifecycle rule removes the object
+        return {'submission_id': submission_id, 'skipped': 'already decided'}
+    # Lists cached without the thumbnail must be fetched again
+    queue_version.bump(dynamodb)
+
+    return {'submission_id': submission_id, 'thumb_key': key}
@@ -0,0 +1,36 @@
+import io
+
+from PIL import Image, ImageOps, features
+
+# Longest edge of a thumbnail; cards on the admin page are ~350px wide
+MAX_EDGE = 320
+
+WEBP_QUALITY = 70
+JPEG_QUALITY = 75
+
+# Refuse decompression bombs long before they exhaust the function's memory
+Image.MAX_IMAGE_PIXELS = 50 * 1000 * 1000
+
+
+def make_thumbnail(data, max_edge=MAX_EDGE):
+    """
+    (thumbnail bytes, content type, extension) for an encoded image: WebP
+    when this Pillow build has it, else progressive JPEG. Only the first
+    frame of animated images is used.
+    """
+    image = Image.open(io.BytesIO(data))
+    # JPEG can decode straight to 1/2 .. 1/8 scale, far cheaper than
+    # decoding full size and resizing afterwards
+    image.draft('RGB', (max_edge, max_edge))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = image.mode in ('LA', 'PA') or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    out = io.BytesIO()
+    if features.check('webp'):
+        image.save(out, 'WEBP', quality=WEBP_QUALITY, method=4)
+        return out.getvalue(), 'image/webp', '.webp'
+    image.convert('RGB').save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return out.getvalue(), 'image/jpeg', '.jpg'
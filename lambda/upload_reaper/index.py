@@ -0,0 +1,201 @@
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from instrumentation import Metrics
+from deadline import Deadline, client
+import upload_keys
+
+metrics = Metrics('upload_reaper')
+
+# Objects younger than this may still belong to a run in flight or a
+# presigned URL that hasn't been used yet
+REAP_AFTER_SECONDS = int(os.getenv('REAP_AFTER_SECONDS', str(24 * 3600)))
+
+# Concurrent partition listings; botocore pools 10 connections per client
+WORKERS = int(os.getenv('REAPER_WORKERS', '10'))
+
+# DeleteObjects takes at most 1000 keys, BatchGetItem at most 100 keys,
+# which is 33 submissions looked up in all three tables
+DELETE_BATCH = 1000
+LOOKUP_BATCH = 33
+
+# Left for the deletes still buffered once listing stops
+STOP_LISTING_MS = 60000
+
+def partitions():
+    """uploads/00/ .. uploads/ff/, one per hashed prefix"""
+    return [f"{upload_keys.UPLOAD_PREFIX}{i:02x}/" for i in range(256)]
+
+def list_partition(s3, bucket, prefix, cutoff):
+    """
+    (listed, {submission_id: [keys]}) for the objects under prefix older
+    than cutoff. Content-addressed objects are shared between submissions
+    and never reaped.
+    """
+    listed = 0
+    candidates = {}
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            listed += 1
+            if obj['LastModified'] >= cutoff:
+                continue
+            submission_id = upload_keys.submission_id_from_key(obj['Key'])
+            if submission_id:
+                candidates.setdefault(submission_id, []).append(obj['Key'])
+    return listed, candidates
+
+def lookup_statuses(dynamodb, tables, submission_ids):
+    """{submission_id: {status, ...}} across the tables, from BatchGetItem"""
+    statuses = {}
+    request_items = {
+        table: {
+            'Keys': [{'submission_id': {'S': sid}} for sid in submission_ids],
+            'ProjectionExpression': 'submission_id, #status',
+            'ExpressionAttributeNames': {'#status': 'status'}
+        }
+        for table in tables
+    }
+    for attempt in range(8):
+        result = dynamodb.batch_get_item(RequestItems=request_items)
+        for items in result.get('Responses', {}).values():
+            for item in items:
+                statuses.setdefault(item['submission_id']['S'], set()).add(item.get('status', {}).get('S'))
+        request_items = result.get('UnprocessedKeys') or {}
+        if not request_items:
+            return statuses
+        time.sleep(random.uniform(0, 0.05 * 2 ** attempt))
+    raise RuntimeError(f"BatchGetItem left {sum(len(r['Keys']) for r in request_items.values())} keys unprocessed")
+
+def verdict(statuses):
+    """
+    Why the image of a submission with these statuses can go, or None to
+    keep it. Approved content is served; a pending review still needs its
+    image; a rejection (the review item stays behind as REJECTED) doesn't.
+    """
+    if 'APPROVED' in statuses:
+        return None
+    if 'REJECTED' in statuses:
+        return 'rejected'
+    if statuses:
+        return None
+    return 'orphaned'
+
+def reap_partition(s3, dynamodb, bucket, tables, prefix, cutoff):
+    """(listed, kept, {reason: [keys]}) for one partition"""
+    listed, candidates = list_partition(s3, bucket, prefix, cutoff)
+    submission_ids = list(candidates)
+    doomed = {}
+    kept = 0
+    for start in range(0, len(submission_ids), LOOKUP_BATCH):
+        chunk = submission_ids[start:start + LOOKUP_BATCH]
+        statuses = lookup_statuses(dynamodb, tables, chunk)
+        for submission_id in chunk:
+            reason = verdict(statuses.get(submission_id, set()))
+            if reason:
+                doomed.setdefault(reason, []).extend(candidates[submission_id])
+            else:
+                kept += len(candidates[submission_id])
+    return listed, kept, doomed
+
+def delete_keys(s3, bucket, keys, dry_run):
+    """Deleted count for one DeleteObjects batch; per-key failures are logged"""
+    if dry_run:
+        return len(keys)
+    result = s3.delete_objects(
+        Bucket=bucket,
+        Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+    )
+    errors = result.get('Errors', [])
+    for error in errors[:10]:
+        print(f"Could not delete {error.get('Key')}: {error.get('Code')} {error.get('Message')}")
+    if errors:
+        metrics.count('delete.errors', len(errors))
+    return len(keys) - len(errors)
+
+@metrics.handler
+def lambda_handler(event, context):
+    """
+    Scheduled. Lists every hashed upload partition in parallel, looks the
+    submissions up in the approved, review and rejected tables and deletes
+    the images of rejected submissions and of submissions that never
+    reached a table (abandoned presigned uploads, deduplicated resubmissions,
+    expired items). Pass {"dry_run": true} to only count.
+
+    Legacy keys (uploads/<timestamp>-<filename>) aren't listed; migrate
+    them with tools/migrate_upload_keys.py first.
+    """
+    deadline = Deadline(context)
+    dry_run = bool((event or {}).get('dry_run'))
+    bucket = os.getenv('UPLOADS_BUCKET')
+    tables = [os.getenv('APPROVED_TABLE'), os.getenv('REVIEW_TABLE'), os.getenv('REJECTED_TABLE')]
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=REAP_AFTER_SECONDS)
+
+    s3 = client('s3', deadline)
+    dynamodb = client('dynamodb', deadline)
+
+    started = time.perf_counter()
+    listed = kept = deleted = 0
+    reasons = {}
+    pending = []
+    remaining = partitions()
+
+    def flush(keys):
+        nonlocal deleted
+        with metrics.stage('delete'):
+            deleted += delete_keys(s3, bucket, keys, dry_run)
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        futures = {}
+        while remaining or futures:
+            # Keep WORKERS listings running, and stop starting new ones
+            # while there's still time to delete what's been found
+            while remaining and len(futures) < WORKERS and not deadline.expired(STOP_LISTING_MS):
+                prefix = remaining.pop(0)
+                futures[pool.submit(reap_partition, s3, dynamodb, bucket, tables, prefix, cutoff)] = prefix
+            if not futures:
+                break
+            future = next(as_completed(futures))
+            prefix = futures.pop(future)
+            try:
+                partition_listed, partition_kept, doomed = future.result()
+            except Exception as e:
+                # The next run picks the partition up again
+                print(f"Partition {prefix} failed: {str(e)}")
+                metrics.count('partition.errors')
+                continue
+            listed += partition_listed
+            kept += partition_kept
+            for reason, keys in doomed.items():
+                reasons[reason] = reasons.get(reason, 0) + len(keys)
+                pending.extend(keys)
+            while len(pending) >= DELETE_BATCH:
+                flush(pending[:DELETE_BATCH])
+                pending = pending[DELETE_BATCH:]
+    if pending:
+        flush(pending)
+
+    elapsed = max(time.perf_counter() - started, 1e-6)
+    metrics.count('objects.listed', listed)
+    metrics.count('objects.kept', kept)
+    metrics.count('objects.deleted', deleted)
+    for reason, count in reasons.items():
+        metrics.count(f"objects.{reason}", count)
+    metrics.put('listed_per_second', listed / elapsed, unit='Count/Second')
+    metrics.put('deleted_per_second', deleted / elapsed, unit='Count/Second')
+
+    summary = {
+        'dry_run': dry_run,
+        'partitions_left': len(remaining),
+        'listed': listed,
+        'kept': kept,
+        'deleted': deleted,
+        'reasons': reasons,
+        'seconds': round(elapsed, 3),
+        'listed_per_second': round(listed / elapsed, 1),
+        'deleted_per_second': round(deleted / elapsed, 1)
+    }
+    print(f"Upload reaper: {summary}")
+    return summary
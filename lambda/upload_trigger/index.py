@@ -0,0 +1,76 @@
+import json
+import os
+from datetime import datetime
+from urllib.parse import unquote_plus
+from botocore.exceptions import ClientError
+from instrumentation import Metrics
+from deadline import Deadline, client
+import dedupe
+import upload_metadata
+
+metrics = Metrics('upload_trigger')
+
+def start_moderation(deadline, bucket, key, etag):
+    """
+    Start the state machine for one uploaded object, using the submission
+    carried in its metadata. Returns what happened, for the log.
+    """
+    s3 = client('s3', deadline)
+    metadata = s3.head_object(Bucket=bucket, Key=key).get('Metadata', {})
+    submission_id = metadata.get(upload_metadata.SUBMISSION_ID)
+    if not submission_id:
+        # Uploaded through the presigned PUT flow; its second /submit call starts it
+        return 'skipped'
+    text = upload_metadata.decode_text(metadata.get(upload_metadata.TEXT))
+
+    content_hash = None
+    if dedupe.enabled():
+        dynamodb = client('dynamodb', deadline)
+        content_hash = dedupe.content_hash(text, etag)
+        duplicate = dedupe.claim(dynamodb, content_hash, submission_id)
+        if duplicate:
+            metrics.count('dedupe.hit')
+            dedupe.link_alias(dynamodb, submission_id, duplicate['submission_id'])
+            return f"duplicate of {duplicate['submission_id']}"
+        metrics.count('dedupe.miss')
+
+    try:
+        client('stepfunctions', deadline).start_execution(
+            stateMachineArn=os.getenv('STATE_MACHINE_ARN'),
+            name=submission_id,
+            input=json.dumps({
+                'submission_id': submission_id,
+                'text': text,
+                'image_key': key,
+                'content_hash': content_hash,
+                'created_at': datetime.now().isoformat()
+            })
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ExecutionAlreadyExists':
+            if content_hash:
+                dedupe.release(client('dynamodb', deadline), content_hash, submission_id)
+            raise
+        # S3 delivered the notification twice
+        return 'already started'
+    return 'started'
+
+@metrics.handler
+def lambda_handler(event, context):
+    """
+    S3 ObjectCreated on uploads/
+    Starts moderation for objects uploaded with the presigned POST from
+    POST /submit (upload='post'), which carries submission_id and text as
+    object metadata. Errors are raised so S3's async invoke retries them.
+    """
+    deadline = Deadline(context)
+    results = []
+    for record in event.get('Records', []):
+        bucket = record['s3']['bucket']['name']
+        key = unquote_plus(record['s3']['object']['key'])
+        etag = record['s3']['object'].get('eTag')
+        outcome = start_moderation(deadline, bucket, key, etag)
+        metrics.count(f"uploads.{outcome.split(' ')[0]}")
+        print(f"Upload {key}: {outcome}")
+        results.append({'key': key, 'outcome': outcome})
+    return {'results': results}
@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+# Functions import the shared layer as top-level modules, as in Lambda
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'common', 'python'))
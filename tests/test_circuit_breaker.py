@@ -0,0 +1,89 @@
+import pytest
+from botocore.exceptions import ClientError, ConnectTimeoutError
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker
+from rate_limiter import RateLimitTimeout
+
+
+def client_error(code, status):
+    return ClientError({'Error': {'Code': code}, 'ResponseMetadata': {'HTTPStatusCode': status}}, 'DetectSentiment')
+
+
+@pytest.fixture
+def outcomes(monkeypatch):
+    recorded = []
+    for outcome in ('success', 'failure', 'neutral'):
+        monkeypatch.setattr(CircuitBreaker, f"record_{outcome}",
+                            lambda self, outcome=outcome: recorded.append(outcome))
+    return recorded
+
+
+def raising(error):
+    def fn():
+        raise error
+    return fn
+
+
+@pytest.mark.parametrize('error, outcome', [
+    (client_error('InternalServerException', 500), 'failure'),
+    (ConnectTimeoutError(endpoint_url='https://comprehend'), 'failure'),
+    (client_error('ThrottlingException', 400), 'success'),
+    (client_error('TextSizeLimitExceededException', 400), 'success'),
+    (RateLimitTimeout('no token within 5s'), 'neutral'),
+    (ValueError('not from the service'), 'neutral'),
+])
+def test_only_service_answers_count(outcomes, error, outcome):
+    breaker = CircuitBreaker('test', table_name=None)
+    with pytest.raises(type(error)):
+        breaker.call(raising(error))
+    assert outcomes == [outcome]
+
+
+def test_return_is_success(outcomes):
+    assert CircuitBreaker('test', table_name=None).call(lambda: 'ok') == 'ok'
+    assert outcomes == ['success']
+
+
+def test_neutral_probe_gives_up_its_lease():
+    breaker = CircuitBreaker('test', table_name=None)
+    breaker._probing = True
+    with pytest.raises(RateLimitTimeout):
+        breaker.call(raising(RateLimitTimeout('no token within 5s')))
+    assert not breaker._probing
+
+
+class FakeDynamoDB:
+    """One breaker item; update_item applies the ADD/SET failure count, put_item checks version"""
+
+    def __init__(self, item):
+        self.item = item
+        self.reads = 0
+
+    def get_item(self, TableName, Key, ConsistentRead=False):
+        self.reads += 1
+        return {'Item': dict(self.item)}
+
+    def update_item(self, UpdateExpression, ReturnValues, **kwargs):
+        assert UpdateExpression == 'ADD failures :one SET version = version + :one'
+        for name in ('failures', 'version'):
+            self.item[name] = {'N': str(int(self.item[name]['N']) + 1)}
+        return {'Attributes': {name: self.item[name] for name in ('failures', 'version')}}
+
+    def put_item(self, Item, ConditionExpression, ExpressionAttributeValues=None, **kwargs):
+        if ExpressionAttributeValues[':expected'] != self.item['version']:
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'PutItem')
+        self.item = Item
+
+
+def test_counted_failures_bump_the_cached_version(monkeypatch):
+    breaker = CircuitBreaker('test', failure_threshold=2, table_name='breakers')
+    dynamodb = FakeDynamoDB(breaker._to_item(dict(breaker._closed_state(3), failures=0)))
+    monkeypatch.setattr(circuit_breaker, 'dynamodb_client', lambda: dynamodb)
+    assert breaker.allow()
+
+    breaker.record_failure()
+    assert (breaker._state['failures'], breaker._state['version']) == (1, 4)
+    breaker.record_failure()
+    assert dynamodb.item['state']['S'] == 'OPEN' and dynamodb.item['version']['N'] == '6'
+    assert dynamodb.reads == 1
@@ -0,0 +1,23 @@
+import pytest
+
+from deadline import TIMEOUT_TIERS, call_budget, max_backoff
+
+
+def test_backoff_grows_and_caps():
+    assert max_backoff(1) == 0
+    assert max_backoff(3) == 1 + 2
+    assert max_backoff(8) == 1 + 2 + 4 + 8 + 16 + 20 + 20
+
+
+@pytest.mark.parametrize('remaining_ms', [500, 1000, 3000, 5000, 7500, 10000, 15000, 30000])
+@pytest.mark.parametrize('max_read_timeout', [None, 5])
+def test_attempts_and_backoff_fit_the_time_left(remaining_ms, max_read_timeout):
+    connect, read, attempts = call_budget(remaining_ms, max_read_timeout=max_read_timeout)
+    if (connect, read, attempts) != (*TIMEOUT_TIERS[0], 1):
+        assert attempts * (connect + read) + max_backoff(attempts) <= remaining_ms / 1000
+
+
+def test_ten_seconds_leaves_room_for_backoff():
+    # Three 3s attempts plus up to 3s of sleeps would overrun
+    connect, read, attempts = call_budget(10000)
+    assert (connect, read, attempts) == (0.5, 1.0, 3)
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'text_moderator'))
+from local_scorer import SENTIMENTS, LexiconScorer  # noqa: E402
+
+
+@pytest.fixture(scope='module')
+def scorer():
+    return LexiconScorer()
+
+
+def test_empty_batch(scorer):
+    probabilities, sentiment, toxicity = scorer.score_batch([])
+    assert probabilities.shape == (0, len(SENTIMENTS))
+    assert sentiment.shape == toxicity.shape == (0,)
+
+
+def test_texts_without_tokens_are_neutral(scorer):
+    probabilities, sentiment, toxicity = scorer.score_batch(['', '!!!', '123'])
+    assert [SENTIMENTS[i] for i in sentiment] == ['Neutral'] * 3
+    assert np.allclose(probabilities.sum(axis=1), 1) and not toxicity.any()
+
+
+def test_batch_matches_one_at_a_time(scorer):
+    texts = ['I really love this', 'not good at all', '', 'this is terrible and awful']
+    probabilities, _, toxicity = scorer.score_batch(texts)
+    for i, text in enumerate(texts):
+        single, _, single_toxicity = scorer.score_batch([text])
+        assert np.allclose(probabilities[i], single[0]) and toxicity[i] == single_toxicity[0]
@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta, timezone
+
+from botocore.exceptions import ClientError
+
+import near_dup
+
+NOW = datetime(2026, 10, 19, 9, 30, tzinfo=timezone.utc)
+
+
+class Body:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class FakeS3:
+    """Just enough of S3 for near_dup: keys in memory, listed a page of two at a time"""
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, IfNoneMatch=None):
+        if IfNoneMatch == '*' and Key in self.objects:
+            raise ClientError({'Error': {'Code': 'PreconditionFailed'}}, 'PutObject')
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        return {'Body': Body(self.objects[Key])}
+
+    def head_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+        return {}
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix, StartAfter=''):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix) and key > StartAfter)
+        for start in range(0, len(keys), 2):
+            yield {'Contents': [{'Key': key} for key in keys[start:start + 2]]}
+
+
+def record(i):
+    return near_dup.pack(f"{i:016x}", 'REJECT', 'NEGATIVE', f"submission-{i}")
+
+
+def test_batches_are_new_objects_in_their_hour():
+    s3 = FakeS3()
+    first = near_dup.write_batch(s3, [record(1), record(2)], '100', NOW, bucket='b')
+    second = near_dup.write_batch(s3, [record(3)], '200', NOW + timedelta(seconds=1), bucket='b')
+    assert first.startswith('near_dup/2026-10-19T09/') and first != second
+    assert s3.objects[first] == record(1) + record(2)
+    assert near_dup.list_batches(s3, '2026-10-19T09', bucket='b') == [first, second]
+
+
+def test_listing_starts_at_a_time():
+    s3 = FakeS3()
+    keys = [near_dup.write_batch(s3, [record(i)], str(i), NOW + timedelta(seconds=i), bucket='b') for i in range(5)]
+    since = int((NOW + timedelta(seconds=3)).timestamp() * 1000)
+    assert near_dup.list_batches(s3, '2026-10-19T09', since, bucket='b') == keys[3:]
+
+
+def test_compaction_joins_a_closed_hour_once():
+    s3 = FakeS3()
+    for i in range(3):
+        near_dup.write_batch(s3, [record(i)], str(i), NOW + timedelta(seconds=i), bucket='b')
+    assert near_dup.compact(s3, '2026-10-19T09', bucket='b')
+    assert s3.objects['near_dup/2026-10-19T09.bin'] == record(0) + record(1) + record(2)
+    assert not near_dup.compact(s3, '2026-10-19T09', bucket='b')
+
+
+def test_fetch_of_a_missing_key_is_none():
+    assert near_dup.fetch(FakeS3(), 'near_dup/2026-10-19T09.bin', bucket='b') is None
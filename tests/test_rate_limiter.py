@@ -0,0 +1,65 @@
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from rate_limiter import AdaptiveRateLimiter, RateLimitTimeout
+
+
+class FakeDeadline:
+    def __init__(self, remaining_ms):
+        self.remaining = remaining_ms
+
+    def remaining_ms(self):
+        return self.remaining
+
+
+def throttling(deadline, calls, cost_ms):
+    def fn():
+        calls.append(deadline.remaining)
+        deadline.remaining -= cost_ms
+        raise ClientError({'Error': {'Code': 'ThrottlingException'}}, 'DetectSentiment')
+    return fn
+
+
+def test_no_attempt_without_time_for_it():
+    limiter = AdaptiveRateLimiter('test', table_name=None)
+    calls = []
+    deadline = FakeDeadline(1000)
+    with pytest.raises(RateLimitTimeout):
+        limiter.call(throttling(deadline, calls, 0), deadline=deadline, attempt_ms=5000)
+    assert calls == []
+
+
+def test_retries_stop_at_the_deadline():
+    limiter = AdaptiveRateLimiter('test', table_name=None)
+    calls = []
+    deadline = FakeDeadline(12000)
+    with pytest.raises(ClientError):
+        limiter.call(throttling(deadline, calls, 5000), deadline=deadline, attempt_ms=5000)
+    assert calls == [12000, 7000]
+
+
+def test_retries_without_a_deadline():
+    limiter = AdaptiveRateLimiter('test', table_name=None)
+    calls = []
+    with pytest.raises(ClientError):
+        limiter.call(throttling(FakeDeadline(0), calls, 0))
+    assert len(calls) == limiter.max_attempts
+
+
+def test_lost_writes_time_out(monkeypatch):
+    limiter = AdaptiveRateLimiter('test', table_name='limits', max_wait=0.1)
+    writes = []
+
+    def lose(old, new):
+        writes.append(new)
+        return dict(limiter._initial_state(), version=old['version'] + 1)
+
+    monkeypatch.setattr(limiter, '_load', limiter._initial_state)
+    monkeypatch.setattr(limiter, '_write', lose)
+    started = time.monotonic()
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire()
+    assert 1 < len(writes) <= 10
+    assert time.monotonic() - started < 0.2
@@ -0,0 +1,57 @@
+from botocore.exceptions import ClientError
+
+import review_leases
+
+NOW = 1_800_000_000
+
+
+class FakeReviewTable:
+    """Pending items in age order; update_item applies the lease condition in Python"""
+
+    def __init__(self, items):
+        self.items = {item['submission_id']: item for item in items}
+        self.order = [item['submission_id'] for item in items]
+        self.queries = []
+
+    def query(self, Limit, ExclusiveStartKey=None, **kwargs):
+        start = self.order.index(ExclusiveStartKey['submission_id']) + 1 if ExclusiveStartKey else 0
+        page = [dict(self.items[key]) for key in self.order[start:start + Limit]]
+        self.queries.append(start)
+        response = {'Items': page}
+        if start + Limit < len(self.order):
+            response['LastEvaluatedKey'] = {'submission_id': page[-1]['submission_id']}
+        return response
+
+    def update_item(self, Key, ExpressionAttributeValues, **kwargs):
+        item = self.items[Key['submission_id']]
+        me = ExpressionAttributeValues[':me']
+        if review_leases.held_by_other(item, me, ExpressionAttributeValues[':now']):
+            raise ClientError({'Error': {'Code': 'ConditionalCheckFailedException'}}, 'UpdateItem')
+        item.update(lease_owner=me, lease_expires=ExpressionAttributeValues[':expires'])
+
+
+def pending(i, owner=None):
+    item = {'submission_id': f"s{i:03d}", 'status': review_leases.PENDING}
+    if owner:
+        item.update(lease_owner=owner, lease_expires=NOW + 60)
+    return item
+
+
+def test_claim_stops_reading_once_enough_are_won():
+    table = FakeReviewTable([pending(i) for i in range(500)])
+    claimed, _, conflicts = review_leases.claim(table, 'ana', 3, now=NOW)
+    assert claimed == ['s000', 's001', 's002'] and conflicts == 0
+    assert table.queries == [0]
+
+
+def test_claim_pages_past_other_reviewers_leases():
+    table = FakeReviewTable([pending(i, 'bo') for i in range(60)] + [pending(i) for i in range(60, 100)])
+    claimed, _, _ = review_leases.claim(table, 'ana', 2, now=NOW)
+    assert claimed == ['s060', 's061']
+    assert table.queries == [0, 25, 50]
+
+
+def test_claim_renews_own_leases_first():
+    table = FakeReviewTable([pending(0), pending(1, 'ana'), pending(2)])
+    claimed, _, _ = review_leases.claim(table, 'ana', 2, now=NOW)
+    assert claimed == ['s001', 's000']
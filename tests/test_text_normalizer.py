@@ -0,0 +1,42 @@
+import pytest
+
+from text_normalizer import normalize
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('Pay 1000 dollars', 'pay 1000 dollars'),
+    ('born in 1999', 'born in 1999'),
+    ('call 555-1234', 'call 555-1234'),
+    ('order #100000', 'order #100000'),
+    ('mp3 player', 'mp3 player'),
+    ('ipv4 only', 'ipv4 only'),
+    ('covid19 4x4', 'covid19 4x4'),
+])
+def test_numbers_are_kept(text, expected):
+    assert normalize(text) == expected
+
+
+def test_different_amounts_stay_different():
+    assert normalize('Pay 1000 dollars') != normalize('Pay 100 dollars')
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('FREE MONEY', 'free money'),
+    ('fr​ee mo‍ney', 'free money'),
+    ('ѕраm', 'spam'),
+    ('café', 'cafe'),
+    ('ｆｒｅｅ', 'free'),
+    ('h3ll0 n00b', 'hello noob'),
+    ('$pam @ss', 'spam ass'),
+    ('sh!t k|ll', 'shit kill'),
+    ('s.p.a.m f-r-e-e', 'spam free'),
+    ('soooooo good!!!!!', 'soo good!!'),
+    ('  lots \t of\n space ', 'lots of space'),
+])
+def test_obfuscations_fold(text, expected):
+    assert normalize(text) == expected
+
+
+def test_empty():
+    assert normalize('') == ''
+    assert normalize(None) == ''
@@ -0,0 +1,21 @@
+import uuid
+
+import pytest
+
+import upload_keys
+
+
+@pytest.mark.parametrize('submission_id', [str(uuid.uuid4()), 'abc', 'A_b-9', 'x' * 80])
+def test_valid_submission_ids(submission_id):
+    assert upload_keys.valid_submission_id(submission_id)
+
+
+@pytest.mark.parametrize('submission_id', ['', 'x' * 81, '../etc', 'a/b', 'a b', 'a.b', 'é', None, 42])
+def test_invalid_submission_ids(submission_id):
+    assert not upload_keys.valid_submission_id(submission_id)
+
+
+def test_valid_ids_make_keys_that_map_back():
+    submission_id = str(uuid.uuid4())
+    key = upload_keys.upload_key(submission_id, 'cat.jpg')
+    assert upload_keys.submission_id_from_key(key) == submission_id
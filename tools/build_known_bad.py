@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Build or extend the known-bad image list image_moderator rejects without
+calling Rekognition (see lambda/image_moderator/known_bad.py).
+
+Input files hold one SHA-256 hex digest per line (blank lines and #
+comments are skipped; - reads stdin). The exact list is uploaded first
+and the filter that names it last, so image_moderator never sees a filter
+without its list. Exact lists older than the previous one are deleted.
+
+    python tools/build_known_bad.py banned.txt
+    python tools/build_known_bad.py --extend new_reports.txt
+    python tools/build_known_bad.py --out /tmp/known_bad banned.txt
+    python tools/build_known_bad.py --package banned.txt
+
+--extend adds to the list currently in S3 (or in --out). The filter is
+always rebuilt from the whole list, sized for --bits-per-entry.
+--package writes the filter into lambda/image_moderator/known_bad.bin to
+deploy with the code instead of uploading it; the exact list still goes
+to S3.
+"""
+import argparse
+import hashlib
+import io
+import math
+import os
+import sys
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'common', 'python'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'image_moderator'))
+import known_bad  # noqa: E402
+
+DEFAULT_BUCKET = 'amit-moderation-analytics'
+
+# Digests hashed into the bit array at a time, bounding the build's memory
+CHUNK = 1 << 20
+
+
+def read_digests(paths):
+    """Sorted, unique digests from hex files, as a NumPy array of 32-byte strings"""
+    raw = bytearray()
+    for path in paths:
+        with (sys.stdin if path == '-' else open(path, encoding='ascii')) as f:
+            for number, line in enumerate(f, 1):
+                line = line.split('#', 1)[0].strip().lower()
+                if not line:
+                    continue
+                if len(line) != 64:
+                    raise SystemExit(f"{path}:{number}: not a SHA-256 hex digest")
+                raw += bytes.fromhex(line)
+    return np.unique(np.frombuffer(bytes(raw), dtype='S32'))
+
+
+def default_probes(bits_per_entry):
+    """Bits set per digest; a little under the unblocked optimum of ln 2 per bit per entry"""
+    return max(1, min(known_bad.MAX_PROBES, round(bits_per_entry * math.log(2) * 0.85)))
+
+
+def probe_bits(raw, k):
+    """Bit positions within the block, the same ones known_bad.probes sets"""
+    lo = raw[:, 8:16].copy().view('<u8').ravel()
+    hi = raw[:, 16:24].copy().view('<u8').ravel()
+    mask = np.uint64(known_bad.BLOCK_BITS - 1)
+    for i in range(k):
+        shift = 9 * i
+        if shift + 9 <= 64:
+            yield (lo >> np.uint64(shift)) & mask
+        elif shift >= 64:
+            yield (hi >> np.uint64(shift - 64)) & mask
+        else:
+            yield ((lo >> np.uint64(shift)) | (hi << np.uint64(64 - shift))) & mask
+
+
+def build_filter(digests, bits_per_entry=10, probes=None, step=1024):
+    """The filter file for sorted, unique digests, and the exact list's id"""
+    k = probes or default_probes(bits_per_entry)
+    blocks = max(1, math.ceil(len(digests) * bits_per_entry / known_bad.BLOCK_BITS))
+    bits = np.zeros(blocks * known_bad.BLOCK_BITS, dtype=bool)
+    for start in range(0, len(digests), CHUNK):
+        raw = np.frombuffer(digests[start:start + CHUNK].tobytes(), dtype=np.uint8).reshape(-1, 32)
+        block = raw[:, :8].copy().view('<u8').ravel() % np.uint64(blocks)
+        base = block * np.uint64(known_bad.BLOCK_BITS)
+        for position in probe_bits(raw, k):
+            bits[(base + position).astype(np.int64)] = True
+    list_id = hashlib.sha256(digests.tobytes()).digest()[:8]
+    header = known_bad.HEADER.pack(known_bad.MAGIC, k, blocks, len(digests), step, list_id)
+    return header + np.packbits(bits, bitorder='little').tobytes() + digests[::step].tobytes(), list_id
+
+
+def list_id_in_use(s3, bucket, out, package):
+    """Id of the exact list the current filter names, or None if there is no filter"""
+    path = os.path.join(out, 'filter.bin') if out else known_bad.PACKAGED_PATH if package else None
+    if path:
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            header = f.read(known_bad.HEADER.size)
+    else:
+        try:
+            header = s3.get_object(Bucket=bucket, Key=known_bad.FILTER_KEY,
+                                   Range=f"bytes=0-{known_bad.HEADER.size - 1}")['Body'].read()
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+                return None
+            raise
+    return known_bad.HEADER.unpack(header)[5]
+
+
+def current_list(s3, bucket, out, list_id):
+    """The digests of the list in use now (empty if there is none)"""
+    if list_id is None:
+        return np.array([], dtype='S32')
+    if out:
+        with open(os.path.join(out, os.path.basename(known_bad.hashes_key(list_id))), 'rb') as f:
+            data = f.read()
+    else:
+        data = s3.get_object(Bucket=bucket, Key=known_bad.hashes_key(list_id))['Body'].read()
+    return np.frombuffer(data, dtype='S32')
+
+
+def publish(s3, bucket, digests, filter_data, list_id, previous, package):
+    """Exact list first, then the filter naming it; then drop lists nothing can still point at"""
+    s3.upload_fileobj(io.BytesIO(digests.tobytes()), bucket, known_bad.hashes_key(list_id),
+                      ExtraArgs={'ContentType': 'application/octet-stream'})
+    if package:
+        with open(known_bad.PACKAGED_PATH, 'wb') as f:
+            f.write(filter_data)
+        # Deployed functions keep confirming against the previous list until then
+        print(f"wrote {known_bad.PACKAGED_PATH}: deploy image_moderator to use it")
+        return
+    s3.put_object(Bucket=bucket, Key=known_bad.FILTER_KEY, Body=filter_data,
+                  ContentType='application/octet-stream')
+    # Containers refresh within KNOWN_BAD_REFRESH_SECONDS; until then they confirm against the previous list
+    keep = {known_bad.hashes_key(list_id)} | ({known_bad.hashes_key(previous)} if previous else set())
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{known_bad.PREFIX}hashes-"):
+        for obj in page.get('Contents', []):
+            if obj['Key'] not in keep:
+                s3.delete_object(Bucket=bucket, Key=obj['Key'])
+                print(f"deleted {obj['Key']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('hashes', nargs='+', help='files of SHA-256 hex digests, or - for stdin')
+    parser.add_argument('--extend', action='store_true', help='add to the current list instead of replacing it')
+    parser.add_argument('--bucket', default=DEFAULT_BUCKET)
+    parser.add_argument('--out', help='write filter.bin and the exact list to this directory instead of S3')
+    parser.add_argument('--package', action='store_true', help='write the filter into the image_moderator package')
+    parser.add_argument('--bits-per-entry', type=float, default=10)
+    parser.add_argument('--probes', type=int, help=f"bits per digest (at most {known_bad.MAX_PROBES})")
+    parser.add_argument('--fence-step', type=int, default=1024, help='digests per ranged GET when confirming')
+    args = parser.parse_args(argv)
+    if args.probes and not 0 < args.probes <= known_bad.MAX_PROBES:
+        parser.error(f"--probes must be between 1 and {known_bad.MAX_PROBES}")
+
+    s3 = None if args.out else boto3.client('s3')
+    digests = read_digests(args.hashes)
+    added = len(digests)
+    previous = list_id_in_use(s3, args.bucket, args.out, args.package)
+    if args.extend:
+        existing = current_list(s3, args.bucket, args.out, previous)
+        digests = np.unique(np.concatenate([existing, digests]))
+        added = len(digests) - len(existing)
+
+    started = time.perf_counter()
+    filter_data, list_id = build_filter(digests, args.bits_per_entry, args.probes, args.fence_step)
+    print(f"{len(digests)} digests ({added} new), filter {len(filter_data) / 1e6:.1f} MB, "
+          f"exact list {len(digests) * known_bad.DIGEST_BYTES / 1e6:.1f} MB, "
+          f"built in {time.perf_counter() - started:.1f}s")
+
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        with open(os.path.join(args.out, os.path.basename(known_bad.hashes_key(list_id))), 'wb') as f:
+            f.write(digests.tobytes())
+        with open(os.path.join(args.out, 'filter.bin'), 'wb') as f:
+            f.write(filter_data)
+        print(f"wrote {args.out}")
+    else:
+        publish(s3, args.bucket, digests, filter_data, list_id, previous, args.package)
+        print(f"published s3://{args.bucket}/{known_bad.hashes_key(list_id)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
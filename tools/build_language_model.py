@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Build text_moderator's language identification model from seed texts,
+and measure it.
+
+Seeds are plain text files named by language code, one per language
+(tools/data/language_seed/<code>.txt). Languages Comprehend can't score
+belong in the seeds too, so their text is recognised as such and routed
+to review instead of being mistaken for the nearest supported language.
+
+    python tools/build_language_model.py
+    python tools/build_language_model.py --top 400 --eval tools/data/language_eval.jsonl
+
+The model keeps each language's --top most frequent trigrams with
+add-one smoothed log-probabilities, quantized to int8.
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'text_moderator'))
+from language_id import COMPREHEND_LANGUAGES, MODEL_PATH, LanguageIdentifier, ngrams  # noqa: E402
+
+DEFAULT_SEEDS = os.path.join(ROOT, 'tools', 'data', 'language_seed')
+DEFAULT_EVAL = os.path.join(ROOT, 'tools', 'data', 'language_eval.jsonl')
+
+
+def build(seeds, top):
+    counts = {}
+    for name in sorted(os.listdir(seeds)):
+        if name.endswith('.txt'):
+            with open(os.path.join(seeds, name), encoding='utf-8') as f:
+                counts[name[:-4]] = Counter(gram for line in f for gram in ngrams(line))
+    languages = sorted(counts)
+    kept = sorted({gram for language in languages for gram, _ in counts[language].most_common(top)})
+    log_probs = np.empty((len(kept), len(languages)))
+    for column, language in enumerate(languages):
+        total = sum(counts[language].values())
+        seen = np.array([counts[language][gram] for gram in kept], dtype=float)
+        log_probs[:, column] = np.log((seen + 1) / (total + len(kept)))
+    scale = float(-log_probs.min() / 127)
+    quantized = np.round(log_probs / scale).astype(np.int8)
+    return {
+        'version': 1,
+        'languages': languages,
+        'ngrams': kept,
+        'scale': scale,
+        'scores': base64.b64encode(quantized.tobytes()).decode('ascii')
+    }
+
+
+def evaluate(identifier, path, repeat=200):
+    with open(path, encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    wrong, unreliable = [], 0
+    for row in rows:
+        language, reliable = identifier.identify(row['text'])
+        unreliable += not reliable
+        if language != row['language']:
+            wrong.append((row['language'], language, reliable, row['text']))
+    # What the routing cares about: Comprehend gets a language it can score
+    misrouted = [w for w in wrong if w[2] and (w[1] in COMPREHEND_LANGUAGES or w[0] in COMPREHEND_LANGUAGES)]
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for row in rows:
+            identifier.identify(row['text'])
+    per_text = (time.perf_counter() - started) / (repeat * len(rows)) * 1e6
+
+    print(f"eval: {path} ({len(rows)} texts)")
+    print(f"correct: {len(rows) - len(wrong)}/{len(rows)}, unreliable: {unreliable}, "
+          f"reliable but wrong with a Comprehend language involved: {len(misrouted)}")
+    print(f"identify: {per_text:.0f} us per text (mean)")
+    for expected, got, reliable, text in wrong:
+        print(f"  expected {expected}, got {got}{'' if reliable else ' (unreliable)'}: {text}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seeds', default=DEFAULT_SEEDS)
+    parser.add_argument('--out', default=MODEL_PATH)
+    parser.add_argument('--top', type=int, default=300, help='trigrams kept per language')
+    parser.add_argument('--eval', default=DEFAULT_EVAL, help="held-out {text, language} lines; '' to skip")
+    args = parser.parse_args(argv)
+
+    model = build(args.seeds, args.top)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(model, f, ensure_ascii=False, separators=(',', ':'))
+    print(f"wrote {args.out}: {len(model['languages'])} languages, {len(model['ngrams'])} trigrams, "
+          f"{os.path.getsize(args.out) / 1024:.0f} KB")
+
+    if args.eval:
+        started = time.perf_counter()
+        identifier = LanguageIdentifier(args.out)
+        print(f"load: {(time.perf_counter() - started) * 1000:.1f} ms")
+        evaluate(identifier, args.eval)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
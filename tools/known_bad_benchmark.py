@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Size, false-positive rate and lookup cost of image_moderator's known-bad
+filter (lambda/image_moderator/known_bad.py) for a list of --entries
+random SHA-256 digests, at several --bits per entry.
+
+A false positive costs one ranged GET of the exact list (fence step x 32
+bytes) and never a wrong rejection; a miss costs only the lookup in the
+mapped filter. Lookups go through the same Python code image_moderator
+runs.
+
+    python tools/known_bad_benchmark.py
+    python tools/known_bad_benchmark.py --entries 1000000 --bits 8 10 12 16 --queries 500000
+"""
+import argparse
+import hashlib
+import math
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(__file__))
+from build_known_bad import build_filter, default_probes  # noqa: E402
+import known_bad  # noqa: E402
+
+
+def random_digests(rng, count):
+    return np.unique(np.frombuffer(rng.bytes(count * known_bad.DIGEST_BYTES), dtype='S32'))
+
+
+def percentile(values, p):
+    return sorted(values)[min(len(values) - 1, int(len(values) * p))]
+
+
+def timed_lookups(bloom, digests):
+    """(microseconds per lookup, how many were found)"""
+    found, times = 0, []
+    for digest in digests:
+        started = time.perf_counter_ns()
+        hit = digest in bloom
+        times.append((time.perf_counter_ns() - started) / 1000)
+        found += hit
+    return times, found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=10_000_000)
+    parser.add_argument('--bits', type=float, nargs='+', default=[8, 10, 12, 16], help='bits per entry to compare')
+    parser.add_argument('--fence-step', type=int, default=1024)
+    parser.add_argument('--queries', type=int, default=200_000, help='digests not on the list to look up')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    started = time.perf_counter()
+    listed = random_digests(rng, args.entries)
+    print(f"{len(listed)} listed digests generated in {time.perf_counter() - started:.1f}s, "
+          f"exact list {len(listed) * known_bad.DIGEST_BYTES / 1e6:.0f} MB")
+    # NumPy drops trailing NUL bytes from single 'S32' items; slice the raw bytes instead
+    exact = listed.tobytes()
+    width = known_bad.DIGEST_BYTES
+    others = [rng.bytes(width) for _ in range(args.queries)]
+    members = [exact[i * width:(i + 1) * width]
+               for i in rng.choice(len(listed), min(args.queries, len(listed)), replace=False)]
+
+    print(f"\n{'bits/entry':>10}{'probes':>8}{'filter MB':>11}{'build s':>9}"
+          f"{'FP rate':>10}{'(unblocked)':>13}{'miss p50 us':>13}{'p99':>7}{'hit p50 us':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for bits in args.bits:
+            started = time.perf_counter()
+            data, _ = build_filter(listed, bits, step=args.fence_step)
+            built = time.perf_counter() - started
+            path = os.path.join(directory, f"filter-{bits}.bin")
+            with open(path, 'wb') as f:
+                f.write(data)
+            bloom = known_bad.BloomFilter(path)
+            miss_times, false_positives = timed_lookups(bloom, others)
+            hit_times, found = timed_lookups(bloom, members)
+            if found != len(members):
+                raise SystemExit(f"{len(members) - found} listed digests not found: the filter is broken")
+            k = default_probes(bits)
+            unblocked = (1 - math.exp(-k / bits)) ** k
+            print(f"{bits:>10g}{k:>8}{len(data) / 1e6:>11.1f}{built:>9.1f}{false_positives / len(others):>10.3%}"
+                  f"{unblocked:>13.3%}{percentile(miss_times, 0.5):>13.2f}{percentile(miss_times, 0.99):>7.2f}"
+                  f"{percentile(hit_times, 0.5):>12.2f}")
+            bloom.close()
+
+        # Everything else a lookup may cost, with the default sizing
+        data, _ = build_filter(listed, step=args.fence_step)
+        path = os.path.join(directory, 'filter.bin')
+        with open(path, 'wb') as f:
+            f.write(data)
+        started = time.perf_counter()
+        bloom = known_bad.BloomFilter(path)
+        opened = (time.perf_counter() - started) * 1e6
+        confirm_times = []
+        for digest in members[:20000]:
+            started = time.perf_counter_ns()
+            first, last = bloom.exact_range(digest)
+            assert digest in known_bad.Digests(exact[first:last + 1])
+            confirm_times.append((time.perf_counter_ns() - started) / 1000)
+        image = rng.bytes(2_000_000)
+        started = time.perf_counter()
+        for _ in range(20):
+            hashlib.sha256(image).digest()
+        hashing = (time.perf_counter() - started) / 20 * 1000
+        bloom.close()
+
+    print(f"\nmapping the filter: {opened:.0f} us (pages are read as lookups touch them)")
+    print(f"confirming a hit: {percentile(confirm_times, 0.5):.1f} us p50 to search "
+          f"{args.fence_step * known_bad.DIGEST_BYTES // 1024} KB from one ranged GET")
+    print(f"hashing a 2 MB upload with neither a content key nor a stored checksum: {hashing:.2f} ms (plus the GET)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Per-stage latency histograms from captured Lambda logs.
+
+Reads CloudWatch Embedded Metric Format lines written by
+lambda/common/python/instrumentation.py, from files or stdin, e.g.
+
+    aws logs tail /aws/lambda/amit-moderation-getStatus-handler --since 1h > get_status.log
+    python tools/latency_report.py get_status.log
+    python tools/latency_report.py --function text_moderator --stage aws. *.log
+
+Anything that isn't an EMF line (START/END/REPORT, plain prints) is skipped.
+"""
+import argparse
+import fileinput
+import json
+import math
+import sys
+from collections import defaultdict
+
+# Millisecond bucket upper bounds, roughly logarithmic
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, math.inf]
+BAR_WIDTH = 40
+
+
+def parse_line(line):
+    """Return the EMF record in a log line, or None"""
+    start = line.find('{')
+    if start < 0 or '"_aws"' not in line:
+        return None
+    try:
+        record = json.loads(line[start:])
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) and '_aws' in record else None
+
+
+def collect(lines, function=None, stage_prefix=None):
+    """
+    Group millisecond samples by (function, metric name).
+    Only metrics declared with Unit=Milliseconds are latency samples.
+    """
+    samples = defaultdict(list)
+    for line in lines:
+        record = parse_line(line)
+        if record is None:
+            continue
+        fn_name = record.get('Function', 'unknown')
+        if function and fn_name != function:
+            continue
+        for directive in record['_aws'].get('CloudWatchMetrics', []):
+            for metric in directive.get('Metrics', []):
+                if metric.get('Unit') != 'Milliseconds':
+                    continue
+                name = metric['Name']
+                if stage_prefix and not name.startswith(stage_prefix):
+                    continue
+                value = record.get(name)
+                if value is None:
+                    continue
+                values = value if isinstance(value, list) else [value]
+                samples[(fn_name, name)].extend(float(v) for v in values)
+    return samples
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(math.ceil(pct / 100 * len(sorted_values))) - 1)
+    return sorted_values[max(index, 0)]
+
+
+def histogram(values):
+    counts = [0] * len(BUCKETS)
+    for v in values:
+        for i, bound in enumerate(BUCKETS):
+            if v <= bound:
+                counts[i] += 1
+                break
+    return counts
+
+
+def summarize(samples):
+    summary = []
+    for (fn_name, name), values in sorted(samples.items()):
+        values.sort()
+        summary.append({
+            'function': fn_name,
+            'metric': name,
+            'count': len(values),
+            'p50': percentile(values, 50),
+            'p90': percentile(values, 90),
+            'p99': percentile(values, 99),
+            'max': values[-1],
+            'histogram': histogram(values)
+        })
+    return summary
+
+
+def bucket_label(i):
+    low = 0 if i == 0 else BUCKETS[i - 1]
+    high = BUCKETS[i]
+    return f">{low}ms" if high == math.inf else f"{low}-{high}ms"
+
+
+def print_report(summary, out=sys.stdout):
+    for row in summary:
+        out.write(
+            f"\n{row['function']} {row['metric']}  n={row['count']}  "
+            f"p50={row['p50']:.1f}ms p90={row['p90']:.1f}ms "
+            f"p99={row['p99']:.1f}ms max={row['max']:.1f}ms\n"
+        )
+        peak = max(row['histogram']) or 1
+        for i, count in enumerate(row['histogram']):
+            if count == 0:
+                continue
+            bar = '#' * max(1, round(count / peak * BAR_WIDTH))
+            out.write(f"  {bucket_label(i):>14} {count:>7} {bar}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='*', help='log files (default: stdin)')
+    parser.add_argument('--function', help='only this Function dimension, e.g. get_status')
+    parser.add_argument('--stage', help='only metrics starting with this prefix, e.g. stage. or aws.dynamodb')
+    parser.add_argument('--json', action='store_true', help='print the summary as JSON')
+    args = parser.parse_args(argv)
+
+    with fileinput.input(files=args.files or ('-',)) as lines:
+        summary = summarize(collect(lines, args.function, args.stage))
+
+    if args.json:
+        json.dump(
+            {'buckets_ms': [None if b == math.inf else b for b in BUCKETS], 'metrics': summary},
+            sys.stdout, indent=2
+        )
+        sys.stdout.write('\n')
+    else:
+        print_report(summary)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
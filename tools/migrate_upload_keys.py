@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Move legacy uploads (uploads/YYYYmmdd-HHMMSS-<filename>) to hashed-prefix
+keys (uploads/<2 hex>/<submission_id>/<filename>, see
+lambda/common/python/upload_keys.py).
+
+For every legacy object:
+  1. copy it to its new key
+  2. point the approved/review items that reference it at the new key
+  3. replace the legacy object with an empty one whose moved-to metadata
+     names the new key, so in-flight executions and anything else still
+     holding the old key resolve it (upload_keys.resolve)
+
+Objects no item references get a synthetic submission id derived from
+the old key. Safe to re-run: migrated keys are recognised by their
+moved-to marker and skipped.
+
+    python tools/migrate_upload_keys.py --dry-run
+    python tools/migrate_upload_keys.py --workers 16
+"""
+import argparse
+import hashlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'common', 'python'))
+import upload_keys  # noqa: E402
+
+DEFAULT_BUCKET = 'amit-moderation-uploads'
+DEFAULT_TABLES = ('amit-moderation-approved', 'amit-moderation-review')
+
+
+def legacy_owners(dynamodb, tables):
+    """{legacy image_key: [(table, submission_id)]} from the tables that store image_key"""
+    owners = {}
+    for table in tables:
+        paginator = dynamodb.get_paginator('scan')
+        for page in paginator.paginate(TableName=table, ProjectionExpression='submission_id, image_key'):
+            for item in page.get('Items', []):
+                key = item.get('image_key', {}).get('S')
+                if upload_keys.is_legacy(key):
+                    owners.setdefault(key, []).append((table, item['submission_id']['S']))
+    return owners
+
+
+def legacy_objects(s3, bucket):
+    """Legacy keys sit directly under uploads/; hashed partitions come back as CommonPrefixes"""
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=upload_keys.UPLOAD_PREFIX, Delimiter='/'):
+        for obj in page.get('Contents', []):
+            if upload_keys.is_legacy(obj['Key']):
+                yield obj
+
+
+def new_key_for(key, owners):
+    submission_id = owners[0][1] if owners else f"legacy-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}"
+    filename = key[len(upload_keys.UPLOAD_PREFIX):].split('-', 2)[-1]
+    return upload_keys.upload_key(submission_id, filename)
+
+
+def migrate(s3, dynamodb, bucket, obj, owners, dry_run):
+    key = obj['Key']
+    if obj['Size'] == 0:
+        metadata = s3.head_object(Bucket=bucket, Key=key).get('Metadata', {})
+        if upload_keys.MOVED_TO in metadata:
+            return 'already moved'
+
+    new_key = new_key_for(key, owners)
+    if dry_run:
+        return f"would move to {new_key}"
+
+    s3.copy_object(
+        Bucket=bucket,
+        Key=new_key,
+        CopySource={'Bucket': bucket, 'Key': key},
+        MetadataDirective='COPY'
+    )
+    for table, submission_id in owners:
+        try:
+            dynamodb.update_item(
+                TableName=table,
+                Key={'submission_id': {'S': submission_id}},
+                UpdateExpression='SET image_key = :new',
+                ConditionExpression='image_key = :old',
+                ExpressionAttributeValues={':new': {'S': new_key}, ':old': {'S': key}}
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+    s3.put_object(Bucket=bucket, Key=key, Body=b'', Metadata={upload_keys.MOVED_TO: new_key})
+    return f"moved to {new_key}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bucket', default=DEFAULT_BUCKET)
+    parser.add_argument('--tables', nargs='+', default=DEFAULT_TABLES, help='tables whose items store image_key')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--dry-run', action='store_true', help='only print what would move')
+    args = parser.parse_args(argv)
+
+    s3 = boto3.client('s3')
+    dynamodb = boto3.client('dynamodb')
+    owners = legacy_owners(dynamodb, args.tables)
+    print(f"{len(owners)} legacy keys referenced by items", file=sys.stderr)
+
+    started = time.monotonic()
+    outcomes = {}
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        futures = [
+            (obj['Key'], pool.submit(migrate, s3, dynamodb, args.bucket, obj, owners.get(obj['Key'], []), args.dry_run))
+            for obj in legacy_objects(s3, args.bucket)
+        ]
+        for key, future in futures:
+            try:
+                outcome = future.result()
+            except ClientError as e:
+                outcome = f"failed: {e.response['Error']['Code']}"
+            print(f"{key}: {outcome}")
+            kind = outcome.split(':')[0].split(' to ')[0]
+            outcomes[kind] = outcomes.get(kind, 0) + 1
+
+    elapsed = time.monotonic() - started
+    print(f"{sum(outcomes.values())} legacy objects in {elapsed:.1f}s: {outcomes}", file=sys.stderr)
+    return 1 if any(kind == 'failed' for kind in outcomes) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Accuracy and cost of text_moderator's near-duplicate index
+(lambda/text_moderator/near_dup_index.py).
+
+Accuracy: texts are built from the sample (a few sample texts joined, the
+length of a typical campaign message), then edited a word at a time the
+way copy-paste campaigns vary them. Reports how many variants land within
+each distance of their original, and how close unrelated texts come.
+
+Scale: fills --generations segments of --per-generation random signatures
+(the worst case: nothing shares blocks) and reports build time, memory and
+lookup latency.
+
+    python tools/near_dup_benchmark.py
+    python tools/near_dup_benchmark.py --generations 24 --per-generation 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'common', 'python'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'text_moderator'))
+import near_dup  # noqa: E402
+from near_dup_index import MAX_DISTANCE, RECORDS, Generation, NearDupIndex, simhash  # noqa: E402
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(__file__), 'data', 'sentiment_sample.jsonl')
+
+
+def edit(words, vocabulary, rng, edits):
+    words = list(words)
+    for _ in range(edits):
+        i = rng.randrange(len(words))
+        operation = rng.choice(('replace', 'insert', 'delete'))
+        if operation == 'replace':
+            words[i] = rng.choice(vocabulary)
+        elif operation == 'insert':
+            words.insert(i, rng.choice(vocabulary))
+        elif len(words) > 1:
+            del words[i]
+    return words
+
+
+def distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+def accuracy(texts, rng, messages=100, variants=5, join=3):
+    vocabulary = sorted({word for text in texts for word in text.split()})
+    originals = [' '.join(rng.sample(texts, join)) for _ in range(messages)]
+    signatures = [simhash(text) for text in originals]
+    print(f"accuracy: {messages} messages of {join} sample texts (~{np.mean([len(t.split()) for t in originals]):.0f} words)")
+    thresholds = list(range(MAX_DISTANCE + 1))
+    print(f"{'edited words':<14}" + ''.join(f"{'<=' + str(d):>7}" for d in thresholds))
+    for edits in (1, 2, 3, 5):
+        found = np.array([
+            distance(signature, simhash(' '.join(edit(original.split(), vocabulary, rng, edits))))
+            for original, signature in zip(originals, signatures)
+            for _ in range(variants)
+        ])
+        print(f"{edits:<14}" + ''.join(f"{(found <= d).mean():>7.0%}" for d in thresholds))
+    # Unrelated: messages sharing no sample text
+    unrelated = []
+    for _ in range(2000):
+        picked = rng.sample(texts, 2 * join)
+        unrelated.append(distance(simhash(' '.join(picked[:join])), simhash(' '.join(picked[join:]))))
+    unrelated = np.array(unrelated)
+    print(f"{'unrelated':<14}" + ''.join(f"{(unrelated <= d).mean():>7.1%}" for d in thresholds)
+          + f"   (closest {unrelated.min()} bits)")
+
+
+def scale(generations, per_generation, queries, rng):
+    print(f"\nscale: {generations} generations x {per_generation:,} signatures")
+    segments = []
+    for _ in range(generations):
+        records = np.zeros(per_generation, dtype=RECORDS)
+        records['signature'] = np.frombuffer(rng.randbytes(8 * per_generation), dtype='<u8')
+        records['submission_id'] = b'00000000-0000-4000-8000-000000000000'
+        segments.append(records.tobytes())
+    print(f"segment size: {len(segments[0]) / 1e6:.1f} MB each ({near_dup.RECORD.size} bytes per record)")
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    index = NearDupIndex(bucket=None)
+    index.segments = {str(i): Generation(data) for i, data in enumerate(segments)}
+    build = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    total = generations * per_generation
+    print(f"build (sorting every table): {build * 1000:.0f} ms, "
+          f"{peak / 1e6:.0f} MB beyond the segment bytes ({peak / total:.0f} bytes per signature)")
+
+    probes = [f"{rng.getrandbits(64):016x}" for _ in range(queries)]
+    # Near copies of stored signatures: a few bits flipped
+    stored = index.segments['0'].records['signature']
+    for i in range(queries // 2):
+        flipped = int(stored[i]) ^ sum(1 << bit for bit in rng.sample(range(64), rng.randrange(MAX_DISTANCE + 1)))
+        probes[i] = f"{flipped:016x}"
+    timings, hits = [], 0
+    for probe in probes:
+        started = time.perf_counter()
+        hits += index.nearest(probe) is not None
+        timings.append((time.perf_counter() - started) * 1e6)
+    print(f"lookup: p50 {np.percentile(timings, 50):.0f} us, p99 {np.percentile(timings, 99):.0f} us; "
+          f"{hits} of {queries // 2} planted near copies found")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sample', default=DEFAULT_SAMPLE)
+    parser.add_argument('--generations', type=int, default=near_dup.NEAR_DUP_GENERATIONS)
+    parser.add_argument('--per-generation', type=int, default=near_dup.MAX_PER_GENERATION)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    with open(args.sample, encoding='utf-8') as f:
+        texts = [json.loads(line)['text'] for line in f if line.strip()]
+    accuracy(texts, rng)
+    scale(args.generations, args.per_generation, args.queries, rng)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Latency of text_moderator's local fallback scorer, and how often it agrees
+with Comprehend on a labelled sample.
+
+The sample is JSON lines of {"text", "sentiment"} and optionally
+"scores" (Comprehend's SentimentScore). tools/data/sentiment_sample.jsonl
+is hand-labelled; label a sample with Comprehend itself (needs AWS
+credentials) and benchmark against that:
+
+    python tools/sentiment_fallback_benchmark.py
+    python tools/sentiment_fallback_benchmark.py --label-with-comprehend comprehend.jsonl
+    python tools/sentiment_fallback_benchmark.py --sample comprehend.jsonl
+
+Decisions use the same rules as the Lambda (decisions.py). A reference
+without scores is taken as fully confident in its label.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'text_moderator'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'common', 'python'))
+from decisions import decide, decide_local  # noqa: E402
+from local_scorer import SENTIMENTS, LexiconScorer  # noqa: E402
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(__file__), 'data', 'sentiment_sample.jsonl')
+LABELS = [name.upper() for name in SENTIMENTS]
+DECISIONS = ['APPROVE', 'AMBIGUOUS', 'REJECT']
+
+# BatchDetectSentiment takes at most 25 texts
+COMPREHEND_BATCH = 25
+
+
+def load_sample(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def label_with_comprehend(rows, out_path):
+    import boto3
+    comprehend = boto3.client('comprehend')
+    labelled = []
+    for start in range(0, len(rows), COMPREHEND_BATCH):
+        chunk = rows[start:start + COMPREHEND_BATCH]
+        result = comprehend.batch_detect_sentiment(TextList=[row['text'] for row in chunk], LanguageCode='en')
+        for entry in result['ResultList']:
+            labelled.append({
+                'text': chunk[entry['Index']]['text'],
+                'sentiment': entry['Sentiment'],
+                'scores': entry['SentimentScore']
+            })
+        for error in result.get('ErrorList', []):
+            print(f"Comprehend could not score {chunk[error['Index']]['text']!r}: {error['ErrorCode']}", file=sys.stderr)
+    with open(out_path, 'w', encoding='utf-8') as f:
+        for row in labelled:
+            f.write(json.dumps(row) + '\n')
+    print(f"wrote {len(labelled)} Comprehend labels to {out_path}")
+
+
+def reference_decision(row):
+    scores = row.get('scores') or {name: float(name.upper() == row['sentiment']) for name in SENTIMENTS}
+    return decide(row['sentiment'], scores)
+
+
+def confusion(reference, predicted, labels):
+    matrix = np.zeros((len(labels), len(labels)), dtype=int)
+    np.add.at(matrix, ([labels.index(r) for r in reference], [labels.index(p) for p in predicted]), 1)
+    return matrix
+
+
+def print_matrix(title, matrix, labels):
+    width = max(len(label) for label in labels) + 2
+    print(f"\n{title} (rows: reference, columns: local)")
+    print(' ' * width + ''.join(f"{label:>{width}}" for label in labels))
+    for label, row in zip(labels, matrix):
+        print(f"{label:<{width}}" + ''.join(f"{count:>{width}}" for count in row))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sample', default=DEFAULT_SAMPLE)
+    parser.add_argument('--label-with-comprehend', metavar='OUT', help='label --sample with Comprehend, write OUT and exit')
+    parser.add_argument('--repeat', type=int, default=2000, help='single-text scoring rounds for latency')
+    args = parser.parse_args(argv)
+
+    rows = load_sample(args.sample)
+    if args.label_with_comprehend:
+        label_with_comprehend(rows, args.label_with_comprehend)
+        return 0
+    texts = [row['text'] for row in rows]
+
+    started = time.perf_counter()
+    scorer = LexiconScorer()
+    load_ms = (time.perf_counter() - started) * 1000
+
+    timings = np.empty(args.repeat)
+    for i in range(args.repeat):
+        text = texts[i % len(texts)]
+        started = time.perf_counter()
+        decide_local(scorer.score(text))
+        timings[i] = (time.perf_counter() - started) * 1e6
+    batch = texts * max(1, 10000 // len(texts))
+    started = time.perf_counter()
+    scorer.score_batch(batch)
+    batch_seconds = time.perf_counter() - started
+
+    local = [scorer.score(text) for text in texts]
+    predicted = [scores['Sentiment'] for scores in local]
+    reference = [row['sentiment'] for row in rows]
+    local_decisions = [decide_local(scores) for scores in local]
+    reference_decisions = [reference_decision(row) for row in rows]
+
+    sentiment_matrix = confusion(reference, predicted, LABELS)
+    decision_matrix = confusion(reference_decisions, local_decisions, DECISIONS)
+    unsafe = int(decision_matrix[DECISIONS.index('REJECT'), DECISIONS.index('APPROVE')])
+
+    print(f"sample: {args.sample} ({len(rows)} texts, {'Comprehend' if rows and 'scores' in rows[0] else 'hand'} labels)")
+    print(f"lexicon load (cold start): {load_ms:.1f} ms, {len(scorer.vocabulary)} terms")
+    print(f"single text: p50 {np.percentile(timings, 50):.0f} us, p99 {np.percentile(timings, 99):.0f} us")
+    print(f"batch of {len(batch)}: {len(batch) / batch_seconds:,.0f} texts/s")
+    print(f"\nsentiment agreement: {np.trace(sentiment_matrix) / len(rows):.1%}")
+    print(f"decision agreement:  {np.trace(decision_matrix) / len(rows):.1%}")
+    print(f"local APPROVE where the reference REJECTs: {unsafe}")
+    print_matrix('sentiment', sentiment_matrix, LABELS)
+    print_matrix('decision', decision_matrix, DECISIONS)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Throughput of lambda/common/python/text_normalizer.py, and how much more
+obfuscated content it matches than the previous lower() + split().
+
+Each text of the sample is rewritten the ways spammers dodge exact
+matching (case, zero-width characters, homoglyphs, leetspeak, stretched
+and spelled-out words, fullwidth letters). A variant is a dedupe hit if
+its content hash equals the original's, and a lexicon hit if the local
+scorer still finds the original's sentiment words in it.
+
+    python tools/text_normalizer_benchmark.py
+    python tools/text_normalizer_benchmark.py --sample tools/data/sentiment_sample.jsonl --seconds 2
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'common', 'python'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'text_moderator'))
+import text_normalizer  # noqa: E402
+from local_scorer import TOKEN, LexiconScorer  # noqa: E402
+
+DEFAULT_SAMPLE = os.path.join(os.path.dirname(__file__), 'data', 'sentiment_sample.jsonl')
+
+HOMOGLYPHS = {'a': 'а', 'e': 'е', 'o': 'о', 'p': 'р', 'c': 'с', 'i': 'і', 's': 'ѕ', 'x': 'х', 'y': 'у'}
+LEET = {'a': '4', 'e': '3', 'i': '1', 'o': '0', 's': '$', 't': '7'}
+
+
+def previous_normalize(text):
+    return ' '.join((text or '').lower().split())
+
+
+def per_word(text, rng, rewrite, share=0.5):
+    return ' '.join(rewrite(word) if rng.random() < share else word for word in text.split())
+
+
+def obfuscations(rng):
+    """name -> function(text) producing a variant a person reads as the same text"""
+    return {
+        'case': lambda text: ''.join(c.upper() if rng.random() < 0.5 else c for c in text),
+        'zero-width': lambda text: ''.join(c + '​' if c.isalpha() and rng.random() < 0.3 else c for c in text),
+        'homoglyphs': lambda text: ''.join(HOMOGLYPHS.get(c, c) if rng.random() < 0.5 else c for c in text),
+        'leet': lambda text: per_word(text, rng, lambda w: ''.join(LEET.get(c, c) for c in w) if len(w) > 3 else w),
+        'stretched': lambda text: per_word(text, rng, lambda w: w[:-1] + w[-1] * 5 if w[-1].isalpha() else w, 0.3),
+        'spelled-out': lambda text: per_word(text, rng, lambda w: '.'.join(w) if w.isalpha() and len(w) > 3 else w, 0.3),
+        'fullwidth': lambda text: ''.join(chr(ord(c) + 0xFEE0) if '!' <= c <= '~' else c for c in text),
+        'spacing': lambda text: text.replace(' ', rng.choice(['  ', '\t', ' ', ' \n '])),
+    }
+
+
+def throughput(normalize, texts, seconds):
+    """MB/s of UTF-8 input through normalize, over at least seconds"""
+    size = sum(len(text.encode('utf-8')) for text in texts)
+    rounds, started = 0, time.perf_counter()
+    while True:
+        for text in texts:
+            normalize(text)
+        rounds += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= seconds:
+            return size * rounds / elapsed / 1e6
+
+
+def lexicon_words(scorer, normalized):
+    return {token for token in TOKEN.findall(normalized) if token in scorer.vocabulary}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sample', default=DEFAULT_SAMPLE)
+    parser.add_argument('--seconds', type=float, default=1.0, help='timing per measurement')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    with open(args.sample, encoding='utf-8') as f:
+        texts = [json.loads(line)['text'] for line in f if line.strip()]
+    rng = random.Random(args.seed)
+    variants = {name: [rewrite(text) for text in texts] for name, rewrite in obfuscations(rng).items()}
+    obfuscated = [text for rewritten in variants.values() for text in rewritten]
+    # Submissions of a few hundred characters: per-call overhead matters less
+    long_texts = [' '.join(rng.sample(texts, 15)) for _ in range(len(texts))]
+
+    print(f"sample: {args.sample} ({len(texts)} texts, {len(obfuscated)} obfuscated variants)\n")
+    print(f"{'MB/s':<22}{'previous':>10}{'normalize':>11}")
+    for name, corpus in (('short texts', texts), ('long texts', long_texts), ('obfuscated', obfuscated)):
+        before = throughput(previous_normalize, corpus, args.seconds)
+        after = throughput(text_normalizer.normalize, corpus, args.seconds)
+        print(f"{name:<22}{before:>10.1f}{after:>11.1f}")
+
+    scorer = LexiconScorer()
+    print(f"\n{'variant hit rate':<22}{'dedupe':>17}{'lexicon':>17}")
+    print(f"{'':<22}{'previous  new':>17}{'previous  new':>17}")
+    for name, rewritten in variants.items():
+        dedupe = {'previous': 0, 'new': 0}
+        lexicon = {'previous': [0, 0], 'new': [0, 0]}
+        for original, variant in zip(texts, rewritten):
+            for label, normalize in (('previous', previous_normalize), ('new', text_normalizer.normalize)):
+                dedupe[label] += normalize(original) == normalize(variant)
+                expected = lexicon_words(scorer, normalize(original))
+                lexicon[label][0] += len(expected & lexicon_words(scorer, normalize(variant)))
+                lexicon[label][1] += len(expected)
+        rates = [dedupe['previous'] / len(texts), dedupe['new'] / len(texts)]
+        rates += [found / max(total, 1) for found, total in (lexicon['previous'], lexicon['new'])]
+        print(f"{name:<22}{rates[0]:>9.0%}{rates[1]:>8.0%}{rates[2]:>9.0%}{rates[3]:>8.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
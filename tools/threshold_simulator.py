@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Replay historical moderation scores under other thresholds: how many
+submissions each combination would approve, send to review and reject,
+and how often it agrees with what admins decided on reviewed ones.
+
+    python tools/threshold_simulator.py export scores.npz
+    python tools/threshold_simulator.py simulate scores.npz
+    python tools/threshold_simulator.py simulate scores.npz --max-wrong-approvals 0.01 --csv grid.csv
+    python tools/threshold_simulator.py simulate --synthetic 20000000
+
+export scans the approved, review and rejected tables once and keeps the
+scores decision_handler records in moderation_details. Comprehend text
+results and Rekognition image results are replayed. Every other result
+keeps the decision it got: local scorer, near duplicate, unsupported
+language, known-bad image, degraded. So do rows from before the scores
+were recorded.
+
+Every combination is evaluated:
+  --text       decide()'s confidence for POSITIVE/NEGATIVE (text_moderator)
+  --image      label confidence pairs: review >= a, reject > r (image_moderator)
+  precedence   how decision_handler combines text and image:
+                 reject     any REJECT rejects, else any AMBIGUOUS reviews (current)
+                 review     any AMBIGUOUS reviews, else any REJECT rejects
+                 unanimous  REJECT only if every result rejects, else as review
+
+Rows are reduced to one joint histogram of the grid interval each score
+falls in. Cumulative sums of it give the counts for all thresholds at once,
+so the cost per row is independent of the grid size. Admin decisions
+only exist for what went to review under the current thresholds. Agreement
+is measured on those rows, which over-represent borderline content.
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+DEFAULT_TABLES = {
+    'approved': 'amit-moderation-approved',
+    'review': 'amit-moderation-review',
+    'rejected': 'amit-moderation-rejected',
+}
+
+# Decision codes for the per-model results and for the final outcome
+APPROVE, AMBIGUOUS, REJECT, ABSENT = 0, 1, 2, 3
+RESULT_CODES = {'APPROVE': APPROVE, 'AMBIGUOUS': AMBIGUOUS, 'REJECT': REJECT}
+FINAL_CODES = {'APPROVE': APPROVE, 'APPROVED': APPROVE, 'REVIEW': AMBIGUOUS, 'PENDING_REVIEW': AMBIGUOUS,
+               'REJECT': REJECT, 'REJECTED': REJECT}
+SENTIMENT_CODES = {'POSITIVE': 0, 'NEGATIVE': 1, 'NEUTRAL': 2, 'MIXED': 3}
+
+# The thresholds in use today: decisions.decide(), image_moderator's rule, decision_handler
+CURRENT = {'text': 0.85, 'review': 40.0, 'reject': 75.0, 'precedence': 'reject'}
+PRECEDENCE = ('reject', 'review', 'unanimous')
+
+COLUMNS = ('text_decision', 'text_scored', 'text_sentiment', 'text_positive', 'text_negative',
+           'image_decision', 'image_scored', 'image_confidence', 'final_decision', 'admin_decision')
+
+
+def parse_item(item, table):
+    """One row of the export from a table item, or None if it has no automatic decision"""
+    try:
+        details = json.loads(item.get('moderation_details', {}).get('S') or 'null')
+    except ValueError:
+        return None
+    if not isinstance(details, dict):
+        return None
+    status = item.get('status', {}).get('S')
+    text_scores = details.get('text_scores') or {}
+    text_scored = details.get('text_source') == 'comprehend' and 'Positive' in text_scores
+    confidence = details.get('image_max_confidence')
+    image_scored = confidence is not None and not details.get('image_known_bad') and \
+        details.get('image_decision') in RESULT_CODES
+    return (
+        RESULT_CODES.get(details.get('text_decision'), ABSENT),
+        text_scored,
+        SENTIMENT_CODES.get(details.get('text_sentiment'), -1),
+        float(text_scores.get('Positive', 0)) if text_scored else 0.0,
+        float(text_scores.get('Negative', 0)) if text_scored else 0.0,
+        RESULT_CODES.get(details.get('image_decision'), ABSENT),
+        image_scored,
+        float(confidence) if image_scored else 0.0,
+        {'approved': APPROVE, 'review': AMBIGUOUS, 'rejected': REJECT}[table],
+        # Review items an admin has resolved carry the admin's decision as their status
+        FINAL_CODES.get(status, -1) if table == 'review' and status != 'PENDING_REVIEW' else -1
+    )
+
+
+def scan_table(dynamodb, table_name, table, segment, segments):
+    rows = []
+    paginator = dynamodb.get_paginator('scan')
+    pages = paginator.paginate(
+        TableName=table_name,
+        Segment=segment,
+        TotalSegments=segments,
+        ProjectionExpression='moderation_details, #status',
+        ExpressionAttributeNames={'#status': 'status'}
+    )
+    for page in pages:
+        for item in page.get('Items', []):
+            row = parse_item(item, table)
+            if row:
+                rows.append(row)
+    return rows
+
+
+def export(path, tables, segments):
+    import boto3
+    dynamodb = boto3.client('dynamodb')
+    jobs = [(name, table, segment) for table, name in tables.items() for segment in range(segments)]
+    with ThreadPoolExecutor(max_workers=segments * len(tables)) as pool:
+        parts = list(pool.map(lambda job: scan_table(dynamodb, job[0], job[1], job[2], segments), jobs))
+    rows = [row for part in parts for row in part]
+    columns = list(zip(*rows)) if rows else [()] * len(COLUMNS)
+    dtypes = (np.int8, bool, np.int8, np.float32, np.float32, np.int8, bool, np.float32, np.int8, np.int8)
+    np.savez(path, **{name: np.array(values, dtype=dtype) for name, values, dtype in zip(COLUMNS, columns, dtypes)})
+    print(f"{len(rows)} rows ({sum(row[-1] >= 0 for row in rows)} with an admin decision) written to {path}")
+
+
+def synthetic(rows, seed):
+    """Scores shaped roughly like production's, for timing and trying the tool out"""
+    rng = np.random.default_rng(seed)
+    sentiment = rng.choice(4, rows, p=[0.55, 0.2, 0.2, 0.05]).astype(np.int8)
+    lead = 1 - rng.beta(1.2, 6, rows).astype(np.float32)
+    confidence = np.where(rng.random(rows) < 0.7, rng.beta(0.3, 8, rows) * 100, rng.random(rows) * 100)
+    has_image = rng.random(rows) < 0.4
+    text_scored = rng.random(rows) < 0.95
+    data = {
+        'text_decision': np.full(rows, AMBIGUOUS, dtype=np.int8),
+        'text_scored': text_scored,
+        'text_sentiment': sentiment,
+        'text_positive': np.where(sentiment == 0, lead, (1 - lead) / 3).astype(np.float32),
+        'text_negative': np.where(sentiment == 1, lead, (1 - lead) / 3).astype(np.float32),
+        'image_decision': np.where(has_image, AMBIGUOUS, ABSENT).astype(np.int8),
+        'image_scored': has_image,
+        'image_confidence': np.round(confidence, 2).astype(np.float32),
+        'final_decision': np.full(rows, AMBIGUOUS, dtype=np.int8),
+    }
+    # Admins mostly agree with confident scores; about a third of rows were decided by one
+    toxic = (sentiment == 1) * data['text_negative'] + confidence / 100 * has_image
+    data['admin_decision'] = np.where(rng.random(rows) < 0.3, np.where(rng.random(rows) < toxic, REJECT, APPROVE), -1)
+    data['admin_decision'] = data['admin_decision'].astype(np.int8)
+    return data
+
+
+def precedence_table():
+    """[mode, text result, image result] -> final decision, with ABSENT results ignored"""
+    table = np.zeros((len(PRECEDENCE), 4, 4), dtype=np.int8)
+    for text in range(4):
+        for image in range(4):
+            present = [d for d in (text, image) if d != ABSENT]
+            rejects, ambiguous = present.count(REJECT), present.count(AMBIGUOUS)
+            table[0, text, image] = REJECT if rejects else AMBIGUOUS if ambiguous else APPROVE
+            table[1, text, image] = AMBIGUOUS if ambiguous else REJECT if rejects else APPROVE
+            table[2, text, image] = REJECT if rejects == len(present) and rejects else \
+                AMBIGUOUS if rejects or ambiguous else APPROVE
+    return table
+
+
+def histogram(data, text_grid, image_grid):
+    """
+    Counts by (text kind, text interval, image kind, image position, label).
+    Text kinds 0-3 are fixed results (APPROVE, AMBIGUOUS, REJECT, ABSENT);
+    4 and 5 are scored POSITIVE and NEGATIVE, whose interval is how many
+    text thresholds lie below the score. Image kinds 0-3 are fixed, 4 is
+    scored, with position = (thresholds below) + (thresholds at or below)
+    the confidence, which tells > and >= apart at every threshold.
+    Labels: admin APPROVE, admin REJECT, no admin decision.
+    """
+    rows = len(data['text_decision'])
+    text_kind = data['text_decision'].astype(np.int64)
+    sentiment = data['text_sentiment']
+    scored = data['text_scored'] & (sentiment <= 1)
+    text_kind[scored] = 4 + sentiment[scored]
+    # NEUTRAL and MIXED are AMBIGUOUS at any threshold
+    text_kind[data['text_scored'] & (sentiment > 1)] = AMBIGUOUS
+    lead = np.where(sentiment == 0, data['text_positive'], data['text_negative'])
+    text_bin = np.where(scored, np.searchsorted(text_grid, lead, side='left'), 0)
+
+    image_kind = np.where(data['image_scored'], 4, data['image_decision']).astype(np.int64)
+    confidence = data['image_confidence']
+    position = np.where(data['image_scored'], np.searchsorted(image_grid, confidence, side='left') +
+                        np.searchsorted(image_grid, confidence, side='right'), 0)
+
+    label = np.full(rows, 2, dtype=np.int64)
+    label[data['admin_decision'] == APPROVE] = 0
+    label[data['admin_decision'] == REJECT] = 1
+
+    shape = (6, len(text_grid) + 1, 5, 2 * len(image_grid) + 1, 3)
+    cells = np.ravel_multi_index((text_kind, text_bin, image_kind, position, label), shape)
+    return np.bincount(cells, minlength=int(np.prod(shape))).reshape(shape)
+
+
+def simulate(counts, text_grid, image_pairs):
+    """
+    Outcome counts [text threshold, image pair, precedence mode, final
+    decision, label] for every combination, from the histogram alone
+    """
+    texts = len(text_grid)
+    # Text results per text threshold: [t, text result, image kind, position, label]
+    by_text = np.zeros((texts, 4) + counts.shape[2:], dtype=np.int64)
+    by_text += counts[:4].sum(axis=1)[None]
+    # Scores above threshold j are in intervals j+1 and up
+    above = np.flip(np.cumsum(np.flip(counts[4:], axis=1), axis=1), axis=1)
+    for kind, decision in ((0, APPROVE), (1, REJECT)):
+        confident = above[kind, 1:texts + 1]
+        by_text[:, decision] += confident
+        by_text[:, AMBIGUOUS] += above[kind, :1] - confident
+
+    # Image results per pair: [t, text result, pair, image result, label]
+    review, reject = image_pairs[:, 0], image_pairs[:, 1]
+    scored = np.cumsum(by_text[:, :, 4], axis=2)
+    # Positions up to 2i approve, 2i+1 .. 2j+1 are AMBIGUOUS, the rest reject
+    approved = scored[:, :, 2 * review]
+    not_rejected = scored[:, :, 2 * reject + 1]
+    by_pair = np.zeros((texts, 4, len(image_pairs), 4, 3), dtype=np.int64)
+    by_pair += by_text[:, :, :4].sum(axis=3)[:, :, None]
+    by_pair[:, :, :, APPROVE] += approved
+    by_pair[:, :, :, AMBIGUOUS] += not_rejected - approved
+    by_pair[:, :, :, REJECT] += scored[:, :, -1:] - not_rejected
+
+    # Combine the two results per precedence mode
+    final = precedence_table()
+    outcome = np.zeros((texts, len(image_pairs), len(PRECEDENCE), 3, 3), dtype=np.int64)
+    for mode in range(len(PRECEDENCE)):
+        for text in range(4):
+            for image in range(4):
+                outcome[:, :, mode, final[mode, text, image]] += by_pair[:, text, :, image]
+    return outcome
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='scan the decision tables into an .npz file')
+    export_parser.add_argument('path')
+    export_parser.add_argument('--segments', type=int, default=4, help='parallel scan segments per table')
+    for name, default in DEFAULT_TABLES.items():
+        export_parser.add_argument(f"--{name}-table", default=default)
+    simulate_parser = commands.add_parser('simulate', help='evaluate the threshold grid')
+    simulate_parser.add_argument('path', nargs='?')
+    simulate_parser.add_argument('--synthetic', type=int, metavar='ROWS', help='made-up scores instead of an export')
+    simulate_parser.add_argument('--text', type=float, nargs=3, default=[0.5, 0.99, 0.01], metavar=('FROM', 'TO', 'STEP'))
+    simulate_parser.add_argument('--image', type=float, nargs=3, default=[1, 99, 1], metavar=('FROM', 'TO', 'STEP'))
+    simulate_parser.add_argument('--max-wrong-approvals', type=float, default=0.02,
+                                 help='share of admin-decided rows approved that admins rejected')
+    simulate_parser.add_argument('--max-wrong-rejections', type=float, default=0.05,
+                                 help='share of admin-decided rows rejected that admins approved')
+    simulate_parser.add_argument('--top', type=int, default=15)
+    simulate_parser.add_argument('--csv', help='write every combination here')
+    simulate_parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        export(args.path, {table: getattr(args, f"{table}_table") for table in DEFAULT_TABLES}, args.segments)
+        return 0
+    if not args.path and not args.synthetic:
+        parser.error('simulate needs an export or --synthetic ROWS')
+
+    started = time.perf_counter()
+    if args.synthetic:
+        data = synthetic(args.synthetic, args.seed)
+    else:
+        with np.load(args.path) as stored:
+            data = {name: stored[name] for name in COLUMNS}
+    loaded = time.perf_counter() - started
+
+    # Rounded so that today's thresholds are on the grid exactly
+    text_grid = np.unique(np.round(np.append(np.arange(args.text[0], args.text[1] + 1e-9, args.text[2]),
+                                             CURRENT['text']), 6)).astype(np.float32)
+    image_grid = np.unique(np.round(np.append(np.arange(args.image[0], args.image[1] + 1e-9, args.image[2]),
+                                              [CURRENT['review'], CURRENT['reject']]), 6)).astype(np.float32)
+    review, reject = np.triu_indices(len(image_grid))
+    image_pairs = np.stack([review, reject], axis=1)
+
+    started = time.perf_counter()
+    counts = histogram(data, text_grid, image_grid)
+    binned = time.perf_counter() - started
+    started = time.perf_counter()
+    outcome = simulate(counts, text_grid, image_pairs)
+    evaluated = time.perf_counter() - started
+
+    rows = int(counts.sum())
+    labelled = outcome[0, 0, 0, :, :2].sum()
+    combinations = outcome.shape[0] * outcome.shape[1] * outcome.shape[2]
+    print(f"{rows} rows, {labelled} with an admin decision; {combinations} combinations")
+    print(f"load {loaded:.2f}s, histogram {binned:.2f}s, all combinations {evaluated:.2f}s\n")
+
+    volumes = outcome.sum(axis=4) / max(rows, 1)
+    agree = (outcome[..., APPROVE, 0] + outcome[..., REJECT, 1]) / max(labelled, 1)
+    wrong_approvals = outcome[..., APPROVE, 1] / max(labelled, 1)
+    wrong_rejections = outcome[..., REJECT, 0] / max(labelled, 1)
+
+    t_index, p_index, m_index = np.indices(outcome.shape[:3])
+
+    def describe(t, p, m):
+        return (f"{text_grid[t]:>6.2f}{image_grid[image_pairs[p, 0]]:>8g}{image_grid[image_pairs[p, 1]]:>8g}"
+                f"{PRECEDENCE[m]:>11}{volumes[t, p, m, APPROVE]:>9.1%}{volumes[t, p, m, AMBIGUOUS]:>8.1%}"
+                f"{volumes[t, p, m, REJECT]:>8.1%}{agree[t, p, m]:>8.1%}{wrong_approvals[t, p, m]:>8.1%}"
+                f"{wrong_rejections[t, p, m]:>8.1%}")
+
+    header = (f"{'text>':>6}{'review>=':>8}{'reject>':>8}{'precedence':>11}{'approve':>9}{'review':>8}"
+              f"{'reject':>8}{'agree':>8}{'bad ok':>8}{'bad no':>8}")
+    current = (int(np.searchsorted(text_grid, np.float32(CURRENT['text']))),
+               int(np.flatnonzero((image_grid[image_pairs[:, 0]] == np.float32(CURRENT['review'])) &
+                                  (image_grid[image_pairs[:, 1]] == np.float32(CURRENT['reject'])))[0]),
+               PRECEDENCE.index(CURRENT['precedence']))
+    print("current thresholds")
+    print(header)
+    print(describe(*current))
+    if not args.synthetic:
+        recorded = np.bincount(data['final_decision'].astype(np.int64), minlength=3)[:3] / max(rows, 1)
+        print(f"{'recorded':>33}{recorded[APPROVE]:>9.1%}{recorded[AMBIGUOUS]:>8.1%}{recorded[REJECT]:>8.1%}")
+
+    # Fewest reviews within the error budget; admins' work is what's being saved
+    allowed = (wrong_approvals <= args.max_wrong_approvals) & (wrong_rejections <= args.max_wrong_rejections)
+    order = np.lexsort((-agree[allowed], volumes[..., AMBIGUOUS][allowed]))
+    print(f"\nfewest reviews with at most {args.max_wrong_approvals:.1%} wrong approvals "
+          f"and {args.max_wrong_rejections:.1%} wrong rejections ({int(allowed.sum())} qualify)")
+    print(header)
+    for i in order[:args.top]:
+        print(describe(t_index[allowed][i], p_index[allowed][i], m_index[allowed][i]))
+
+    if args.csv:
+        with open(args.csv, 'w', encoding='utf-8') as f:
+            f.write('text,review,reject,precedence,approve,review_share,reject_share,agree,wrong_approvals,wrong_rejections\n')
+            for t, p, m in zip(t_index.ravel(), p_index.ravel(), m_index.ravel()):
+                f.write(f"{text_grid[t]:.4g},{image_grid[image_pairs[p, 0]]:g},{image_grid[image_pairs[p, 1]]:g},"
+                        f"{PRECEDENCE[m]},{volumes[t, p, m, APPROVE]:.6f},{volumes[t, p, m, AMBIGUOUS]:.6f},"
+                        f"{volumes[t, p, m, REJECT]:.6f},{agree[t, p, m]:.6f},{wrong_approvals[t, p, m]:.6f},"
+                        f"{wrong_rejections[t, p, m]:.6f}\n")
+        print(f"\nwrote {combinations} combinations to {args.csv}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Compare what the admin dashboard downloads per render of the pending list
+with full-size originals (before) and with review thumbnails (after), and
+how long the thumbnailer takes per image.
+
+Uses the images in --images, or generates photo-like JPEGs and PNG
+screenshots of typical upload sizes. Needs Pillow.
+
+    python tools/thumbnail_benchmark.py
+    python tools/thumbnail_benchmark.py --images ~/Pictures --pending 50
+"""
+import argparse
+import io
+import os
+import random
+import sys
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'lambda', 'thumbnailer'))
+import thumbnails  # noqa: E402
+
+# (width, height, format) of generated uploads: phone photos, downscaled photos, screenshots
+SYNTHETIC = ((4032, 3024, 'JPEG'), (1920, 1080, 'JPEG'), (1280, 960, 'JPEG'), (1440, 900, 'PNG'))
+
+
+def synthetic_image(width, height, fmt, rng):
+    """Smooth colour fields, fine detail and sensor-like noise, which compress about like a photo"""
+    image = Image.new('RGB', (width // 8, height // 8))
+    draw = ImageDraw.Draw(image)
+    for _ in range(40):
+        x, y = rng.randrange(width // 8), rng.randrange(height // 8)
+        r = rng.randrange(5, max(6, width // 16))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rng.randrange(256) for _ in range(3)))
+    image = image.filter(ImageFilter.GaussianBlur(6)).resize((width, height), Image.Resampling.BICUBIC)
+    draw = ImageDraw.Draw(image)
+    for _ in range(3000):
+        x, y = rng.randrange(width), rng.randrange(height)
+        size = rng.randrange(2, max(3, width // 60))
+        draw.line((x, y, x + rng.randrange(-size, size), y + rng.randrange(-size, size)),
+                  fill=tuple(rng.randrange(256) for _ in range(3)), width=rng.randrange(1, 4))
+    if fmt == 'JPEG':
+        noise = Image.effect_noise((width, height), 24).convert('RGB')
+        image = Image.blend(image, noise, 0.15)
+    out = io.BytesIO()
+    image.save(out, fmt, quality=90) if fmt == 'JPEG' else image.save(out, fmt)
+    return out.getvalue()
+
+
+def load_images(directory):
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if os.path.splitext(name)[1].lower() in ('.jpg', '.jpeg', '.png', '.webp', '.gif'):
+            with open(os.path.join(directory, name), 'rb') as f:
+                images.append((name, f.read()))
+    return images
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', help='directory of sample uploads (default: generated)')
+    parser.add_argument('--pending', type=int, default=20, help='cards in the pending list')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    if args.images:
+        samples = load_images(args.images)
+        if not samples:
+            parser.error(f"no images in {args.images}")
+    else:
+        samples = [(f"{w}x{h}.{fmt.lower()}", synthetic_image(w, h, fmt, rng)) for w, h, fmt in SYNTHETIC]
+
+    print(f"{'image':<28} {'original':>12} {'thumbnail':>10} {'ratio':>7} {'ms':>7}")
+    results = []
+    for name, data in samples:
+        started = time.perf_counter()
+        thumb, content_type, _ = thumbnails.make_thumbnail(data)
+        elapsed = (time.perf_counter() - started) * 1000
+        results.append((len(data), len(thumb), elapsed))
+        print(f"{name[:28]:<28} {len(data):>12,} {len(thumb):>10,} {len(data) / len(thumb):>6.0f}x {elapsed:>7.1f}")
+
+    # A pending list of --pending cards, cycling through the samples
+    cards = [results[i % len(results)] for i in range(args.pending)]
+    before = sum(original for original, _, _ in cards)
+    after = sum(thumb for _, thumb, _ in cards)
+    mean_ms = sum(ms for _, _, ms in results) / len(results)
+    print()
+    print(f"thumbnails are {content_type}, {thumbnails.MAX_EDGE}px on the longest edge, {mean_ms:.0f} ms each on average")
+    print(f"dashboard render with {args.pending} cards: {before / 1e6:.2f} MB before, "
+          f"{after / 1e6:.3f} MB after ({before / after:.0f}x less)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())